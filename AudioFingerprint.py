@@ -0,0 +1,273 @@
+# AudioFingerprint.py
+# -*- coding: utf-8 -*-
+"""
+Akustické otisky skladeb pro hledání duplicit mezi různými zdroji.
+
+Stejná písnička často dorazí jednou přes Spotify (dohledaná na jednom YouTube videu)
+a podruhé jako přímý odkaz na jiné video. Podle URL je nerozlišíme, podle zvuku ano.
+
+Postup (ve stylu Haitsma–Kalker):
+- ffmpeg (z balíčku imageio-ffmpeg, jinak z PATH) dekóduje začátek souboru do mono 5512 Hz,
+- spektrogram se spočítá vektorově přes numpy (okna 2048 vzorků, krok 256),
+- 33 logaritmických pásem 300–2000 Hz; každý snímek dá 32bitový sub-otisk
+  ze znaménka rozdílů energií mezi sousedními pásmy a sousedními snímky.
+
+Index drží seřazené pole sub-otisků všech souborů (hledání přes np.searchsorted,
+tedy sublineárně vůči velikosti knihovny). Kandidáti se vyberou hlasováním
+o časovém posunu a potvrdí podílem chybných bitů (BER) na zarovnaných otiscích.
+Otisky se ukládají do SQLite (fingerprints.db).
+"""
+
+import sqlite3
+import subprocess
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 5512
+FRAME_SIZE = 2048
+HOP_SIZE = 256
+MAX_SECONDS = 120  # otiskujeme jen začátek skladby
+BAND_COUNT = 33
+BAND_MIN_HZ = 300.0
+BAND_MAX_HZ = 2000.0
+
+INDEX_STRIDE = 2  # do vyhledávacího indexu jde každý N-tý snímek (dotaz používá všechny)
+MIN_VOTES = 12  # minimum shodných sub-otisků se stejným posunem
+MAX_BIT_ERROR_RATE = 0.35  # práh podobnosti zarovnaných otisků
+REBUILD_AFTER_FILES = 50  # po kolika nově přidaných souborech přestavět hlavní index
+
+_BIT_WEIGHTS = (1 << np.arange(32, dtype=np.uint64)).astype(np.uint64)
+
+
+def _ffmpeg_exe() -> str:
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+def decode_mono(path: str, seconds: int = MAX_SECONDS) -> Optional[np.ndarray]:
+    """Dekóduje začátek souboru do mono float32 při SAMPLE_RATE; None při chybě."""
+    cmd = [_ffmpeg_exe(), "-v", "error", "-nostdin", "-i", path, "-t", str(seconds),
+           "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "-"]
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=60)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if proc.returncode != 0 or not proc.stdout:
+        return None
+    return np.frombuffer(proc.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def _band_edges() -> np.ndarray:
+    freqs = np.geomspace(BAND_MIN_HZ, BAND_MAX_HZ, BAND_COUNT + 1)
+    return np.round(freqs * FRAME_SIZE / SAMPLE_RATE).astype(np.int64)
+
+
+_BAND_EDGES = _band_edges()
+
+
+def fingerprint(samples: np.ndarray) -> np.ndarray:
+    """Z mono vzorků spočítá pole 32bitových sub-otisků (jeden na snímek)."""
+    if samples is None or len(samples) < FRAME_SIZE + HOP_SIZE:
+        return np.zeros(0, dtype=np.uint32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FRAME_SIZE).astype(np.float32), axis=1)) ** 2
+
+    # Součty energie v pásmech přes kumulativní součet (bez smyčky přes pásma)
+    cumulative = np.cumsum(spectrum, axis=1)
+    edges = _BAND_EDGES
+    energy = cumulative[:, edges[1:] - 1] - cumulative[:, edges[:-1] - 1]
+
+    band_diff = energy[:, :-1] - energy[:, 1:]  # (snímky, 32)
+    bits = (band_diff[1:] - band_diff[:-1]) > 0
+    return (bits.astype(np.uint64) @ _BIT_WEIGHTS).astype(np.uint32)
+
+
+def fingerprint_file(path: str) -> Optional[np.ndarray]:
+    samples = decode_mono(path)
+    if samples is None:
+        return None
+    hashes = fingerprint(samples)
+    return hashes if len(hashes) else None
+
+
+def bit_error_rate(a: np.ndarray, b: np.ndarray, offset: int) -> float:
+    """BER mezi a a b, kde b[i] odpovídá a[i + offset]."""
+    start_a, start_b = max(0, offset), max(0, -offset)
+    n = min(len(a) - start_a, len(b) - start_b)
+    if n <= 0:
+        return 1.0
+    diff = np.bitwise_xor(a[start_a:start_a + n], b[start_b:start_b + n])
+    return float(np.bitwise_count(diff).sum()) / (32.0 * n)
+
+
+class FingerprintIndex:
+    """
+    Otisky všech souborů v SQLite + paměťový index pro rychlé hledání.
+    Hlavní index jsou tři seřazená pole (hash, id souboru, snímek); nově přidané
+    soubory se do přestavby drží zvlášť a prohledávají se přímo.
+    """
+
+    def __init__(self, db_path: str):
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS fingerprint (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                hashes BLOB NOT NULL
+            )
+            """
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._paths = []  # id souboru -> cesta (None = smazáno)
+        self._alive = np.zeros(0, dtype=bool)  # id souboru -> není smazaný (rezerva roste zdvojením)
+        self._ids = {}  # cesta -> id souboru
+        self._stamps = {}  # cesta -> (mtime, size)
+        self._hashes = {}  # id souboru -> plné pole otisků (pro ověření BER)
+        self._main = (np.zeros(0, np.uint32), np.zeros(0, np.int32), np.zeros(0, np.int32))
+        self._recent = []  # id souborů přidaných po poslední přestavbě
+
+    def load(self) -> int:
+        with self._lock:
+            rows = self._db.execute("SELECT path, mtime, size, hashes FROM fingerprint").fetchall()
+            for path, mtime, size, blob in rows:
+                self._register(path, mtime, size, np.frombuffer(blob, dtype=np.uint32))
+            self._rebuild()
+        return len(rows)
+
+    def _register(self, path, mtime, size, hashes):
+        file_id = len(self._paths)
+        self._paths.append(path)
+        if file_id >= len(self._alive):
+            grown = np.zeros(max(64, 2 * len(self._alive)), dtype=bool)
+            grown[:len(self._alive)] = self._alive
+            self._alive = grown
+        self._alive[file_id] = True
+        self._ids[path] = file_id
+        self._stamps[path] = (mtime, size)
+        self._hashes[file_id] = hashes
+        self._recent.append(file_id)
+
+    def _rebuild(self):
+        parts_h, parts_f, parts_o = [], [], []
+        for file_id, hashes in self._hashes.items():
+            offsets = np.arange(0, len(hashes), INDEX_STRIDE, dtype=np.int32)
+            parts_h.append(hashes[offsets])
+            parts_f.append(np.full(len(offsets), file_id, dtype=np.int32))
+            parts_o.append(offsets)
+        if parts_h:
+            h = np.concatenate(parts_h)
+            order = np.argsort(h, kind="stable")
+            self._main = (h[order], np.concatenate(parts_f)[order], np.concatenate(parts_o)[order])
+        else:
+            self._main = (np.zeros(0, np.uint32), np.zeros(0, np.int32), np.zeros(0, np.int32))
+        self._recent = []
+
+    def paths(self) -> list:
+        with self._lock:
+            return list(self._ids)
+
+    def is_current(self, path: str, mtime: float, size: int) -> bool:
+        with self._lock:
+            return self._stamps.get(path) == (mtime, size)
+
+    def add(self, path: str, hashes: np.ndarray, mtime: float, size: int):
+        hashes = np.ascontiguousarray(hashes, dtype=np.uint32)
+        with self._lock:
+            self._remove_locked(path)
+            self._db.execute(
+                "REPLACE INTO fingerprint (path, mtime, size, hashes) VALUES (?, ?, ?, ?)",
+                (path, mtime, size, hashes.tobytes()),
+            )
+            self._db.commit()
+            self._register(path, mtime, size, hashes)
+            if len(self._recent) >= REBUILD_AFTER_FILES:
+                self._rebuild()
+
+    def remove(self, path: str):
+        with self._lock:
+            if self._remove_locked(path):
+                self._db.execute("DELETE FROM fingerprint WHERE path = ?", (path,))
+                self._db.commit()
+
+    def _remove_locked(self, path) -> bool:
+        file_id = self._ids.pop(path, None)
+        if file_id is None:
+            return False
+        self._paths[file_id] = None
+        self._alive[file_id] = False
+        self._stamps.pop(path, None)
+        self._hashes.pop(file_id, None)
+        return True
+
+    def match(self, hashes: np.ndarray, exclude: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """
+        Najde nejpodobnější jiný soubor. Vrací (cesta, BER) nebo None.
+        """
+        if hashes is None or len(hashes) == 0:
+            return None
+        # Ticho a šum dávají samé nuly/jedničky -> shodují se se vším, nehlasují
+        query_pos = np.flatnonzero((hashes != 0) & (hashes != 0xFFFFFFFF)).astype(np.int32)
+        query = hashes[query_pos]
+        with self._lock:
+            main_h, main_f, main_o = self._main
+
+            # Hlavní index: pro každý sub-otisk dotazu rozsah shod v seřazeném poli
+            left = np.searchsorted(main_h, query, side="left")
+            right = np.searchsorted(main_h, query, side="right")
+            counts = right - left
+            if counts.sum():
+                starts = np.repeat(left, counts)
+                within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                hit = starts + within
+                files = main_f[hit]
+                deltas = main_o[hit] - np.repeat(query_pos, counts)
+            else:
+                files = np.zeros(0, np.int32)
+                deltas = np.zeros(0, np.int32)
+
+            # Nedávno přidané soubory (ještě nejsou v hlavním indexu)
+            extra_f, extra_d = [], []
+            for file_id in self._recent:
+                ref = self._hashes.get(file_id)
+                if ref is None:
+                    continue
+                ref_sorted = np.argsort(ref, kind="stable")
+                l = np.searchsorted(ref[ref_sorted], query, side="left")
+                r = np.searchsorted(ref[ref_sorted], query, side="right")
+                c = r - l
+                if c.sum():
+                    idx = np.repeat(l, c) + np.arange(c.sum()) - np.repeat(np.cumsum(c) - c, c)
+                    extra_f.append(np.full(c.sum(), file_id, dtype=np.int32))
+                    extra_d.append(ref_sorted[idx].astype(np.int32) - np.repeat(query_pos, c))
+            if extra_f:
+                files = np.concatenate([files] + extra_f)
+                deltas = np.concatenate([deltas] + extra_d)
+            if len(files) == 0:
+                return None
+
+            # Hlasování: nejčastější dvojice (soubor, posun)
+            exclude_id = self._ids.get(exclude) if exclude else None
+            keep = self._alive[files]
+            if exclude_id is not None:
+                keep &= files != exclude_id
+            files, deltas = files[keep], deltas[keep]
+            if len(files) == 0:
+                return None
+            pairs, votes = np.unique(np.stack([files, deltas], axis=1), axis=0, return_counts=True)
+            best = None
+            for i in np.argsort(votes)[::-1][:5]:
+                if votes[i] < MIN_VOTES:
+                    break
+                file_id, delta = int(pairs[i][0]), int(pairs[i][1])
+                ber = bit_error_rate(self._hashes[file_id], hashes, delta)
+                if ber <= MAX_BIT_ERROR_RATE and (best is None or ber < best[1]):
+                    best = (self._paths[file_id], ber)
+            return best
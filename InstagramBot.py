@@ -6,10 +6,13 @@ Instagram DM integrace pro UniversalMusicPlayer.
 Funkce:
 - Každé 2 vteřiny kontroluje poslední 3 zprávy ve zvoleném GROUP threadu.
 - Při prvním spuštění si poslední 3 zprávy jen "načte" a nepracuje s nimi.
-- Přidává odkazy (YouTube / SoundCloud / Spotify) do fronty přehrávače.
+- Přidává odkazy (YouTube / SoundCloud / Spotify) do fronty přehrávače; víc odkazů
+  v jedné zprávě (až MAX_LINKS_PER_MESSAGE) stáhne souběžně a pošle jeden souhrn.
+- "search interpret - skladba" vyhledá skladbu (knihovna, pak YouTube Music) a přidá ji.
 - Spotify speciál: pokud IG zprávu označí jako 'music', vrátí uživateli instrukci poslat textový odkaz.
 - Cooldown (výchozí 20 min) pro ne-admin uživatele přes SQLite (soubor cooldown.db).
-- Příkazy: play, pause (pro všechny), next, previous, set cooldown X (jen admin).
+- Příkazy: play, pause, queue, when, undo, remove N, services (pro všechny),
+  next, previous, move A B, playnext odkaz, set cooldown X, profile N (jen admin).
 - Odpovídá do chatu potvrzením / chybovou hláškou.
 - Udržuje session v session.json, aby se zbytečně znovu nepřihlašovalo.
 
@@ -19,6 +22,7 @@ a snaží se použít existující funkce. Má i "inteligentní" fallbacky, poku
 
 import os
 import re
+import sys
 import time
 import sqlite3
 import threading
@@ -32,8 +36,15 @@ from instagrapi.exceptions import LoginRequired
 from dotenv import load_dotenv
 
 # --- Import hlavního přehrávače ---
+# Spuštěno přímo (python InstagramBot.py): přehrávač importuje "InstagramBot" zpátky,
+# bez aliasu by vznikla druhá kopie tohoto modulu (vlastní cooldown.db spojení a klient IG)
+if __name__ == "__main__":
+    sys.modules.setdefault("InstagramBot", sys.modules[__name__])
 # Uprav případně název, pokud se hlavní modul jmenuje jinak.
 import UniversalMusicPlayer as ump
+import Profiler
+import ServiceGuard
+import Scheduler
 
 
 # -----------------------------
@@ -57,6 +68,18 @@ POLL_INTERVAL_SEC = 2
 
 # Kolik posledních zpráv načítat při každé iteraci
 LAST_N_MSG = 3
+_last_seen_ids = None  # ID zpráv z posledního načteného okna (už zkontrolované); None = ještě nenačteno
+
+# Kolik odkazů z jedné zprávy přidat (stahují se souběžně); 1 = jen první, který projde.
+# Výchozí hodnota se vejde do limitů přehrávače (MAX_TRACKS_PER_USER, MAX_PENDING_DOWNLOADS).
+MAX_LINKS_PER_MESSAGE = int(os.getenv("IG_MAX_LINKS_PER_MESSAGE", "3"))
+
+# Opětovné přihlášení heslem: nanejvýš jedno najednou, po neúspěchu s rostoucí pauzou
+RELOGIN_BACKOFF_BASE_SEC = 30
+RELOGIN_BACKOFF_MAX_SEC = 15 * 60
+# Ověření uložené session při startu: přechodné chyby (síť, 429) se zkusí znovu, heslem až po LoginRequired
+SESSION_CHECK_RETRIES = 3
+SESSION_CHECK_BACKOFF_SEC = 2
 
 # Regexy pro detekci URL a příkazů
 URL_REGEX = re.compile(
@@ -65,6 +88,11 @@ URL_REGEX = re.compile(
 )
 SET_COOLDOWN_REGEX = re.compile(r"^\s*set\s+cooldown\s+(\d+)\s*$", re.IGNORECASE)
 VOLUME_REGEX = re.compile(r"^\s*volume\s+(\d{1,3})\s*$", re.IGNORECASE)
+PROFILE_REGEX = re.compile(r"^\s*profile\s+(\d+)\s*$", re.IGNORECASE)
+REMOVE_REGEX = re.compile(r"^\s*remove\s+(\d+)\s*$", re.IGNORECASE)
+MOVE_REGEX = re.compile(r"^\s*move\s+(\d+)\s+(\d+)\s*$", re.IGNORECASE)
+PLAYNEXT_REGEX = re.compile(r"^\s*playnext\s+(?P<url>\S+)\s*$", re.IGNORECASE)
+SEARCH_REGEX = re.compile(r"^\s*(?:search|hledej)\s+(?P<query>.+?)\s*$", re.IGNORECASE | re.DOTALL)
 
 
 # -----------------------------
@@ -130,50 +158,138 @@ def set_cooldown_time(user_id: str):
 _cl = Client()
 _cl_lock = threading.Lock()  # ochrana volání klienta z 1 vlákna (pro jistotu)
 
+# Přihlašování: jedno najednou; generace se zvýší po každém úspěšném přihlášení,
+# takže vlákno, které čekalo na cizí re-login, pozná, že už je hotovo
+_login_lock = threading.Lock()
+_session_generation = 0
+_relogin_failures = 0
+_relogin_not_before = 0.0
+
+
+def _password_login():
+    """Plné přihlášení heslem (zachová identitu zařízení z načtené session) a uložení session."""
+    global _session_generation
+    with _cl_lock:
+        _cl.relogin_attempt = 0  # instagrapi jinak po dvou re-loginech za běh procesu odmítá
+        _cl.login(IG_USERNAME, IG_PASSWORD, relogin=bool(_cl.user_id))
+    _session_generation += 1
 
-def _login_with_session():
+    # Dumpni session pro budoucí použití (po úspěšném loginu)
+    try:
+        _cl.dump_settings(SESSION_FILE)
+    except Exception:
+        # nevadí, běžíme dál
+        pass
+
+
+def _login_with_session() -> str:
     """
-    Přihlášení s využitím session.json pokud existuje.
+    Přihlášení při startu. Rychlá cesta: načte session.json a ověří ji jedním lehkým
+    dotazem (account_info); heslem se přihlašuje jen tehdy, když session chybí, nejde
+    načíst, nebo IG odpoví LoginRequired. Přechodné chyby ověření (síť, 429) se zkusí
+    znovu s rostoucí pauzou; když nevyjdou ani tak, session se ponechá – pokud neplatí,
+    první dotaz dostane LoginRequired a _ig_call přihlásí znovu.
+    Vrací "session" nebo "login" podle toho, která cesta proběhla.
     """
+    global _session_generation
     if IG_USERNAME == "" or IG_PASSWORD == "" or THREAD_ID == "":
         raise RuntimeError(
             "IG_USERNAME, IG_PASSWORD a IG_THREAD_ID musí být nastaveny v .env"
         )
 
-    # Načti existující session (pokud je)
-    if os.path.exists(SESSION_FILE):
-        try:
+    with _login_lock:
+        # Načti existující session (pokud je)
+        if os.path.exists(SESSION_FILE) and _load_session():
+            for attempt in range(1, SESSION_CHECK_RETRIES + 1):
+                try:
+                    with _cl_lock:
+                        _cl.account_info()
+                    break
+                except LoginRequired:
+                    print("[InstagramBot] Uložená session vypršela, přihlašuji se heslem.")
+                    _password_login()
+                    return "login"
+                except Exception as e:
+                    if attempt == SESSION_CHECK_RETRIES:
+                        print(f"[InstagramBot] Session nejde ověřit ({e}), pokračuji s uloženou session.")
+                        break
+                    wait = SESSION_CHECK_BACKOFF_SEC * 2 ** (attempt - 1)
+                    print(f"[InstagramBot] Ověření session selhalo ({e}), další pokus za {wait} s.")
+                    time.sleep(wait)
+            _session_generation += 1
+            return "session"
+
+        _password_login()
+        return "login"
+
+
+def _load_session() -> bool:
+    """Načte session.json do klienta; False, když soubor nejde přečíst (pak se přihlásí heslem)."""
+    try:
+        with _cl_lock:
             _cl.load_settings(SESSION_FILE)
+        return True
+    except Exception as e:
+        print(f"[InstagramBot] Session nejde načíst ({e}), přihlašuji se heslem.")
+        return False
+
+
+def _relogin(seen_generation: int):
+    """
+    Re-login po LoginRequired, sdílený mezi vlákny: když mezitím přihlásilo jiné vlákno
+    (generace se změnila), jen se vrátí. Po neúspěchu další pokus nejdřív za
+    RELOGIN_BACKOFF_BASE_SEC * 2^(n-1) (max. RELOGIN_BACKOFF_MAX_SEC), do té doby hned
+    vyhodí výjimku – opakované logy heslem IG trestá challenge na několik minut.
+    """
+    global _relogin_failures, _relogin_not_before
+    with _login_lock:
+        if _session_generation != seen_generation:
+            return
+        wait = _relogin_not_before - time.monotonic()
+        if wait > 0:
+            raise RuntimeError(f"re-login odložen ještě o {wait:.0f} s po předchozím neúspěchu")
+        try:
+            _password_login()
+            _relogin_failures = 0
+            print("[InstagramBot] Znovu přihlášeno.")
         except Exception:
-            # pokud se nepodaří načíst, budeme pokračovat čistým loginem
-            pass
+            _relogin_failures += 1
+            _relogin_not_before = time.monotonic() + min(
+                RELOGIN_BACKOFF_MAX_SEC, RELOGIN_BACKOFF_BASE_SEC * 2 ** (_relogin_failures - 1))
+            raise
 
-    # Login (pokud jsou session cookies platné, instagrapi je použije)
-    _cl.login(IG_USERNAME, IG_PASSWORD)
 
-    # Dumpni session pro budoucí použití (po úspěšném loginu)
-    try:
-        _cl.dump_settings(SESSION_FILE)
-    except Exception:
-        # nevadí, běžíme dál
-        pass
+def _ig_call(fn):
+    """
+    Zavolá klienta přes limiter a jistič služby "instagram"; při LoginRequired jednou
+    (sdíleně) obnoví přihlášení a zkusí to znovu. Při vypnutém jističi hned vyhodí
+    ServiceGuard.ServiceUnavailable (nepovedený re-login se počítá jako chyba služby).
+    """
+    def call():
+        generation = _session_generation
+        try:
+            with _cl_lock:
+                return fn()
+        except LoginRequired:
+            _relogin(generation)
+            with _cl_lock:
+                return fn()
+
+    return ServiceGuard.call("instagram", call)
 
 
 def _ig_send_text(text: str):
     """
     Pošli textovou zprávu do skupinového threadu.
     """
-    with _cl_lock:
-        _cl.direct_send(text, thread_ids=[THREAD_ID])
+    _ig_call(lambda: _cl.direct_send(text, thread_ids=[THREAD_ID]))
 
 
 def _ig_fetch_last_messages(n: int = LAST_N_MSG):
     """
     Načti posledních N zpráv z threadu.
     """
-    with _cl_lock:
-        msgs = _cl.direct_messages(THREAD_ID, amount=n)
-    return msgs
+    return _ig_call(lambda: _cl.direct_messages(THREAD_ID, amount=n))
 
 
 # -----------------------------
@@ -214,13 +330,13 @@ def player_pause() -> bool:
     return False
 
 
-def player_next() -> bool:
+def player_next(user_id=None) -> bool:
     """
     Přeskočí na další skladbu.
     """
     try:
         if _safe_hasattr(ump, "skip_song"):
-            ump.skip_song()
+            ump.skip_song(user_id=user_id)
             return True
     except Exception:
         pass
@@ -240,23 +356,36 @@ def player_previous() -> bool:
     return False
 
 
-def add_track_from_url(url: str) -> Tuple[bool, Optional[str]]:
+def add_track_from_url(url: str, user_id: Optional[str] = None) -> Tuple[bool, Optional[str]]:
     """
     Přidá skladbu do fronty podle URL.
     Vrací (success, human_name_or_none).
     Snaží se adaptovat na různé názvy funkcí v UniversalMusicPlayer.
+    Odmítnutí přehrávačem (ump.QueueRejected, např. duplicita nebo plná fronta) propaguje volajícímu,
+    jiná chyba adapteru vrátí (False, None).
+    user_id předáváme kvůli limitům na uživatele (admin je nemá).
     """
+    rejected = getattr(ump, "QueueRejected", None)
+
     # 1) Přímý adapter, pokud ho projekt má
     for fname in ("add_link_to_queue", "add_to_queue_from_url", "enqueue_url"):
         func = getattr(ump, fname, None)
         if callable(func):
             try:
-                human = func(url)
+                if fname == "add_link_to_queue":
+                    human = func(url, user_id=user_id, privileged=_is_admin(user_id))
+                else:
+                    human = func(url)
                 return True, str(human) if human else None
-            except Exception:
-                pass  # zkusíme další variantu
-
-    # 2) "Manuální" cesta používaná v UMP: extract_info -> download_audio -> add_to_queue
+            except Exception as e:
+                if rejected and isinstance(e, rejected):
+                    raise
+                # Adapter odkaz zpracoval a selhal (např. stažení): manuální cesta níž by stahovala
+                # znovu a obešla limity fronty, duplicity i zápis do historie – nezkoušej ji
+                print(f"[InstagramBot] {fname} selhal pro {url}: {e}")
+                return False, None
+
+    # 2) "Manuální" cesta (jen pro přehrávač bez adapteru) používaná v UMP: extract_info -> download_audio -> add_to_queue
     extract_info = getattr(ump, "extract_info", None)
     download_audio = getattr(ump, "download_audio", None)
     add_to_queue = getattr(ump, "add_to_queue", None)
@@ -316,6 +445,22 @@ def _extract_supported_urls(text: str) -> list:
     return urls
 
 
+def _queue_edit(fname: str, *args, **kwargs):
+    """Zavolá úpravu fronty v přehrávači; chybu rovnou oznámí do chatu a vrátí None."""
+    func = getattr(ump, fname, None)
+    if not callable(func):
+        _ig_send_text("❌ Tato verze přehrávače neumí upravovat frontu.")
+        return None
+    try:
+        return func(*args, **kwargs)
+    except ump.QueueRejected as e:
+        _ig_send_text(f"❌ {e}")
+    except Exception as e:
+        print(f"[InstagramBot] Chyba při úpravě fronty: {e}")
+        _ig_send_text("❌ Úprava fronty se nepovedla.")
+    return None
+
+
 def _process_command(msg_text: str, from_user_id: str) -> bool:
     """
     Vrátí True, pokud šlo o příkaz a byl zpracován (a tedy nemáme dál zpracovávat jako odkaz).
@@ -362,7 +507,7 @@ def _process_command(msg_text: str, from_user_id: str) -> bool:
         if not _is_admin(from_user_id):
             _ig_send_text("❌ Tento příkaz může použít jen admin.")
             return True
-        if player_next():
+        if player_next(from_user_id):
             _ig_send_text("⏭️ Přeskočeno na další skladbu.")
         else:
             _ig_send_text("❌ Nelze přeskočit na další skladbu.")
@@ -397,12 +542,100 @@ def _process_command(msg_text: str, from_user_id: str) -> bool:
             _ig_send_text("❌ Neplatná hodnota hlasitosti. Použij: volume 0–100")
         return True
 
+    # profile N (jen admin) – vzorkovací profiler všech vláken na N sekund
+    m = PROFILE_REGEX.match(msg_text)
+    if m:
+        if not _is_admin(from_user_id):
+            _ig_send_text("❌ Tento příkaz může použít jen admin.")
+            return True
+        seconds = min(int(m.group(1)), Profiler.MAX_PROFILE_SEC)
+
+        def send_result(text: str):
+            if len(text) > 900:
+                text = text[:900] + "\n…"
+            try:
+                _ig_send_text(text)
+            except Exception as e:
+                print(f"[InstagramBot] Nelze odeslat výsledek profilování: {e}")
+
+        if Profiler.profile_async(seconds, send_result):
+            _ig_send_text(f"🔬 Profiluji {seconds} s, výsledek pošlu sem.")
+        else:
+            _ig_send_text("❌ Profilování už běží.")
+        return True
+
+    # remove N (admin cokoli, ostatní jen svoje skladby)
+    m = REMOVE_REGEX.match(msg_text)
+    if m:
+        name = _queue_edit("remove_from_queue", int(m.group(1)), user_id=from_user_id,
+                           privileged=_is_admin(from_user_id))
+        if name:
+            _ig_send_text(f"🗑️ Odebráno z fronty: {name}")
+        return True
+
+    # move A B (jen admin)
+    m = MOVE_REGEX.match(msg_text)
+    if m:
+        if not _is_admin(from_user_id):
+            _ig_send_text("❌ Tento příkaz může použít jen admin.")
+            return True
+        name = _queue_edit("move_in_queue", int(m.group(1)), int(m.group(2)))
+        if name:
+            _ig_send_text(f"↕️ Přesunuto na pozici {m.group(2)}: {name}")
+        return True
+
+    # playnext <odkaz> (jen admin)
+    m = PLAYNEXT_REGEX.match(msg_text)
+    if m:
+        if not _is_admin(from_user_id):
+            _ig_send_text("❌ Tento příkaz může použít jen admin.")
+            return True
+        urls = _extract_supported_urls(m.group("url"))
+        if not urls:
+            _ig_send_text("❌ Použij: playnext <odkaz na YouTube / Spotify / SoundCloud>")
+            return True
+        name = _queue_edit("play_next", urls[0], user_id=from_user_id, privileged=True)
+        if name:
+            _ig_send_text(f"⏭️ Hraje jako další: {name}")
+        return True
+
+    # undo (pro všechny) – odebere poslední vlastní skladbu, která ještě nehraje
+    if t == "undo":
+        name = _queue_edit("undo_last_request", user_id=from_user_id)
+        if name:
+            _ig_send_text(f"↩️ Odebráno z fronty: {name}")
+        return True
+
+    # when (pro všechny) – kdy začne hrát moje nejbližší skladba
+    if t == "when":
+        when_fn = getattr(ump, "when_is_my_song", None)
+        if callable(when_fn):
+            try:
+                _ig_send_text(when_fn(user_id=from_user_id))
+            except Exception:
+                _ig_send_text("❌ Nepodařilo se spočítat, kdy skladba začne.")
+        else:
+            _ig_send_text("❌ Tato verze přehrávače neumí odhadnout začátek skladby.")
+        return True
+
+    # services (pro všechny) – stav limiterů a jističů služeb
+    if t == "services":
+        lines = [ServiceGuard.status_text(("instagram",))]
+        status_fn = getattr(ump, "get_service_status", None)
+        if callable(status_fn):
+            try:
+                lines.append(status_fn())
+            except Exception:
+                lines.append("❌ Stav služeb přehrávače se nepodařilo načíst.")
+        _ig_send_text("\n".join(line for line in lines if line))
+        return True
+
     # queue (pro všechny)
     if t == "queue":
         overview_fn = getattr(ump, "get_queue_overview", None)
         if callable(overview_fn):
             try:
-                text = overview_fn(limit=10)
+                text = overview_fn(limit=10, user_id=from_user_id)
                 # Instagram DM někdy škrtil dlouhé zprávy – držme to rozumně krátké
                 if len(text) > 900:
                     text = text[:900] + "\n…"
@@ -417,6 +650,72 @@ def _process_command(msg_text: str, from_user_id: str) -> bool:
     return False  # nebyl to příkaz
 
 
+def _reply_if_on_cooldown(from_user_id: str) -> bool:
+    """Pokud má uživatel cooldown, odpoví mu a vrátí True."""
+    on_cd, left = is_on_cooldown(from_user_id)
+    if on_cd:
+        minutes_left = max(1, int((left + 59) // 60))
+        _ig_send_text(
+            f"⌛ Už jsi nedávno přidal(a) skladbu. Zkus to znovu za ~{minutes_left} min."
+        )
+    return on_cd
+
+
+def _process_search(query: str, from_user_id: str) -> None:
+    """
+    Vyhledá skladbu podle textu a přidá nejlepší shodu (platí cooldown jako u odkazů).
+    """
+    search_fn = getattr(ump, "search_and_enqueue", None)
+    if not callable(search_fn):
+        _ig_send_text("❌ Tato verze přehrávače neumí vyhledávat.")
+        return
+    if _reply_if_on_cooldown(from_user_id):
+        return
+    try:
+        human = search_fn(query, user_id=from_user_id, privileged=_is_admin(from_user_id))
+    except ump.QueueRejected as e:
+        _ig_send_text(f"❌ {e}")
+        return
+    except Exception as e:
+        print(f"[InstagramBot] Chyba při hledání: {e}")
+        _ig_send_text("❌ Hledání se nepovedlo, zkus to prosím znovu nebo pošli odkaz.")
+        return
+    set_cooldown_time(from_user_id)
+    _ig_send_text(f"✅ Přidáno do fronty: {human}")
+
+
+def _process_links(urls: list, from_user_id: str) -> None:
+    """
+    Přidá až MAX_LINKS_PER_MESSAGE odkazů z jedné zprávy (přehrávač je stahuje souběžně
+    a řadí v pořadí zprávy) a pošle jeden souhrn. Cooldown se nastaví jednou za zprávu.
+    """
+    accepted, skipped = urls[:MAX_LINKS_PER_MESSAGE], len(urls) - MAX_LINKS_PER_MESSAGE
+    try:
+        results = ump.add_links_to_queue(accepted, user_id=from_user_id, privileged=_is_admin(from_user_id))
+    except Exception as e:
+        print(f"[InstagramBot] Chyba při přidávání odkazů: {e}")
+        _ig_send_text("❌ Odkazy se nepodařilo zpracovat, zkus to prosím znovu.")
+        return
+
+    added = [name for _url, name, _error in results if name]
+    failed = [(url, error) for url, name, error in results if not name]
+    if added:
+        set_cooldown_time(from_user_id)
+    lines = []
+    if added:
+        lines.append(f"✅ Přidáno do fronty ({len(added)}/{len(results)}):")
+        lines.extend(f"  • {name}" for name in added)
+    if failed:
+        lines.append("❌ Nepřidáno:")
+        lines.extend(f"  • {url} – {error}" for url, error in failed)
+    if skipped > 0:
+        lines.append(f"ℹ️ Z jedné zprávy beru nejvýš {MAX_LINKS_PER_MESSAGE} odkazů, {skipped} jsem vynechal.")
+    text = "\n".join(lines)
+    if len(text) > 900:
+        text = text[:900] + "\n…"
+    _ig_send_text(text)
+
+
 def _process_message(msg) -> None:
     """
     Zpracuje jednu zprávu z IG.
@@ -443,7 +742,13 @@ def _process_message(msg) -> None:
         )
         return
 
-    # 3) Text bez http, ale obsahuje 'open.spotify...' -> doplníme https://
+    # 3) Vyhledávání textem: "search interpret - skladba"
+    m = SEARCH_REGEX.match(text)
+    if m:
+        _process_search(m.group("query"), from_user_id)
+        return
+
+    # 3b) Text bez http, ale obsahuje 'open.spotify...' -> doplníme https://
     normalized_spotify = _normalize_spotify_text_url(text)
     candidate_urls = []
     if normalized_spotify:
@@ -457,20 +762,25 @@ def _process_message(msg) -> None:
         return
 
     # 5) Cooldown kontrola (pro přidávání skladeb)
-    on_cd, left = is_on_cooldown(from_user_id)
-    if on_cd:
-        minutes_left = max(1, int((left + 59) // 60))
-        _ig_send_text(
-            f"⌛ Už jsi nedávno přidal(a) skladbu. Zkus to znovu za ~{minutes_left} min."
-        )
+    if _reply_if_on_cooldown(from_user_id):
         return
 
-    # 6) Projdi nalezené URL a první úspěšné přidej do fronty
-    # (Pokud by někdo poslal více odkazů v 1 zprávě, přidáme jen první validní.)
+    # 6a) Víc odkazů v jedné zprávě: všechny najednou, jedna souhrnná odpověď
+    unique_urls = list(dict.fromkeys(candidate_urls))
+    if MAX_LINKS_PER_MESSAGE > 1 and len(unique_urls) > 1 and callable(getattr(ump, "add_links_to_queue", None)):
+        _process_links(unique_urls, from_user_id)
+        return
+
+    # 6b) Projdi nalezené URL a první úspěšné přidej do fronty
     for url in candidate_urls:
         # Převod Spotify -> YouTube necháváme na implementaci v UMP,
         # případně UMP už obsahuje logiku uvnitř downloadu.
-        ok, human = add_track_from_url(url)
+        try:
+            ok, human = add_track_from_url(url, from_user_id)
+        except Exception as e:
+            # Přehrávač skladbu vědomě odmítl (duplicita apod.) – nezkoušíme další odkazy
+            _ig_send_text(f"❌ {e}")
+            return
         if ok:
             set_cooldown_time(from_user_id)
             if human:
@@ -491,68 +801,93 @@ def run():
     Spusť IG bota: přihlášení + smyčka pro kontrolu zpráv.
     Tuto funkci spusť v samostatném vlákně z UniversalMusicPlayer.py.
     """
+    started = time.monotonic()
     # Přihlášení
     try:
-        _login_with_session()
+        login_mode = _login_with_session()
     except Exception as e:
         print(f"[InstagramBot] Chyba přihlášení: {e}")
         raise
 
-    print("[InstagramBot] Přihlášeno k Instagramu.")
+    print("[InstagramBot] Přihlášeno k Instagramu"
+          + (" (obnovená session)." if login_mode == "session" else "."))
     print(f"[InstagramBot] Sleduji thread: {THREAD_ID}")
     print(f"[InstagramBot] Admin ID: {ADMIN_IG_USER_ID}")
     print(f"[InstagramBot] Cooldown: {cooldown_minutes} min")
 
     # Na první iteraci jen načteme posledních LAST_N_MSG a uložíme si jejich ID
-    last_seen_ids = []
+    # (re-login při LoginRequired zařídí _ig_call). Když to selže, zkusí to první
+    # kontrola zpráv z plánovače – vlákno bota kvůli tomu nesmí spadnout.
     try:
-        initial_msgs = _ig_fetch_last_messages(LAST_N_MSG)
-        last_seen_ids = [getattr(m, "id", None) for m in initial_msgs if getattr(m, "id", None)]
-        print(f"[InstagramBot] Inicializace: pamatuji si {len(last_seen_ids)} posledních zpráv (bez zpracování).")
-    except LoginRequired:
-        # pokud session expirovala, zkusíme znovu login a pokračujeme
-        _login_with_session()
-        initial_msgs = _ig_fetch_last_messages(LAST_N_MSG)
-        last_seen_ids = [getattr(m, "id", None) for m in initial_msgs if getattr(m, "id", None)]
-
-    # Hlavní smyčka
-    while True:
-        try:
-            msgs = _ig_fetch_last_messages(LAST_N_MSG)
-        except LoginRequired:
-            # Občas IG vyžaduje re-login
-            try:
-                _login_with_session()
-                msgs = _ig_fetch_last_messages(LAST_N_MSG)
-            except Exception as e:
-                print(f"[InstagramBot] LoginRequired -> chyba: {e}")
-                time.sleep(POLL_INTERVAL_SEC)
-                continue
-        except Exception as e:
-            print(f"[InstagramBot] Chyba při načítání zpráv: {e}")
-            time.sleep(POLL_INTERVAL_SEC)
-            continue
+        _remember_initial_messages(_ig_fetch_last_messages(LAST_N_MSG))
+    except Exception as e:
+        print(f"[InstagramBot] Úvodní načtení zpráv selhalo ({e}), zkusím to při další kontrole.")
+    print(f"[InstagramBot] Od startu do první kontroly zpráv: {time.monotonic() - started:.2f} s "
+          f"({'bez loginu heslem' if login_mode == 'session' else 's loginem heslem'})")
 
-        # Pokud nemáme nic, pauza
-        if not msgs:
-            time.sleep(POLL_INTERVAL_SEC)
-            continue
+    # Kontrolu zpráv spouští sdílený plánovač (vlákno mezi kontrolami vůbec nebudí)
+    Scheduler.every("instagram zprávy", POLL_INTERVAL_SEC, _poll_messages, slack=POLL_INTERVAL_SEC * 0.25)
+    threading.Event().wait()  # run() se nevrací, stejně jako dřív hlavní smyčka
 
-        # Zprávy zpracujeme od nejstarší po nejnovější
-        new_msgs = [m for m in reversed(msgs) if getattr(m, "id", None) not in last_seen_ids]
 
-        for m in new_msgs:
-            try:
-                _process_message(m)
-            except Exception as e:
-                print(f"[InstagramBot] Chyba při zpracování zprávy: {e}")
+def _remember_initial_messages(msgs):
+    """První načtené okno zpráv si jen zapamatuje (nezpracovává je)."""
+    global _last_seen_ids
+    _last_seen_ids = [getattr(m, "id", None) for m in msgs or [] if getattr(m, "id", None)]
+    print(f"[InstagramBot] Inicializace: pamatuji si {len(_last_seen_ids)} posledních zpráv (bez zpracování).")
+
+
+def _poll_messages():
+    """
+    Jedna kontrola zpráv (volá ji plánovač každých POLL_INTERVAL_SEC).
+    Vrací, za kolik sekund kontrolovat znovu, když se má čekat déle (vypnutý jistič).
+    """
+    global _last_seen_ids
+    try:
+        msgs = _ig_fetch_last_messages(LAST_N_MSG)
+    except ServiceGuard.ServiceUnavailable as e:
+        # Jistič je vypnutý: nedotazuj se každé 2 s, počkej na zkušební pokus
+        print(f"[InstagramBot] Instagram je vypnutý jističem, další pokus za {e.retry_after:.0f} s")
+        return max(POLL_INTERVAL_SEC, e.retry_after)
+    except LoginRequired as e:
+        print(f"[InstagramBot] LoginRequired -> chyba: {e}")
+        return None
+    except Exception as e:
+        print(f"[InstagramBot] Chyba při načítání zpráv: {e}")
+        return None
+
+    # Úvodní načtení při startu selhalo: tohle okno se jen zapamatuje
+    if _last_seen_ids is None:
+        _remember_initial_messages(msgs)
+        return None
+
+    # Pokud nemáme nic, pauza
+    if not msgs:
+        return None
 
-        # Uložíme aktuální okno posledních zpráv (abychom věděli, co už je zkontrolováno)
-        last_seen_ids = [getattr(m, "id", None) for m in msgs if getattr(m, "id", None)]
+    # Zprávy zpracujeme od nejstarší po nejnovější
+    new_msgs = [m for m in reversed(msgs) if getattr(m, "id", None) not in _last_seen_ids]
 
-        time.sleep(POLL_INTERVAL_SEC)
+    for m in new_msgs:
+        try:
+            _process_message(m)
+        except Exception as e:
+            print(f"[InstagramBot] Chyba při zpracování zprávy: {e}")
+
+    # Uložíme aktuální okno posledních zpráv (abychom věděli, co už je zkontrolováno)
+    _last_seen_ids = [getattr(m, "id", None) for m in msgs if getattr(m, "id", None)]
+    return None
 
 
-# Pro samostatné ladicí spuštění (nepovinné)
+# Samostatné spuštění: ladění, nebo IG bot jako vlastní proces připojený k přehrávacímu uzlu
 if __name__ == "__main__":
+    import argparse
+    import PlaybackNode
+
+    parser = argparse.ArgumentParser(description="Instagram bot pro UniversalMusicPlayer")
+    parser.add_argument("--node", metavar="URL",
+                        help="přehrávací uzel (python UniversalMusicPlayer.py --node); bot jde restartovat bez přerušení hudby")
+    args = parser.parse_args()
+    if args.node:
+        ump = PlaybackNode.NodeClient(args.node, rejected=ump.QueueRejected)
     run()
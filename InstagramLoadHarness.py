@@ -0,0 +1,402 @@
+# InstagramLoadHarness.py
+# -*- coding: utf-8 -*-
+"""
+Zátěžový test IG bota bez skutečného Instagramu.
+
+Režimy:
+- record   – přihlásí se jako bot a ukládá příchozí zprávy skupiny do JSONL souboru
+             (id, user_id, item_type, text, timestamp).
+- generate – vyrobí syntetický záznam (odkazy, příkazy, běžný chat) o zadané rychlosti.
+- replay   – přehraje záznam 1x–100x rychleji proti InstagramBot.run() (režim "poll")
+             nebo přímo proti _process_message() (režim "direct").
+
+Při přehrávání se místo instagrapi klienta použije lokální FakeClient
+(direct_messages / direct_send) a místo přehrávače FakePlayer se simulovanou
+dobou stahování. Na konci se vypíše propustnost, latence odpovědí,
+zahozené zprávy (ty, které poll smyčka vůbec neviděla) a rozhodnutí cooldownu.
+
+Příklad:
+    python InstagramLoadHarness.py generate zaznam.jsonl --messages 3000 --rate 1200
+    python InstagramLoadHarness.py replay zaznam.jsonl --speed 20
+"""
+
+import argparse
+import bisect
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+import ServiceGuard
+
+
+# -----------------------------
+# Záznam zpráv
+# -----------------------------
+def _message_to_record(msg) -> dict:
+    ts = getattr(msg, "timestamp", None)
+    if hasattr(ts, "timestamp"):
+        ts = ts.timestamp()
+    return {
+        "id": str(getattr(msg, "id", "")),
+        "user_id": str(getattr(msg, "user_id", "")),
+        "item_type": getattr(msg, "item_type", None),
+        "text": getattr(msg, "text", None),
+        "timestamp": float(ts) if ts is not None else time.time(),
+    }
+
+
+def load_recording(path: str) -> list:
+    """Načte JSONL záznam a seřadí zprávy podle času."""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    records.sort(key=lambda r: r["timestamp"])
+    return records
+
+
+def record(path: str, duration_sec: float, amount: int = 20):
+    """
+    Nahrává skutečné zprávy ze skupiny do souboru (přihlásí se jako bot).
+    Poll běží stejně často jako bot, ale načítá víc zpráv, aby záznam nic nevynechal.
+    """
+    import InstagramBot as bot
+
+    bot._login_with_session()
+    seen = set()
+    deadline = time.time() + duration_sec
+    count = 0
+    print(f"⏺️ Nahrávám zprávy z threadu {bot.THREAD_ID} po dobu {duration_sec:.0f} s -> {path}")
+    with open(path, "a", encoding="utf-8") as f:
+        while time.time() < deadline:
+            try:
+                msgs = bot._ig_fetch_last_messages(amount)
+            except Exception as e:
+                print(f"❌ Chyba při načítání zpráv: {e}")
+                time.sleep(bot.POLL_INTERVAL_SEC)
+                continue
+            for m in reversed(msgs or []):
+                rec = _message_to_record(m)
+                if rec["id"] in seen:
+                    continue
+                seen.add(rec["id"])
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                count += 1
+            f.flush()
+            time.sleep(bot.POLL_INTERVAL_SEC)
+    print(f"✅ Nahráno {count} zpráv.")
+
+
+def generate(path: str, messages: int, rate_per_min: float, users: int, seed: int = 0):
+    """Vyrobí syntetický záznam: mix odkazů, příkazů a běžného povídání."""
+    rnd = random.Random(seed)
+    video_ids = ["".join(rnd.choice("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-")
+                         for _ in range(11)) for _ in range(200)]
+    chatter = ["haha", "dobrý", "kdo pustil tohle?", "😂", "jdu pro pivo", "tohle je pecka"]
+    start = time.time()
+    interval = 60.0 / rate_per_min
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(messages):
+            roll = rnd.random()
+            if roll < 0.45:
+                text = f"https://youtu.be/{rnd.choice(video_ids)}"
+            elif roll < 0.55:
+                text = f"https://www.youtube.com/watch?v={rnd.choice(video_ids)}&t=30"
+            elif roll < 0.65:
+                text = rnd.choice(["queue", "play", "pause", "volume 70"])
+            else:
+                text = rnd.choice(chatter)
+            rec = {
+                "id": f"syn-{i}",
+                "user_id": str(1000 + rnd.randrange(users)),
+                "item_type": "text",
+                "text": text,
+                "timestamp": start + i * interval * rnd.uniform(0.5, 1.5),
+            }
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    print(f"✅ Vygenerováno {messages} zpráv ({rate_per_min:.0f}/min) -> {path}")
+
+
+# -----------------------------
+# Falešný klient a přehrávač
+# -----------------------------
+class FakeClient:
+    """
+    Napodobí instagrapi Client nad záznamem: zpráva je "vidět" od okamžiku
+    start + (timestamp - první_timestamp) / speed.
+    """
+
+    def __init__(self, records: list, speed: float, clock=time.monotonic):
+        self._clock = clock
+        self._records = records
+        self._messages = [SimpleNamespace(**r) for r in records]
+        t0 = records[0]["timestamp"] if records else 0.0
+        self.start = clock()
+        self.visible_at = [self.start + (r["timestamp"] - t0) / speed for r in records]
+        self.sent = []  # (čas, text)
+        self.fetches = 0
+        self._lock = threading.Lock()
+
+    def visible_count(self) -> int:
+        return bisect.bisect_right(self.visible_at, self._clock())
+
+    def finished(self) -> bool:
+        return self.visible_count() >= len(self._messages)
+
+    # --- API instagrapi, které bot používá ---
+    def direct_messages(self, thread_id, amount=20):
+        self.fetches += 1
+        n = self.visible_count()
+        # instagrapi vrací nejnovější zprávu jako první
+        return list(reversed(self._messages[max(0, n - amount):n]))
+
+    def direct_send(self, text, thread_ids=None):
+        with self._lock:
+            self.sent.append((self._clock(), text))
+
+    def load_settings(self, path):
+        pass
+
+    def dump_settings(self, path):
+        pass
+
+    def login(self, username, password):
+        return True
+
+
+class _FakeQueueRejected(Exception):
+    pass
+
+
+class FakePlayer:
+    """
+    Minimální náhrada modulu UniversalMusicPlayer pro bota: příkazy jen počítá,
+    přidání odkazu "stahuje" zadanou dobu (dělenou rychlostí přehrávání).
+    """
+
+    QueueRejected = _FakeQueueRejected
+
+    def __init__(self, download_sec: float, speed: float):
+        self.download_sec = download_sec / speed
+        self.queue = []
+        self.commands = {}
+
+    def _cmd(self, name):
+        self.commands[name] = self.commands.get(name, 0) + 1
+        return True
+
+    def play_song(self, filepath=None):
+        return self._cmd("play")
+
+    def pause_song(self):
+        return self._cmd("pause")
+
+    def skip_song(self, user_id=None):
+        return self._cmd("next")
+
+    def play_previous_song(self):
+        return self._cmd("previous")
+
+    def set_volume(self, value):
+        return self._cmd("volume")
+
+    def get_queue_overview(self, limit=10, **kwargs):
+        self._cmd("queue")
+        return "\n".join(["▶️ Teď hraje: fake"] + [f"  {i + 1}. {u}" for i, u in enumerate(self.queue[:limit])])
+
+    def add_link_to_queue(self, url, **kwargs):
+        time.sleep(self.download_sec)
+        self.queue.append(url)
+        return url.rsplit("/", 1)[-1]
+
+
+# -----------------------------
+# Přehrávání záznamu
+# -----------------------------
+def _percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def replay(path: str, speed: float = 1.0, mode: str = "poll", download_sec: float = 3.0,
+           grace_sec: float = 5.0, cooldown_min: int = None, admin_id: str = None,
+           service_limits: bool = False) -> dict:
+    """
+    Přehraje záznam proti botovi a vrátí slovník s metrikami (a vypíše souhrn).
+    Limiter služeb (ServiceGuard) je vypnutý, jinak by se měřil token bucket Instagramu
+    místo bota; service_limits=True ho nechá zapnutý (jak se bot chová pod skutečnými limity).
+    """
+    if not 1.0 <= speed <= 100.0:
+        raise ValueError("Rychlost přehrávání musí být 1–100x")
+    records = load_recording(path)
+    if not records:
+        raise ValueError("Záznam je prázdný")
+
+    # Cooldown databáze bota nesmí sahat na produkční cooldown.db
+    tmpdir = tempfile.mkdtemp(prefix="ig_harness_")
+    os.environ["IG_COOLDOWN_DB"] = os.path.join(tmpdir, "cooldown.db")
+    import InstagramBot as bot
+
+    client = FakeClient(records, speed)
+    player = FakePlayer(download_sec, speed)
+    bot._cl = client
+    bot.ump = player
+    bot.THREAD_ID = "harness"
+    bot._login_with_session = lambda: None
+    bot.POLL_INTERVAL_SEC = bot.POLL_INTERVAL_SEC / speed
+    if cooldown_min is not None:
+        bot.cooldown_minutes = cooldown_min
+    if admin_id is not None:
+        bot.ADMIN_IG_USER_ID = admin_id
+    # Cooldown je v sekundách reálného času -> zrychlíme i hodiny bota
+    real_now = bot._now_ts
+    t_start = time.time()
+    bot._now_ts = lambda: int(t_start + (time.time() - t_start) * speed)
+
+    visible_at = {r["id"]: client.visible_at[i] for i, r in enumerate(records)}
+    processed = {}  # id zprávy -> (začátek, konec)
+    latencies = []
+    cooldown = {"allowed": 0, "blocked": 0}
+    current = threading.local()
+
+    orig_process = bot._process_message
+    orig_send = bot._ig_send_text
+    orig_cooldown = bot.is_on_cooldown
+
+    def process_message(msg):
+        current.msg_id = str(getattr(msg, "id", ""))
+        current.replied = False
+        begin = time.monotonic()
+        try:
+            orig_process(msg)
+        finally:
+            processed[current.msg_id] = (begin, time.monotonic())
+            current.msg_id = None
+
+    def send_text(text):
+        orig_send(text)
+        msg_id = getattr(current, "msg_id", None)
+        if msg_id and not current.replied:
+            current.replied = True
+            latencies.append(time.monotonic() - visible_at[msg_id])
+
+    def is_on_cooldown(user_id):
+        result = orig_cooldown(user_id)
+        cooldown["blocked" if result[0] else "allowed"] += 1
+        return result
+
+    bot._process_message = process_message
+    bot._ig_send_text = send_text
+    bot.is_on_cooldown = is_on_cooldown
+    orig_limits = ServiceGuard.SERVICE_LIMITS, ServiceGuard.DEFAULT_LIMIT
+    if not service_limits:
+        ServiceGuard.SERVICE_LIMITS = {}
+        ServiceGuard.DEFAULT_LIMIT = (1e6, 1e6)
+    with ServiceGuard._services_lock:
+        ServiceGuard._services.pop("instagram", None)  # limity se čtou při vytvoření služby
+
+    print(f"▶️ Přehrávám {len(records)} zpráv rychlostí {speed:g}x (režim {mode})")
+    try:
+        if mode == "direct":
+            for i, r in enumerate(records):
+                delay = client.visible_at[i] - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                try:
+                    bot._process_message(SimpleNamespace(**r))
+                except Exception as e:
+                    print(f"❌ Chyba při zpracování zprávy: {e}")
+        else:
+            # Stejně jako v produkci run() zprávy viditelné při startu jen označí jako přečtené
+            threading.Thread(target=bot.run, daemon=True).start()
+            while not client.finished():
+                time.sleep(0.05)
+            time.sleep(grace_sec / speed + bot.POLL_INTERVAL_SEC)
+    finally:
+        bot._process_message = orig_process
+        bot._ig_send_text = orig_send
+        bot.is_on_cooldown = orig_cooldown
+        bot._now_ts = real_now
+        ServiceGuard.SERVICE_LIMITS, ServiceGuard.DEFAULT_LIMIT = orig_limits
+        with ServiceGuard._services_lock:
+            ServiceGuard._services.pop("instagram", None)
+
+    elapsed = time.monotonic() - client.start
+    handled = [processed[r["id"]] for r in records if r["id"] in processed]
+    busy = sum(end - begin for begin, end in handled)
+    result = {
+        "messages": len(records),
+        "processed": len(handled),
+        "dropped": len(records) - len(handled),
+        "elapsed_sec": elapsed,
+        "throughput_per_min": len(handled) / elapsed * 60 if elapsed > 0 else 0.0,
+        "capacity_per_min": len(handled) / busy * 60 if busy > 0 else 0.0,
+        "replies": len(client.sent),
+        "latency_p50": _percentile(latencies, 50),
+        "latency_p95": _percentile(latencies, 95),
+        "latency_max": max(latencies) if latencies else 0.0,
+        "cooldown_allowed": cooldown["allowed"],
+        "cooldown_blocked": cooldown["blocked"],
+        "fetches": client.fetches,
+        "enqueued": len(player.queue),
+        "commands": dict(player.commands),
+    }
+
+    print("\n📊 Výsledek zátěžového testu")
+    print(f"  Zprávy: {result['messages']}, zpracováno: {result['processed']}, zahozeno: {result['dropped']}")
+    print(f"  Propustnost: {result['throughput_per_min']:.0f} zpráv/min "
+          f"(kapacita zpracování {result['capacity_per_min']:.0f} zpráv/min)")
+    print(f"  Latence odpovědi: p50 {result['latency_p50']:.2f} s, p95 {result['latency_p95']:.2f} s, "
+          f"max {result['latency_max']:.2f} s ({len(latencies)} odpovědí)")
+    print(f"  Cooldown: povoleno {result['cooldown_allowed']}, zamítnuto {result['cooldown_blocked']}")
+    print(f"  Poll dotazů: {result['fetches']}, přidáno do fronty: {result['enqueued']}, příkazy: {result['commands']}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zátěžový test IG bota (záznam a přehrání zpráv)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("record", help="nahrát skutečné zprávy ze skupiny")
+    p.add_argument("path")
+    p.add_argument("--duration", type=float, default=600, help="délka nahrávání v sekundách")
+
+    p = sub.add_parser("generate", help="vyrobit syntetický záznam")
+    p.add_argument("path")
+    p.add_argument("--messages", type=int, default=2000)
+    p.add_argument("--rate", type=float, default=1000, help="zpráv za minutu")
+    p.add_argument("--users", type=int, default=25)
+    p.add_argument("--seed", type=int, default=0)
+
+    p = sub.add_parser("replay", help="přehrát záznam proti botovi")
+    p.add_argument("path")
+    p.add_argument("--speed", type=float, default=1.0, help="zrychlení 1–100x")
+    p.add_argument("--mode", choices=("poll", "direct"), default="poll")
+    p.add_argument("--download-sec", type=float, default=3.0, help="simulovaná doba stažení skladby")
+    p.add_argument("--cooldown-min", type=int, default=None)
+    p.add_argument("--admin-id", default=None)
+    p.add_argument("--service-limits", action="store_true",
+                   help="nechat zapnutý limiter služeb (jinak se měří jen bot)")
+
+    args = parser.parse_args()
+    if args.cmd == "record":
+        record(args.path, args.duration)
+    elif args.cmd == "generate":
+        generate(args.path, args.messages, args.rate, args.users, args.seed)
+    else:
+        replay(args.path, args.speed, args.mode, args.download_sec,
+               cooldown_min=args.cooldown_min, admin_id=args.admin_id,
+               service_limits=args.service_limits)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# LanAudio.py
+# -*- coding: utf-8 -*-
+"""
+Sdílení stažených skladeb po lokální síti (další místnosti, telefony).
+
+Malý HTTP server nad DOWNLOAD_DIR:
+- GET/HEAD /audio/<soubor>   skladba z fronty, podporuje Range (přetáčení, navazování),
+- GET /now                   co právě hraje a na jaké pozici (klient se podle toho srovná),
+- GET /queue                 odkazy na aktuální a další skladby (klient si je může přednačíst).
+
+Data souborů se posílají přes socket.sendfile (na Linuxu os.sendfile), takže je jádro
+kopíruje rovnou ze souboru do socketu bez průchodu Pythonem – desítky klientů
+server skoro nezatíží. Podávají se jen soubory, které jsou ve frontě.
+
+Spuštění:
+    python UniversalMusicPlayer.py --lan [--lan-port 8766]
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8766
+IDLE_TIMEOUT_SEC = 60
+TRACKS_REFRESH_SEC = 1.0  # jak dlouho věřit seznamu skladeb z fronty (snímek fronty v paměti, ne při každém Range dotazu)
+
+CONTENT_TYPES = {'.m4a': 'audio/mp4', '.mp4': 'audio/mp4', '.aac': 'audio/aac',
+                 '.webm': 'audio/webm', '.opus': 'audio/ogg', '.ogg': 'audio/ogg',
+                 '.mp3': 'audio/mpeg', '.flac': 'audio/flac', '.wav': 'audio/wav'}
+
+RANGE_REGEX = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def audio_url(path: str) -> str:
+    """Relativní adresa souboru na serveru ('/audio/<soubor>')."""
+    return "/audio/" + urllib.parse.quote(os.path.basename(path))
+
+
+def parse_range(header: str, size: int):
+    """
+    Hlavička Range -> (začátek, konec včetně), None bez Range,
+    nebo ValueError, když rozsah nejde splnit (odpověď 416).
+    Podporuje jeden rozsah: 'bytes=a-b', 'bytes=a-' a 'bytes=-n'.
+    """
+    if not header:
+        return None
+    match = RANGE_REGEX.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None  # víc rozsahů nebo nesmysl: pošli celý soubor
+    first, last = match.group(1), match.group(2)
+    if first == "":
+        length = int(last)
+        if length == 0:
+            raise ValueError("prázdný rozsah")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("rozsah mimo soubor")
+    return start, end
+
+
+class _TrackSet:
+    """Soubory z fronty (jméno -> cesta), obnovované nejvýš jednou za TRACKS_REFRESH_SEC."""
+
+    def __init__(self, tracks):
+        self._tracks = tracks
+        self._lock = threading.Lock()
+        self._cached = {}
+        self._loaded_at = 0.0
+
+    def get(self) -> dict:
+        with self._lock:
+            if time.monotonic() - self._loaded_at > TRACKS_REFRESH_SEC:
+                self._cached = {os.path.basename(path): path for path in self._tracks()}
+                self._loaded_at = time.monotonic()
+            return self._cached
+
+
+def _make_handler(download_dir: str, tracks, now_playing):
+    root = os.path.realpath(download_dir)
+    track_set = _TrackSet(tracks)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive: přehrávače posílají víc Range dotazů za sebou
+        server_version = "UniversalMusicPlayer"
+        timeout = IDLE_TIMEOUT_SEC  # nečinné keep-alive spojení neblokuje vlákno navždy
+
+        def log_message(self, *args):
+            pass
+
+        def _reply_json(self, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status: int, extra_headers=None):
+            self.send_response(status)
+            for name, value in (extra_headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def _resolve(self, name: str):
+            """Cesta k souboru z fronty uvnitř DOWNLOAD_DIR, jinak None."""
+            path = track_set.get().get(name)
+            if not path:
+                return None
+            real = os.path.realpath(path)
+            if os.path.dirname(real) != root or not os.path.isfile(real):
+                return None
+            return real
+
+        def do_HEAD(self):
+            self._serve(head=True)
+
+        def do_GET(self):
+            self._serve(head=False)
+
+        def _serve(self, head: bool):
+            route = urllib.parse.urlsplit(self.path).path
+            if route == "/now" and not head:
+                state = now_playing()
+                if state.get("soubor"):
+                    state["url"] = audio_url(state["soubor"])
+                    state["soubor"] = os.path.basename(state["soubor"])
+                return self._reply_json(state)
+            if route == "/queue" and not head:
+                return self._reply_json([audio_url(path) for path in tracks(upcoming_only=True)])
+            if not route.startswith("/audio/"):
+                return self._error(404)
+
+            path = self._resolve(urllib.parse.unquote(route[len("/audio/"):]))
+            if path is None:
+                return self._error(404)
+            try:
+                f = open(path, "rb")
+            except OSError:
+                return self._error(404)
+            with f:
+                size = os.fstat(f.fileno()).st_size
+                try:
+                    byte_range = parse_range(self.headers.get("Range"), size)
+                except ValueError:
+                    return self._error(416, {"Content-Range": f"bytes */{size}"})
+
+                start, end = byte_range if byte_range else (0, size - 1)
+                length = max(0, end - start + 1)
+                self.send_response(206 if byte_range else 200)
+                self.send_header("Content-Type", CONTENT_TYPES.get(os.path.splitext(path)[1].lower(),
+                                                                   "application/octet-stream"))
+                self.send_header("Content-Length", str(length))
+                self.send_header("Accept-Ranges", "bytes")
+                if byte_range:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                if head or length == 0:
+                    return
+                try:
+                    # Jádro kopíruje soubor rovnou do socketu (sendfile), Python data nevidí
+                    self.connection.sendfile(f, offset=start, count=length)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # klient přetočil / odešel
+
+    return Handler
+
+
+def serve(download_dir: str, tracks, now_playing, host: str = "0.0.0.0",
+          port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """
+    Spustí server na pozadí a vrátí ho.
+    tracks(upcoming_only=False) vrací cesty skladeb ve frontě,
+    now_playing() slovník se stavem přehrávání (viz UniversalMusicPlayer.get_now_playing).
+    """
+    handler = _make_handler(download_dir, tracks, now_playing)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
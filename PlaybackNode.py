@@ -0,0 +1,428 @@
+# PlaybackNode.py
+# -*- coding: utf-8 -*-
+"""
+Rozdělení přehrávače na přehrávací uzel a stahovací workery (lokální HTTP + JSON).
+
+Přehrávací uzel (fronta + VLC) nabízí malé HTTP API:
+- POST /call/<funkce>       volání vybraných funkcí přehrávače (IG bot v jiném procesu),
+- POST /jobs/claim          worker si vyzvedne úlohu ke stažení (long-poll),
+- POST /jobs/<id>/done      worker hlásí hotový soubor ve sdílené složce DOWNLOAD_DIR,
+- POST /jobs/<id>/failed    worker hlásí chybu (přechodnou úlohu uzel vrátí do fronty),
+  obojí s číslem pokusu z claim ("pokus"), aby se nepřijal výsledek workeru, kterému lhůta vypršela,
+- PUT  /cache/<soubor>      worker bez sdílené složky pošle hotový soubor přímo uzlu.
+
+Worker, který úlohu nedokončí do lhůty (spadl, zasekl se), o ni přijde a dostane ji jiný.
+Workerů může běžet víc (i na jiných strojích) a IG bot jde restartovat bez přerušení hudby.
+
+Spuštění:
+    NODE_TOKEN=... python UniversalMusicPlayer.py --node [--host 0.0.0.0] [--port 8765]
+    python UniversalMusicPlayer.py --worker http://uzel:8765 [--upload]
+    python InstagramBot.py --node http://uzel:8765
+Sdílený klíč v proměnné prostředí NODE_TOKEN (hlavička X-Node-Token); bez něj uzel
+naslouchá jen na loopbacku (API umí ovládat frontu a zapisovat do složky se skladbami).
+"""
+
+import ipaddress
+import itertools
+import json
+import math
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+DEFAULT_PORT = 8765
+CLAIM_WAIT_SEC = 20  # jak dlouho worker čeká na úlohu v jednom dotazu
+JOB_LEASE_SEC = 15 * 60  # za jak dlouho se nedokončená úloha vrátí do fronty
+JOB_ATTEMPTS = 3  # kolikrát úlohu zkusit (přechodné chyby, ztracení workeři)
+CALL_TIMEOUT_SEC = 20 * 60  # přidání skladby čeká na stažení
+UPLOAD_CHUNK = 256 * 1024
+
+# Funkce přehrávače, které smí volat vzdálený IG bot
+RPC_FUNCTIONS = ("add_link_to_queue", "add_links_to_queue", "search_and_enqueue", "get_queue_overview", "play_song",
+                 "pause_song", "skip_song", "play_previous_song", "set_volume",
+                 "get_admission_headroom", "get_cache_stats", "remove_from_queue", "move_in_queue",
+                 "play_next", "undo_last_request", "when_is_my_song", "get_service_status")
+
+TOKEN = os.getenv("NODE_TOKEN", "")
+
+
+class JobFailed(Exception):
+    """Worker úlohu nedokázal dokončit."""
+
+
+class JobBoard:
+    """Úlohy ke stažení: čekající, zapůjčené workerům (s lhůtou) a výsledky."""
+
+    def __init__(self, lease_sec: float = JOB_LEASE_SEC):
+        self.lease_sec = lease_sec
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._leased = {}  # id -> (úloha, termín)
+        self._results = {}  # id -> ("done", výsledek) | ("failed", zpráva)
+        self._abandoned = set()  # id úloh, na které už nikdo nečeká (timeout); pozdní výsledek se zahodí
+        self._ids = itertools.count(1)
+        self._workers = {}  # jméno workeru -> kdy se naposled ozval
+
+    def submit(self, url: str) -> int:
+        with self._cond:
+            job = {"id": next(self._ids), "odkaz": url, "pokus": 0}
+            self._pending.append(job)
+            self._cond.notify_all()
+            return job["id"]
+
+    def _expire_leases(self):
+        now = time.monotonic()
+        for job_id, (job, deadline) in list(self._leased.items()):
+            if deadline < now:
+                del self._leased[job_id]
+                if job_id in self._abandoned:
+                    self._abandoned.discard(job_id)
+                    continue
+                self._retry_or_fail(job, "worker úlohu nedokončil v čas")
+
+    def _retry_or_fail(self, job, message):
+        if job["pokus"] < JOB_ATTEMPTS:
+            self._pending.appendleft(job)
+        else:
+            self._results[job["id"]] = ("failed", message)
+        self._cond.notify_all()
+
+    def claim(self, worker: str, wait: float = CLAIM_WAIT_SEC):
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while True:
+                self._workers[worker] = time.monotonic()
+                self._expire_leases()
+                if self._pending:
+                    job = self._pending.popleft()
+                    job["pokus"] += 1
+                    self._leased[job["id"]] = (job, time.monotonic() + self.lease_sec)
+                    return dict(job)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(min(remaining, 5))
+
+    def _take_lease(self, job_id: int, attempt):
+        """Odebere zápůjčku jen tomu, komu patří (stejný pokus); jinak None."""
+        leased = self._leased.get(job_id)
+        if leased is None or leased[0]["pokus"] != attempt:
+            return None  # lhůta vypršela a úlohu mezitím dostal někdo jiný (nebo už je hotová)
+        return self._leased.pop(job_id)
+
+    def complete(self, job_id: int, attempt: int, result: dict) -> bool:
+        with self._cond:
+            if self._take_lease(job_id, attempt) is None:
+                return False
+            if job_id in self._abandoned:
+                self._abandoned.discard(job_id)
+                return False  # na výsledek už nikdo nečeká
+            self._results[job_id] = ("done", result)
+            self._cond.notify_all()
+            return True
+
+    def fail(self, job_id: int, attempt: int, message: str, transient: bool) -> bool:
+        with self._cond:
+            leased = self._take_lease(job_id, attempt)
+            if leased is None:
+                return False
+            if job_id in self._abandoned:
+                self._abandoned.discard(job_id)
+                return False
+            if transient:
+                self._retry_or_fail(leased[0], message)
+            else:
+                self._results[job_id] = ("failed", message)
+                self._cond.notify_all()
+            return True
+
+    def wait(self, job_id: int, timeout: float) -> dict:
+        """Počká na výsledek úlohy; při chybě vyhodí JobFailed, po timeoutu TimeoutError."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while job_id not in self._results:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._pending = deque(j for j in self._pending if j["id"] != job_id)
+                    if job_id in self._leased:
+                        self._abandoned.add(job_id)  # worker ji dodělá, výsledek ale nikdo nevyzvedne
+                    raise TimeoutError("žádný worker úlohu nedokončil")
+                self._cond.wait(min(remaining, 5))
+                self._expire_leases()
+            status, payload = self._results.pop(job_id)
+        if status == "failed":
+            raise JobFailed(payload)
+        return payload
+
+    def workers_alive(self, within: float) -> int:
+        """Počet workerů, kteří se ozvali za posledních within sekund."""
+        now = time.monotonic()
+        with self._cond:
+            return sum(1 for seen in self._workers.values() if now - seen <= within)
+
+
+# -----------------------------
+# Server (přehrávací uzel)
+# -----------------------------
+def _make_handler(player, board: JobBoard, download_dir: str, rejected):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass  # přehrávač má vlastní výpisy
+
+        def _reply(self, status: int, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _authorized(self) -> bool:
+            if TOKEN and self.headers.get("X-Node-Token") != TOKEN:
+                self._reply(403, {"chyba": "neplatný token"})
+                return False
+            return True
+
+        def _json_body(self) -> dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            parts = self.path.strip("/").split("/")
+            try:
+                data = self._json_body()
+            except ValueError:
+                return self._reply(400, {"chyba": "neplatný JSON"})
+
+            if len(parts) == 2 and parts[0] == "call" and parts[1] in RPC_FUNCTIONS:
+                func = getattr(player, parts[1], None)
+                if not callable(func):
+                    return self._reply(404, {"chyba": f"přehrávač neumí {parts[1]}"})
+                try:
+                    result = func(*data.get("args", []), **data.get("kwargs", {}))
+                except Exception as e:
+                    if isinstance(e, rejected):
+                        return self._reply(409, {"chyba": str(e), "odmitnuto": True})
+                    return self._reply(500, {"chyba": str(e)})
+                return self._reply(200, {"vysledek": result})
+
+            if parts == ["jobs", "claim"]:
+                try:
+                    wait = float(data.get("wait", CLAIM_WAIT_SEC))
+                except (TypeError, ValueError):
+                    wait = float("nan")
+                if math.isnan(wait):  # NaN (i z JSON) by long-poll nikdy neukončil
+                    return self._reply(400, {"chyba": "neplatné wait"})
+                wait = min(max(wait, 0.0), 60)
+                job = board.claim(str(data.get("worker") or self.client_address[0]), wait)
+                return self._reply(200, {"uloha": job})
+            if len(parts) == 3 and parts[0] == "jobs" and parts[1].isdigit():
+                job_id = int(parts[1])
+                attempt = data.pop("pokus", None)
+                if parts[2] == "done":
+                    return self._reply(200, {"prijato": board.complete(job_id, attempt, data)})
+                if parts[2] == "failed":
+                    return self._reply(200, {"prijato": board.fail(job_id, attempt, str(data.get("chyba")),
+                                                                   bool(data.get("prechodna")))})
+            self._reply(404, {"chyba": "neznámá adresa"})
+
+        def do_PUT(self):
+            if not self._authorized():
+                return
+            parts = self.path.strip("/").split("/", 1)
+            name = os.path.basename(urllib.parse.unquote(parts[1])) if len(parts) == 2 else ""
+            if parts[0] != "cache" or not name or name.startswith("."):
+                return self._reply(404, {"chyba": "neznámá adresa"})
+            remaining = int(self.headers.get("Content-Length") or 0)
+            target = os.path.join(download_dir, name)
+            tmp = target + ".upload"
+            os.makedirs(download_dir, exist_ok=True)
+            with open(tmp, "wb") as f:
+                while remaining > 0:
+                    chunk = self.rfile.read(min(UPLOAD_CHUNK, remaining))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            if remaining:
+                os.remove(tmp)
+                return self._reply(400, {"chyba": "nekompletní soubor"})
+            os.replace(tmp, target)
+            self._reply(200, {"soubor": name})
+
+    return Handler
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve(player, board: JobBoard, download_dir: str, rejected, host: str = "127.0.0.1",
+          port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """Spustí HTTP API uzlu na pozadí a vrátí server. Mimo loopback jen s NODE_TOKEN."""
+    if not TOKEN and not is_loopback(host):
+        raise ValueError(f"Uzel na adrese {host} by byl dostupný ze sítě bez ověření, nastav NODE_TOKEN.")
+    server = ThreadingHTTPServer((host, port), _make_handler(player, board, download_dir, rejected))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="playback-node", daemon=True).start()
+    return server
+
+
+# -----------------------------
+# Klienti (IG bot, worker)
+# -----------------------------
+def _request(base_url: str, method: str, path: str, payload=None, timeout: float = 30,
+             stream=None, length: int = None):
+    headers = {"X-Node-Token": TOKEN} if TOKEN else {}
+    data = None
+    if payload is not None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers["Content-Type"] = "application/json; charset=utf-8"
+    if stream is not None:
+        data = stream
+        headers["Content-Length"] = str(length)
+    req = urllib.request.Request(base_url.rstrip("/") + path, data=data, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        try:
+            return e.code, json.loads(e.read() or b"{}")
+        except ValueError:
+            return e.code, {"chyba": str(e)}
+
+
+class NodeClient:
+    """
+    Zastoupí modul UniversalMusicPlayer v jiném procesu (IG bot): stejná jména funkcí,
+    volání jdou přes HTTP na přehrávací uzel. Odmítnutí uzlem vyhodí self.QueueRejected.
+    """
+
+    def __init__(self, base_url: str, rejected=RuntimeError):
+        self.base_url = base_url
+        self.QueueRejected = rejected
+
+    def _call(self, name: str, *args, **kwargs):
+        status, data = _request(self.base_url, "POST", f"/call/{name}",
+                                {"args": list(args), "kwargs": kwargs}, timeout=CALL_TIMEOUT_SEC)
+        if status == 409 and data.get("odmitnuto"):
+            raise self.QueueRejected(data.get("chyba"))
+        if status != 200:
+            raise RuntimeError(data.get("chyba") or f"uzel vrátil {status}")
+        return data.get("vysledek")
+
+    def add_link_to_queue(self, url, user_id=None, privileged=False):
+        return self._call("add_link_to_queue", url, user_id=user_id, privileged=privileged)
+
+    def add_links_to_queue(self, urls, user_id=None, privileged=False):
+        return [tuple(item) for item in self._call("add_links_to_queue", list(urls), user_id=user_id,
+                                                    privileged=privileged)]
+
+    def search_and_enqueue(self, query, user_id=None, privileged=False):
+        return self._call("search_and_enqueue", query, user_id=user_id, privileged=privileged)
+
+    def get_queue_overview(self, limit: int = 10, user_id=None) -> str:
+        return self._call("get_queue_overview", limit, user_id=user_id)
+
+    def get_admission_headroom(self, user_id=None):
+        return self._call("get_admission_headroom", user_id=user_id)
+
+    def get_cache_stats(self) -> str:
+        return self._call("get_cache_stats")
+
+    def remove_from_queue(self, position, user_id=None, privileged=False):
+        return self._call("remove_from_queue", position, user_id=user_id, privileged=privileged)
+
+    def move_in_queue(self, from_position, to_position):
+        return self._call("move_in_queue", from_position, to_position)
+
+    def play_next(self, url, user_id=None, privileged=False):
+        return self._call("play_next", url, user_id=user_id, privileged=privileged)
+
+    def undo_last_request(self, user_id=None):
+        return self._call("undo_last_request", user_id=user_id)
+
+    def when_is_my_song(self, user_id=None) -> str:
+        return self._call("when_is_my_song", user_id=user_id)
+
+    def get_service_status(self) -> str:
+        return self._call("get_service_status")
+
+    def play_song(self):
+        return self._call("play_song")
+
+    def pause_song(self):
+        return self._call("pause_song")
+
+    def skip_song(self, user_id=None):
+        return self._call("skip_song", user_id=user_id)
+
+    def play_previous_song(self):
+        return self._call("play_previous_song")
+
+    def set_volume(self, value: int) -> bool:
+        return self._call("set_volume", value)
+
+
+def run_worker(node_url: str, resolve, upload: bool = False, name: str = None):
+    """
+    Smyčka stahovacího workeru: vyzvedne úlohu, resolve(odkaz) vrátí slovník s 'cesta'
+    (a metadaty), soubor pošle uzlu (upload) nebo nechá ve sdílené složce a nahlásí výsledek.
+    resolve může vyhodit výjimku s atributem transient (přechodná chyba -> úlohu dostane jiný).
+    """
+    name = name or f"{os.uname().nodename if hasattr(os, 'uname') else 'worker'}-{os.getpid()}"
+    print(f"🛠️ Worker {name} připojen k {node_url}")
+    while True:
+        try:
+            status, data = _request(node_url, "POST", "/jobs/claim", {"worker": name, "wait": CLAIM_WAIT_SEC},
+                                    timeout=CLAIM_WAIT_SEC + 10)
+        except OSError as e:
+            print(f"⚠️ Uzel nedostupný ({e}), zkusím to znovu za 5 s")
+            time.sleep(5)
+            continue
+        job = data.get("uloha") if status == 200 else None
+        if not job:
+            if status != 200:
+                print(f"⚠️ Uzel odmítl vydat úlohu: {data.get('chyba')}")
+                time.sleep(5)
+            continue
+
+        print(f"⬇️ Úloha {job['id']}: {job['odkaz']}")
+        try:
+            result = resolve(job["odkaz"])
+            filepath = result.pop("cesta", None)
+            if not filepath:
+                raise JobFailed("skladbu se nepodařilo stáhnout")
+            if upload:
+                with open(filepath, "rb") as f:
+                    status, data = _request(node_url, "PUT", f"/cache/{urllib.parse.quote(Path(filepath).name)}",
+                                            stream=f, length=os.path.getsize(filepath), timeout=CALL_TIMEOUT_SEC)
+                if status != 200:
+                    raise JobFailed(f"odeslání souboru selhalo: {data.get('chyba')}")
+            result["soubor"] = Path(filepath).name
+            result["pokus"] = job["pokus"]
+            _request(node_url, "POST", f"/jobs/{job['id']}/done", result)
+            print(f"✅ Úloha {job['id']} hotová: {result['soubor']}")
+        except Exception as e:
+            print(f"❌ Úloha {job['id']} selhala: {e}")
+            try:
+                _request(node_url, "POST", f"/jobs/{job['id']}/failed",
+                         {"chyba": str(e), "prechodna": bool(getattr(e, "transient", False)),
+                          "pokus": job["pokus"]})
+            except OSError:
+                pass  # lhůta úlohy vyprší a uzel ji dá někomu jinému
@@ -0,0 +1,122 @@
+# Profiler.py
+# -*- coding: utf-8 -*-
+"""
+Profilování na vyžádání ("profile 30" z chatu nebo konzole).
+
+Vzorkovací profiler: samostatné vlákno každých SAMPLE_INTERVAL_SEC přečte zásobníky
+všech vláken (sys._current_frames) – zachytí tedy i IG bota, přehrávač a stahování.
+Když neběží, nic se neinstaluje (žádný sys.setprofile ani trace), režie je nulová.
+
+Výstup:
+- soubor ve formátu "folded stacks" (řádek = "funkce;funkce;... počet"), který umí
+  flamegraph.pl, speedscope nebo inferno,
+- textový souhrn: funkce seřazené podle kumulativního času (vzorek se počítá
+  funkci, pokud je kdekoli na zásobníku) a vlastního času (je na vrcholu).
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+PROFILE_DIR = "profiles"
+SAMPLE_INTERVAL_SEC = 0.005
+MAX_PROFILE_SEC = 300
+TOP_N = 10
+
+_running = threading.Lock()  # držený po dobu jednoho profilování
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _sample(seconds: float, interval: float):
+    """Vzorkuje zásobníky všech vláken. Vrací (Counter zásobníků, počet vzorků, jména vláken)."""
+    me = threading.get_ident()
+    stacks = Counter()
+    threads = set()
+    rounds = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            thread_name = names.get(ident, str(ident))
+            threads.add(thread_name)
+            stacks[(f"vlákno {thread_name}",) + tuple(reversed(labels))] += 1
+        rounds += 1
+        time.sleep(interval)
+    return stacks, rounds, threads
+
+
+def _write_folded(stacks: Counter, path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(";".join(part.replace(";", ",") for part in stack) + f" {count}\n")
+
+
+def _summary(stacks: Counter, rounds: int, threads: set, seconds: float, path: str) -> str:
+    cumulative = Counter()
+    own = Counter()
+    for stack, count in stacks.items():
+        frames = stack[1:]
+        # Rozjezd vláken z threading.py je na každém zásobníku, v souhrnu jen překáží
+        for label in set(f for f in frames if "(threading.py:" not in f):
+            cumulative[label] += count
+        if frames:
+            own[frames[-1]] += count
+    total = sum(stacks.values()) or 1
+    sample_sec = seconds / max(rounds, 1)  # skutečný rozestup vzorků (GIL ho natahuje)
+    lines = [f"🔬 Profil {seconds:.0f} s: {rounds} vzorků, {len(threads)} vláken -> {path}",
+             "Top funkce (kumulativně, % všech vzorků vláken):"]
+    for i, (label, count) in enumerate(cumulative.most_common(TOP_N), 1):
+        lines.append(f"  {i}. {count * 100 / total:5.1f} % {count * sample_sec:6.1f} s  {label}")
+    lines.append("Nejvíc vlastního času:")
+    for label, count in own.most_common(3):
+        lines.append(f"  {count * 100 / total:5.1f} %  {label}")
+    return "\n".join(lines)
+
+
+def profile(seconds: float, interval: float = SAMPLE_INTERVAL_SEC):
+    """
+    Synchronně profiluje zadaný počet sekund. Vrací (cesta_k_souboru, souhrn),
+    nebo None, pokud už jiné profilování běží.
+    """
+    seconds = max(1.0, min(float(seconds), MAX_PROFILE_SEC))
+    if not _running.acquire(blocking=False):
+        return None
+    try:
+        stacks, rounds, threads = _sample(seconds, interval)
+    finally:
+        _running.release()
+    path = os.path.join(PROFILE_DIR, f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded")
+    _write_folded(stacks, path)
+    return path, _summary(stacks, rounds, threads, seconds, path)
+
+
+def profile_async(seconds: float, on_done) -> bool:
+    """
+    Spustí profilování na pozadí a po skončení zavolá on_done(souhrn).
+    Vrací False, pokud už jiné profilování běží.
+    """
+    if _running.locked():
+        return False
+
+    def worker():
+        try:
+            result = profile(seconds)
+            on_done(result[1] if result else "❌ Profilování už běží.")
+        except Exception as e:
+            on_done(f"❌ Chyba při profilování: {e}")
+
+    threading.Thread(target=worker, name="profiler", daemon=True).start()
+    return True
@@ -0,0 +1,509 @@
+# QueueStore.py
+# -*- coding: utf-8 -*-
+"""
+Fronta skladeb v paměti s indexy a zápisem jen změněných položek.
+
+Navenek platí stejná čísla jako dřív v queue.json: id 0 = právě hraje, 1, 2, … = další
+na řadě, -1, -2, … = historie. Uvnitř má každá položka stálé "uid" a klíč pořadí
+"poradi" (desetinné číslo); id se z pořadí dopočítá. Díky tomu:
+- posun fronty po skladbě (i "previous") mění jen počítadlo historie, ne všechny položky,
+- vložení/odebrání/přesun na pozici je O(log n) přes treap s velikostmi podstromů
+  (k-tá položka i pořadí položky), uid -> položka je O(1) slovník,
+- poslední žádost uživatele (undo) se najde přes index uživatel -> jeho položky,
+- uzly treapu nesou i součet délek skladeb v podstromu, takže čas do začátku libovolné
+  položky (ETA) i délka celé čekající fronty jsou O(log n) bez procházení fronty.
+
+Uložení: queue.json je snímek celé fronty (stejný formát jako dřív, navíc uid a poradi),
+každá změna se připíše jako jeden řádek do queue.json.journal (jen změněné položky).
+Při načtení se na snímek přehraje žurnál; když žurnál naroste, zapíše se nový snímek.
+Ruční úpravy queue.json za běhu se už nepromítnou – na úpravy jsou příkazy remove/move/...
+"""
+
+import json
+import math
+import os
+import random
+import threading
+from collections import defaultdict
+
+JOURNAL_COMPACT_MIN = 200  # od kolika řádků žurnálu uvažovat o novém snímku
+
+
+class _Node:
+    __slots__ = ("key", "uid", "prio", "left", "right", "size", "weight", "total")
+
+    def __init__(self, key, uid, weight):
+        self.key = key
+        self.uid = uid
+        self.prio = random.random()
+        self.left = None
+        self.right = None
+        self.size = 1
+        self.weight = weight  # délka skladby v sekundách
+        self.total = weight  # součet délek v podstromu
+
+
+def _size(node):
+    return node.size if node else 0
+
+
+def _total(node):
+    return node.total if node else 0.0
+
+
+def _update(node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+    node.total = node.weight + _total(node.left) + _total(node.right)
+
+
+def _split(node, key):
+    """Rozdělí strom na (klíče < key, klíče >= key)."""
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        _update(node)
+        return node, right
+    left, node.left = _split(node.left, key)
+    _update(node)
+    return left, node
+
+
+def _merge(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.prio > right.prio:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+class _OrderIndex:
+    """
+    Treap podle klíče pořadí: vložení, odebrání, k-tý prvek, pořadí klíče
+    a součet délek prvních k prvků v O(log n).
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def __len__(self):
+        return _size(self.root)
+
+    def insert(self, key, uid, weight=0.0):
+        left, right = _split(self.root, key)
+        self.root = _merge(_merge(left, _Node(key, uid, weight)), right)
+
+    def remove(self, key):
+        left, right = _split(self.root, key)
+        _middle, right = _split(right, _next_float(key))
+        self.root = _merge(left, right)
+
+    def kth(self, k):
+        """(klíč, uid) k-tého prvku od nuly, None mimo rozsah."""
+        node = self.root
+        while node:
+            left = _size(node.left)
+            if k < left:
+                node = node.left
+            elif k == left:
+                return node.key, node.uid
+            else:
+                k -= left + 1
+                node = node.right
+        return None
+
+    def rank(self, key):
+        """Počet klíčů menších než key."""
+        node, result = self.root, 0
+        while node:
+            if key <= node.key:
+                node = node.left
+            else:
+                result += _size(node.left) + 1
+                node = node.right
+        return result
+
+    def prefix(self, k):
+        """Součet délek prvních k prvků."""
+        node, result = self.root, 0.0
+        while node and k > 0:
+            left = _size(node.left)
+            if k <= left:
+                node = node.left
+            else:
+                result += _total(node.left) + node.weight
+                k -= left + 1
+                node = node.right
+        return result
+
+    def total(self):
+        return _total(self.root)
+
+    def items(self):
+        stack, node = [], self.root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.key, node.uid
+            node = node.right
+
+
+def _next_float(value):
+    return math.nextafter(value, math.inf)
+
+
+class QueueStore:
+    def __init__(self, path: str, max_history: int, default_duration: float = 0.0, key_of=None):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.max_history = max_history
+        self.default_duration = default_duration  # odhad délky skladby, kterou neznáme
+        self._lock = threading.RLock()
+        self._records = {}  # uid -> položka (bez "id")
+        self._order = _OrderIndex()
+        self._by_user = defaultdict(dict)  # uživatel -> {uid: None} v pořadí přidání
+        self._key_of = key_of or (lambda record: record.get("klic"))  # klíč skladby pro hledání duplicit
+        self._by_key = defaultdict(dict)  # klíč skladby -> {uid: None}
+        self._by_path = defaultdict(dict)  # cesta k souboru -> {uid: None}
+        self._history = 0  # kolik položek je v historii (ty mají záporné id)
+        self._next_uid = 1
+        self._journal_lines = 0
+        self._load()
+
+    # --- načtení a zápis ---
+
+    def _load(self):
+        snapshot = []
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    snapshot = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                snapshot = []
+        # Starý queue.json nemá uid ani poradi: pořadí dává samotné id
+        snapshot = [item for item in snapshot if isinstance(item, dict) and isinstance(item.get("id"), int)]
+        snapshot.sort(key=lambda item: item["id"])
+        legacy = any("uid" not in item or "poradi" not in item for item in snapshot)
+        self._history = sum(1 for item in snapshot if item["id"] < 0)
+        for index, item in enumerate(snapshot):
+            record = {k: v for k, v in item.items() if k != "id"}
+            if legacy:
+                record["uid"] = index + 1
+                record["poradi"] = float(index)
+            self._index(record)
+
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        change = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # useknutý poslední řádek po pádu
+                    self._apply(change)
+                    replayed += 1
+        if replayed or legacy:
+            self._compact()
+
+    def _apply(self, change):
+        for uid in change.get("del", []):
+            self._unindex(uid)
+        for record in change.get("put", []):
+            self._put(record)
+        if "historie" in change:
+            self._history = change["historie"]
+
+    def _index(self, record):
+        self._next_uid = max(self._next_uid, record["uid"] + 1)
+        self._records[record["uid"]] = record
+        self._order.insert(record["poradi"], record["uid"], self._weight(record))
+        self._by_user[record.get("pridal")][record["uid"]] = None
+        self._index_lookup(record)
+
+    def _index_lookup(self, record):
+        key, path = self._key_of(record), record.get("cesta_k_souboru")
+        if key is not None:
+            self._by_key[key][record["uid"]] = None
+        if path:
+            self._by_path[path][record["uid"]] = None
+
+    def _unindex_lookup(self, record):
+        for index, value in ((self._by_key, self._key_of(record)), (self._by_path, record.get("cesta_k_souboru"))):
+            owned = index.get(value) if value else None
+            if owned is not None:
+                owned.pop(record["uid"], None)
+                if not owned:
+                    del index[value]
+
+    def _weight(self, record):
+        return float(record.get("delka") or self.default_duration)
+
+    def _put(self, record):
+        """Vloží nebo nahradí položku; u existující zachová pořadí v indexu uživatele."""
+        old = self._records.get(record["uid"])
+        if old is None or old.get("pridal") != record.get("pridal"):
+            self._unindex(record["uid"])
+            self._index(record)
+            return
+        self._order.remove(old["poradi"])
+        self._unindex_lookup(old)
+        self._records[record["uid"]] = record
+        self._order.insert(record["poradi"], record["uid"], self._weight(record))
+        self._index_lookup(record)
+
+    def _unindex(self, uid):
+        record = self._records.pop(uid, None)
+        if record is None:
+            return None
+        self._order.remove(record["poradi"])
+        self._unindex_lookup(record)
+        owned = self._by_user.get(record.get("pridal"))
+        if owned is not None:
+            owned.pop(uid, None)
+            if not owned:
+                del self._by_user[record.get("pridal")]
+        return record
+
+    def _write(self, put=(), delete=(), history=None):
+        """Jeden řádek žurnálu na jednu změnu (jen dotčené položky)."""
+        change = {}
+        if put:
+            change["put"] = list(put)
+        if delete:
+            change["del"] = list(delete)
+        if history is not None:
+            change["historie"] = history
+        if not change:
+            return
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(change, ensure_ascii=False) + "\n")
+        self._journal_lines += 1
+        if self._journal_lines > max(JOURNAL_COMPACT_MIN, 2 * len(self._records)):
+            self._compact()
+
+    def _compact(self):
+        """Zapíše celý snímek (atomicky přes dočasný soubor) a vyprázdní žurnál."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        with open(self.journal_path, "w", encoding="utf-8"):
+            pass
+        self._journal_lines = 0
+
+    # --- čtení ---
+
+    def _at(self, entry_id):
+        found = self._order.kth(self._history + entry_id) if self._history + entry_id >= 0 else None
+        return self._records[found[1]] if found else None
+
+    def _id_of(self, record):
+        return self._order.rank(record["poradi"]) - self._history
+
+    def _view(self, record, entry_id):
+        item = {"id": entry_id}
+        item.update(record)
+        return item
+
+    def __len__(self):
+        return len(self._records)
+
+    def snapshot(self):
+        """Celá fronta v pořadí jako list položek s id (kopie)."""
+        with self._lock:
+            return [self._view(self._records[uid], rank - self._history)
+                    for rank, (_key, uid) in enumerate(self._order.items())]
+
+    def get(self, entry_id: int):
+        with self._lock:
+            record = self._at(entry_id)
+            return self._view(record, entry_id) if record else None
+
+    def id_of(self, uid: int):
+        """Aktuální id položky podle uid, None když už ve frontě není."""
+        with self._lock:
+            record = self._records.get(uid)
+            return self._id_of(record) if record else None
+
+    def upcoming_of_user(self, user_id):
+        """Id čekajících (id > 0) položek uživatele, seřazená podle pozice."""
+        with self._lock:
+            ids = (self._id_of(self._records[uid]) for uid in self._by_user.get(user_id, {}))
+            return sorted(entry_id for entry_id in ids if entry_id > 0)
+
+    def seconds_until(self, entry_id: int) -> float:
+        """Součet délek čekajících skladeb před položkou entry_id (bez zbytku aktuální)."""
+        with self._lock:
+            first = self._history + 1
+            return self._order.prefix(max(first, self._history + entry_id)) - self._order.prefix(first)
+
+    def upcoming_seconds(self) -> float:
+        """Součet délek všech čekajících skladeb (id > 0)."""
+        with self._lock:
+            return self._order.total() - self._order.prefix(self._history + 1)
+
+    def upcoming(self, limit: int):
+        """Prvních limit čekajících položek (id 1, 2, …) bez kopírování celé fronty."""
+        with self._lock:
+            items = []
+            for entry_id in range(1, limit + 1):
+                item = self.get(entry_id)
+                if item is None:
+                    break
+                items.append(item)
+            return items
+
+    def find(self, key=None, path=None, min_id: int = 0):
+        """
+        Položka s klíčem key nebo souborem path (s id >= min_id, nejnižší id), jinak None.
+        Hledá přes index, bez procházení fronty.
+        """
+        with self._lock:
+            uids = set(self._by_key.get(key, ())) if key is not None else set()
+            if path:
+                uids.update(self._by_path.get(path, ()))
+            best = None
+            for uid in uids:
+                entry_id = self._id_of(self._records[uid])
+                if entry_id >= min_id and (best is None or entry_id < best[0]):
+                    best = (entry_id, uid)
+            return self._view(self._records[best[1]], best[0]) if best else None
+
+    def has_path(self, path) -> bool:
+        """Ukazuje na soubor některá položka (i z historie)?"""
+        with self._lock:
+            return path in self._by_path
+
+    def uids_with_path(self, path) -> list:
+        with self._lock:
+            return list(self._by_path.get(path, ()))
+
+    def next_id(self) -> int:
+        """Id, které by dostala nově přidaná položka na konec fronty."""
+        with self._lock:
+            return len(self._records) - self._history
+
+    def last_of_user(self, user_id):
+        """Id poslední čekající (id > 0) položky, kterou přidal uživatel, jinak None."""
+        with self._lock:
+            for uid in reversed(self._by_user.get(user_id, {})):
+                entry_id = self._id_of(self._records[uid])
+                if entry_id > 0:
+                    return entry_id
+            return None
+
+    # --- změny ---
+
+    def _key_before(self, rank):
+        """Klíč pořadí pro vložení na pozici rank (mezi sousedy)."""
+        size = len(self._order)
+        if size == 0:
+            return 0.0
+        if rank >= size:
+            return self._order.kth(size - 1)[0] + 1.0
+        after = self._order.kth(rank)[0]
+        if rank == 0:
+            return after - 1.0
+        before = self._order.kth(rank - 1)[0]
+        key = (before + after) / 2
+        if before < key < after:
+            return key
+        # Došla přesnost mezi sousedy (stovky vložení na stejné místo): přečísluj vše
+        self._renumber()
+        return self._key_before(rank)
+
+    def _renumber(self):
+        records = [self._records[uid] for _key, uid in self._order.items()]
+        self._order = _OrderIndex()
+        for index, record in enumerate(records):
+            record["poradi"] = float(index)
+            self._order.insert(record["poradi"], record["uid"], self._weight(record))
+        self._compact()
+
+    def insert(self, fields: dict, entry_id=None) -> int:
+        """
+        Vloží položku na pozici entry_id (stávající položky od ní se posunou),
+        bez entry_id na konec. Pozice se omezí na rozsah od aktuální skladby po konec.
+        Vrací id nové položky.
+        """
+        with self._lock:
+            size = len(self._order)
+            rank = size if entry_id is None else min(max(self._history + entry_id, self._history), size)
+            record = {k: v for k, v in fields.items() if k != "id"}
+            record["uid"] = self._next_uid
+            record["poradi"] = self._key_before(rank)
+            self._index(record)
+            self._write(put=[record])
+            return rank - self._history
+
+    def remove(self, entry_id: int):
+        """Odebere položku s daným id a vrátí ji (None, když neexistuje)."""
+        with self._lock:
+            record = self._at(entry_id)
+            if record is None:
+                return None
+            if entry_id < 0:
+                self._history -= 1
+            self._unindex(record["uid"])
+            self._write(delete=[record["uid"]], history=self._history if entry_id < 0 else None)
+            return self._view(record, entry_id)
+
+    def move(self, from_id: int, to_id: int):
+        """Přesune čekající položku z from_id na to_id (mění se jen její klíč pořadí)."""
+        with self._lock:
+            record = self._at(from_id)
+            if from_id <= 0 or to_id <= 0 or record is None or self._at(to_id) is None:
+                return None
+            self._order.remove(record["poradi"])
+            record = dict(record, poradi=self._key_before(self._history + to_id))
+            self._order.insert(record["poradi"], record["uid"], self._weight(record))
+            self._records[record["uid"]] = record
+            self._write(put=[record])
+            return self._view(record, to_id)
+
+    def update(self, uid: int, **fields):
+        with self._lock:
+            record = self._records.get(uid)
+            if record is None:
+                return
+            record = dict(record, **fields)
+            self._put(record)
+            self._write(put=[record])
+
+    def advance(self):
+        """
+        Aktuální skladba jde do historie (další na řadě se stává aktuální).
+        Vrací (položka, která dohrála/byla přeskočena, nebo None; položky vypadlé z historie).
+        Bez aktuální skladby se nic nemění (id jsou souvislá, historie se neposouvá
+        "naprázdno" jako u starého queue.json, kde po tom zůstala díra na -1).
+        """
+        with self._lock:
+            current = self._at(0)
+            if current is None:
+                return None, []
+            finished = self._view(current, -1)
+            self._history += 1
+            dropped = []
+            while self._history > self.max_history:
+                oldest = self._order.kth(0)[1]
+                dropped.append(self._view(self._unindex(oldest), -self._history))
+                self._history -= 1
+            self._write(delete=[item["uid"] for item in dropped], history=self._history)
+            return finished, dropped
+
+    def rewind(self):
+        """Poslední skladba z historie se vrátí jako aktuální; vrací ji, nebo None."""
+        with self._lock:
+            if self._history == 0:
+                return None
+            self._history -= 1
+            self._write(history=self._history)
+            return self.get(0)
@@ -0,0 +1,124 @@
+# RequestHistory.py
+# -*- coding: utf-8 -*-
+"""
+Historie žádostí a přehrání – append-only soubor, jeden řádek na událost:
+
+    čas<TAB>událost<TAB>uživatel<TAB>klíč skladby
+
+Události:
+- "hit"  žádost obsloužená bez čekání na stažení (soubor už byl v knihovně / ve frontě),
+- "miss" žádost, kvůli které se muselo stahovat,
+- "done" skladba dohrála,
+- "skip" skladba byla přeskočena.
+
+Z historie se počítá oblíbenost (žádosti a dohrání s exponenciálním útlumem podle
+stáří, přeskočení ubírají) a úspěšnost cache (podíl "hit" mezi žádostmi). Soubor se
+čte jen jednou (při prvním dotazu), dál se souhrny – skóre na klíč a počty žádostí
+po dnech – udržují v paměti při každém zápisu.
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+
+EVENT_WEIGHTS = {"hit": 1.0, "miss": 1.0, "done": 0.5, "skip": -0.5}
+
+
+class RequestHistory:
+    def __init__(self, path: str, half_life_days: float):
+        self.path = path
+        self.half_life_sec = half_life_days * 86400
+        self._lock = threading.Lock()
+        self._scores = None  # klíč -> [skóre, k času]; None = soubor ještě nenačten
+        self._days = defaultdict(lambda: [0, 0])  # den (od epochy) -> [hit, hit + miss]
+
+    def _add(self, when: int, event: str, key: str):
+        """Započítá událost do souhrnů (volat pod self._lock)."""
+        entry = self._scores.get(key)
+        weight = EVENT_WEIGHTS.get(event, 0.0)
+        if entry is None:
+            self._scores[key] = [weight, when]
+        elif when >= entry[1]:
+            entry[0] = entry[0] * 0.5 ** ((when - entry[1]) / self.half_life_sec) + weight
+            entry[1] = when
+        else:
+            entry[0] += weight * 0.5 ** ((entry[1] - when) / self.half_life_sec)
+        if event in ("hit", "miss"):
+            counts = self._days[when // 86400]
+            counts[0] += event == "hit"
+            counts[1] += 1
+
+    def _ensure_loaded(self):
+        """Jednou projde soubor a sestaví souhrny (volat pod self._lock)."""
+        if self._scores is not None:
+            return
+        self._scores = {}
+        for when, event, _user, key in self._read(0):
+            self._add(when, event, key)
+
+    def record(self, event: str, key, user_id=None, when=None):
+        """Připíše událost; bez kanonického klíče skladby se nic nezapisuje."""
+        if not key:
+            return
+        user = str(user_id).replace("\t", " ") if user_id is not None else "-"
+        when = int(when or time.time())
+        line = f"{when}\t{event}\t{user}\t{key}\n"
+        with self._lock:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError:
+                pass
+            if self._scores is not None:
+                self._add(when, event, key)
+
+    def events(self, since: float = 0):
+        """Vrací seznam (čas, událost, uživatel, klíč) od zadaného času (čte celý soubor)."""
+        with self._lock:
+            return self._read(since)
+
+    def _read(self, since: float):
+        result = []
+        if not os.path.exists(self.path):
+            return result
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 4:
+                    continue  # useknutý poslední řádek po pádu
+                try:
+                    when = int(parts[0])
+                except ValueError:
+                    continue
+                if when >= since:
+                    result.append((when, parts[1], parts[2], parts[3]))
+        return result
+
+    def popularity(self, now=None):
+        """Klíče seřazené podle oblíbenosti: [(klíč, skóre)], jen kladná skóre."""
+        now = now or time.time()
+        with self._lock:
+            self._ensure_loaded()
+            ranked = [(key, score * 0.5 ** (max(0.0, now - at) / self.half_life_sec))
+                      for key, (score, at) in self._scores.items() if score > 0]
+        ranked.sort(key=lambda pair: pair[1], reverse=True)
+        return ranked
+
+    def keys(self) -> set:
+        """Klíče všech skladeb, které se v historii objevily."""
+        with self._lock:
+            self._ensure_loaded()
+            return set(self._scores)
+
+    def hit_rate(self, days: float):
+        """(žádosti bez čekání, všechny žádosti) za posledních days dní (po celých dnech)."""
+        since_day = int(time.time() - days * 86400) // 86400
+        hits = total = 0
+        with self._lock:
+            self._ensure_loaded()
+            for day, (day_hits, day_total) in self._days.items():
+                if day >= since_day:
+                    hits += day_hits
+                    total += day_total
+        return hits, total
@@ -0,0 +1,205 @@
+# Scheduler.py
+# -*- coding: utf-8 -*-
+"""
+Jeden plánovač pro veškerou periodickou a časovanou práci (kontrola IG zpráv,
+předem stahování...), místo samostatných vláken s pevným time.sleep.
+
+- Časovače jsou v haldě podle termínu, vlákno plánovače spí přesně do nejbližšího
+  termínu (nebo do přidání dřívějšího časovače) – bez práce se vůbec nebudí.
+- Slučování: při probuzení se spustí i časovače, kterým termín přijde do jejich
+  tolerance (slack), takže blízké termíny obslouží jedno probuzení.
+- Úlohy běží v malém poolu vláken, aby dlouhá úloha (stahování) nezdržela ostatní;
+  periodická úloha se znovu naplánuje až po doběhnutí (nikdy neběží dvakrát naráz).
+  Když úloha vrátí číslo, další běh bude za tolik sekund (např. čekání na jistič).
+- Vlákna, která čekají na události jinde (přehrávač na VLC), hlásí svá probuzení
+  přes record(); status_text() pak ukáže probuzení za minutu za celý proces.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_PARALLEL_JOBS = 4  # kolik naplánovaných úloh smí běžet současně
+SLACK_RATIO = 0.1  # výchozí tolerance časovače jako podíl intervalu
+MAX_SLACK_SEC = 30.0
+WAKEUP_WINDOW_SEC = 60  # z jakého okna počítat probuzení za minutu
+
+SCHEDULER_SOURCE = "plánovač"
+
+
+class Timer:
+    def __init__(self, name: str, fn, interval, slack: float):
+        self.name = name
+        self.fn = fn
+        self.interval = interval  # None = jednorázový
+        self.slack = slack
+        self.due = 0.0
+        self.runs = 0
+        self.running = False
+        self.cancelled = False
+        self.last_error = None
+
+    def cancel(self):
+        self.cancelled = True
+
+
+_heap = []  # (termín, pořadí, časovač)
+_seq = itertools.count()
+_timers = []
+_cond = threading.Condition()
+_thread = None
+_executor = None
+
+_wakeups = deque(maxlen=10000)  # (čas, zdroj)
+_wakeup_totals = {}
+_wakeups_lock = threading.Lock()
+
+
+def _default_slack(interval) -> float:
+    return min(MAX_SLACK_SEC, (interval or 0) * SLACK_RATIO)
+
+
+def _push(timer: Timer, delay: float):
+    """Zařadí časovač za delay sekund; vlákno plánovače vzbudí jen při novém nejbližším termínu."""
+    timer.due = time.monotonic() + max(0.0, delay)
+    with _cond:
+        earliest = _heap[0][0] if _heap else None
+        heapq.heappush(_heap, (timer.due, next(_seq), timer))
+        if earliest is None or timer.due < earliest:
+            _cond.notify()
+    _ensure_started()
+
+
+def _ensure_started():
+    global _thread, _executor
+    with _cond:
+        if _thread is not None:
+            return
+        _executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_JOBS, thread_name_prefix="plánovač")
+        _thread = threading.Thread(target=_loop, name="plánovač", daemon=True)
+        _thread.start()
+
+
+def every(name: str, interval: float, fn, first_delay=None, slack=None) -> Timer:
+    """Spouští fn() každých interval sekund (počítáno od doběhnutí předchozího běhu)."""
+    timer = Timer(name, fn, interval, _default_slack(interval) if slack is None else slack)
+    with _cond:
+        _timers.append(timer)
+    _push(timer, interval if first_delay is None else first_delay)
+    return timer
+
+
+def after(name: str, delay: float, fn, slack=None) -> Timer:
+    """Spustí fn() jednou za delay sekund."""
+    timer = Timer(name, fn, None, _default_slack(delay) if slack is None else slack)
+    with _cond:
+        _timers.append(timer)
+    _push(timer, delay)
+    return timer
+
+
+def record(source: str):
+    """Započítá probuzení vlákna, které čeká mimo plánovač (do hlášení probuzení za minutu)."""
+    now = time.monotonic()
+    with _wakeups_lock:
+        _wakeups.append((now, source))
+        _wakeup_totals[source] = _wakeup_totals.get(source, 0) + 1
+
+
+def _loop():
+    while True:
+        with _cond:
+            while True:
+                while _heap and _heap[0][2].cancelled:
+                    cancelled = heapq.heappop(_heap)[2]
+                    if cancelled in _timers:
+                        _timers.remove(cancelled)
+                timeout = _heap[0][0] - time.monotonic() if _heap else None
+                if timeout is not None and timeout <= 0:
+                    break
+                _cond.wait(timeout)
+                record(SCHEDULER_SOURCE)
+            # Spusť vše, co je na řadě, i s termínem v toleranci (slučování blízkých časovačů)
+            now = time.monotonic()
+            due = []
+            for entry in list(_heap):
+                timer = entry[2]
+                if not timer.cancelled and timer.due - timer.slack <= now:
+                    due.append(entry)
+            for entry in due:
+                _heap.remove(entry)
+            heapq.heapify(_heap)
+        for _due, _order, timer in due:
+            timer.running = True
+            _executor.submit(_run, timer)
+
+
+def _run(timer: Timer):
+    next_delay = timer.interval
+    try:
+        result = timer.fn()
+        timer.last_error = None
+        if isinstance(result, (int, float)) and not isinstance(result, bool):
+            next_delay = result
+    except Exception as e:
+        timer.last_error = f"{type(e).__name__}: {e}"[:200]
+        print(f"❌ Chyba v naplánované úloze {timer.name}: {e}")
+    finally:
+        timer.runs += 1
+        timer.running = False
+    if timer.interval is None or timer.cancelled:
+        with _cond:
+            if timer in _timers:
+                _timers.remove(timer)
+        return
+    _push(timer, next_delay)
+
+
+def wakeups_per_minute() -> dict:
+    """Zdroj -> počet probuzení za posledních WAKEUP_WINDOW_SEC (přepočteno na minutu)."""
+    since = time.monotonic() - WAKEUP_WINDOW_SEC
+    counts = {}
+    with _wakeups_lock:
+        for at, source in _wakeups:
+            if at >= since:
+                counts[source] = counts.get(source, 0) + 1
+    return {source: count * 60 / WAKEUP_WINDOW_SEC for source, count in counts.items()}
+
+
+def status() -> dict:
+    """Stav pro monitoring: časovače s termíny a probuzení za minutu."""
+    now = time.monotonic()
+    with _cond:
+        timers = list(_timers)
+    with _wakeups_lock:
+        totals = dict(_wakeup_totals)
+    return {
+        "casovace": [{
+            "nazev": t.name,
+            "interval_sec": t.interval,
+            "dalsi_za_sec": None if t.running else round(max(0.0, t.due - now), 1),
+            "bezi": t.running,
+            "behu": t.runs,
+            "posledni_chyba": t.last_error,
+        } for t in timers if not t.cancelled],
+        "probuzeni_za_minutu": wakeups_per_minute(),
+        "probuzeni_celkem": totals,
+    }
+
+
+def status_text() -> str:
+    state = status()
+    per_minute = state["probuzeni_za_minutu"]
+    lines = [f"⏰ Probuzení za minutu celkem: {sum(per_minute.values()):.0f}"]
+    for source, count in sorted(per_minute.items(), key=lambda item: -item[1]):
+        lines.append(f"  • {source}: {count:.0f}/min (celkem {state['probuzeni_celkem'].get(source, 0)})")
+    for t in state["casovace"]:
+        when = "právě běží" if t["bezi"] else f"další za {t['dalsi_za_sec']:.0f} s"
+        line = f"  ⏱️ {t['nazev']}: {when}, běhů {t['behu']}"
+        if t["posledni_chyba"]:
+            line += f" ({t['posledni_chyba']})"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,224 @@
+# ServiceGuard.py
+# -*- coding: utf-8 -*-
+"""
+Ochrana externích služeb (YouTube, SoundCloud, Spotify, Instagram) sdílená celým procesem.
+
+Každá služba má:
+- token bucket: nejvýš SERVICE_LIMITS[služba] žádostí za sekundu (s nárazovou rezervou);
+  na volný token se čeká nejvýš MAX_WAIT_SEC, jinak se žádost hned odmítne,
+- jistič (circuit breaker): po FAILURE_THRESHOLD chybách služby v řadě (omezení 429,
+  výpadky sítě, timeouty) se rozpojí a nové žádosti hned selžou s ServiceUnavailable
+  (text je určený pro chat). Po pauze pustí jednu zkušební žádost; když projde, jistič
+  se sepne, když ne, pauza se zdvojnásobí (OPEN_BASE_SEC .. OPEN_MAX_SEC).
+
+Chyby, které se službou nesouvisí (neexistující video, nepodporovaný odkaz), jistič
+nepočítá – služba přece odpověděla. Stav všech služeb vrací status() / status_text().
+"""
+
+import random
+import threading
+import time
+
+# služba: (žádostí za sekundu, nárazově najednou)
+SERVICE_LIMITS = {
+    "youtube": (2.0, 8),
+    "soundcloud": (2.0, 8),
+    "spotify": (5.0, 10),
+    "instagram": (1.0, 5),
+}
+DEFAULT_LIMIT = (2.0, 8)
+MAX_WAIT_SEC = 20  # déle na token nečekat, raději žádost hned odmítnout
+FAILURE_THRESHOLD = 5  # kolik chyb služby v řadě jistič rozpojí
+OPEN_BASE_SEC = 15  # první pauza po rozpojení, s každým dalším neúspěchem se zdvojnásobí
+OPEN_MAX_SEC = 10 * 60
+
+SERVICE_NAMES = {"youtube": "YouTube", "soundcloud": "SoundCloud", "spotify": "Spotify", "instagram": "Instagram"}
+
+
+class ServiceUnavailable(Exception):
+    """Služba je dočasně vypnutá jističem nebo přetížená; text je určen pro uživatele."""
+
+    def __init__(self, service: str, retry_after: float):
+        self.service = service
+        self.retry_after = retry_after
+        super().__init__(f"{SERVICE_NAMES.get(service, service)} teď nereaguje nebo nás omezuje, "
+                         f"zkus to prosím za ~{max(1, int(retry_after + 0.5))} s.")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, max_wait: float):
+        """Zarezervuje token a vrátí, kolik sekund počkat; None, když by se čekalo déle než max_wait."""
+        with self._lock:
+            self._refill()
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= 1  # záporný stav = tokeny slíbené čekajícím
+            return wait
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = FAILURE_THRESHOLD):
+        self.threshold = threshold
+        self.state = "zapnuto"  # zapnuto | vypnuto | zkouší
+        self.failures = 0  # chyby v řadě
+        self.trips = 0  # rozpojení v řadě (pro prodlužování pauzy)
+        self.open_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def acquire(self, service: str) -> bool:
+        """
+        Pustí žádost dál (vrací True, když je to zkušební žádost), nebo vyhodí
+        ServiceUnavailable (vypnuto / právě běží zkušební žádost).
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "vypnuto":
+                if now < self.open_until:
+                    raise ServiceUnavailable(service, self.open_until - now)
+                self.state = "zkouší"
+            if self.state == "zkouší":
+                if self._probing:
+                    raise ServiceUnavailable(service, OPEN_BASE_SEC)
+                self._probing = True
+                return True
+        return False
+
+    def release(self, probe: bool = True):
+        """Povolená žádost se nakonec vůbec neposlala, nebo selhala jen ona sama (stav se nemění)."""
+        if not probe:
+            return
+        with self._lock:
+            self._probing = False
+
+    def success(self):
+        with self._lock:
+            self.state = "zapnuto"
+            self.failures = self.trips = 0
+            self._probing = False
+
+    def failure(self, probe: bool = False):
+        with self._lock:
+            self.failures += 1
+            if probe:
+                self._probing = False
+            if self.state == "vypnuto" or (self.state == "zkouší" and not probe):
+                return  # žádosti rozběhnuté před rozpojením: jen počítat, pauzu neprodlužovat
+            if self.state == "zkouší" or self.failures >= self.threshold:
+                self.trips += 1
+                pause = min(OPEN_MAX_SEC, OPEN_BASE_SEC * 2 ** (self.trips - 1))
+                self.open_until = time.monotonic() + pause * random.uniform(0.9, 1.1)
+                self.state = "vypnuto"
+
+
+class Service:
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker()
+        self.calls = 0
+        self.rejected = 0
+        self.last_error = None
+
+    def call(self, fn, is_failure=lambda error: True):
+        """
+        Zavolá fn() přes limiter a jistič. is_failure(výjimka) rozhoduje, zda chyba
+        svědčí o problému služby (počítá se do jističe), nebo jen o konkrétní žádosti.
+        """
+        try:
+            probe = self.breaker.acquire(self.name)
+        except ServiceUnavailable:
+            self.rejected += 1
+            raise
+        wait = self.bucket.reserve(MAX_WAIT_SEC)
+        if wait is None:
+            self.breaker.release(probe)
+            self.rejected += 1
+            raise ServiceUnavailable(self.name, MAX_WAIT_SEC)
+        if wait:
+            time.sleep(wait)
+
+        self.calls += 1
+        try:
+            result = fn()
+        except Exception as e:
+            if is_failure(e):
+                self.last_error = f"{type(e).__name__}: {e}"[:200]
+                self.breaker.failure(probe)
+            else:
+                # Chyba konkrétní žádosti (smazané video) o stavu služby nic neříká
+                self.breaker.release(probe)
+            raise
+        self.breaker.success()
+        return result
+
+    def status(self) -> dict:
+        breaker = self.breaker
+        return {
+            "sluzba": self.name,
+            "stav": breaker.state,
+            "chyby_v_rade": breaker.failures,
+            "vypnuto_jeste_sec": round(max(0.0, breaker.open_until - time.monotonic()), 1)
+            if breaker.state == "vypnuto" else 0.0,
+            "tokeny": round(self.bucket.available(), 1),
+            "volani": self.calls,
+            "odmitnuto": self.rejected,
+            "posledni_chyba": self.last_error,
+        }
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get(name: str) -> Service:
+    with _services_lock:
+        if name not in _services:
+            _services[name] = Service(name, *SERVICE_LIMITS.get(name, DEFAULT_LIMIT))
+        return _services[name]
+
+
+def call(name: str, fn, is_failure=lambda error: True):
+    """Zkratka: get(name).call(fn, is_failure)."""
+    return get(name).call(fn, is_failure)
+
+
+def status(names=None) -> list:
+    """Stav služeb pro monitoring (jen ty, které už byly použité, nebo vyjmenované)."""
+    with _services_lock:
+        services = [s for name, s in sorted(_services.items()) if names is None or name in names]
+    return [s.status() for s in services]
+
+
+def status_text(names=None) -> str:
+    icons = {"zapnuto": "🟢", "zkouší": "🟡", "vypnuto": "🔴"}
+    lines = []
+    for s in status(names):
+        line = (f"{icons[s['stav']]} {SERVICE_NAMES.get(s['sluzba'], s['sluzba'])}: {s['stav']}, "
+                f"volání {s['volani']}, odmítnuto {s['odmitnuto']}")
+        if s["stav"] == "vypnuto":
+            line += f", další pokus za {s['vypnuto_jeste_sec']:.0f} s"
+        elif s["chyby_v_rade"]:
+            line += f", chyby v řadě {s['chyby_v_rade']}"
+        if s["posledni_chyba"] and s["stav"] != "zapnuto":
+            line += f" ({s['posledni_chyba']})"
+        lines.append(line)
+    return "\n".join(lines)
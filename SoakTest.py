@@ -0,0 +1,311 @@
+# SoakTest.py
+# -*- coding: utf-8 -*-
+"""
+Dlouhý zátěžový (soak) test přehrávače na únik prostředků.
+
+Prožene tisíce cyklů přidání / přehrání / přeskočení / návratu skrz skutečný kód
+UniversalMusicPlayer (add_link_to_queue, play_song, skip_song, play_previous_song,
+update_queue). Síť a zvukový výstup jsou nahrazené:
+- yt_dlp.YoutubeDL -> FakeYoutubeDL, který místo stahování zapíše krátký WAV soubor,
+- vlc -> FakeVlc (výchozí), nebo skutečné libvlc s výstupem --aout=dummy (--vlc real).
+
+Průběžně vzorkuje RSS, počet otevřených FD a počet vláken a na konci spočítá
+sklon (nárůst na 1000 cyklů) metodou nejmenších čtverců. Když sklon překročí
+zadaný limit, skončí s návratovým kódem 1 – dá se tedy použít jako regresní brána.
+
+Příklad:
+    python SoakTest.py --cycles 20000 --max-rss-kb 256 --max-fds 0.5 --max-threads 0.5
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+
+# -----------------------------
+# Vzorkování prostředků procesu
+# -----------------------------
+def rss_kb() -> int:
+    """Aktuální RSS procesu v KB (Linux /proc, jinak maximum z getrusage)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def open_fds() -> int:
+    for fd_dir in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(fd_dir))
+        except OSError:
+            continue
+    return -1
+
+
+def slope_per_1k(samples: list, index: int) -> float:
+    """Sklon metriky (na 1000 cyklů) lineární regresí přes vzorky (cyklus, rss, fd, vlákna)."""
+    n = len(samples)
+    if n < 2:
+        return 0.0
+    xs = [s[0] for s in samples]
+    ys = [s[index] for s in samples]
+    mx = sum(xs) / n
+    my = sum(ys) / n
+    var = sum((x - mx) ** 2 for x in xs)
+    if var == 0:
+        return 0.0
+    cov = sum((x - mx) * (y - my) for x, y in zip(xs, ys))
+    return cov / var * 1000
+
+
+# -----------------------------
+# Náhrady sítě a zvukového výstupu
+# -----------------------------
+def _write_silence(path: str, seconds: float = 1.0):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"\0\0" * int(8000 * seconds))
+
+
+class FakeYoutubeDL:
+    """Napodobí yt_dlp.YoutubeDL: extract_info vrátí metadata a při download=True zapíše WAV."""
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _info(self, url):
+        video_id = url.rstrip("/").rsplit("/", 1)[-1].split("=")[-1]
+        return {"id": video_id, "title": f"Soak {video_id}", "ext": "wav", "duration": 1,
+                "webpage_url": f"https://www.youtube.com/watch?v={video_id}"}
+
+    def extract_info(self, url, download=True):
+        info = self._info(url)
+        if download:
+            path = self.prepare_filename(info)
+            for hook in self.params.get("progress_hooks", []):
+                hook({"status": "downloading", "downloaded_bytes": 0, "total_bytes": 16044, "eta": 0})
+            _write_silence(path)
+            for hook in self.params.get("progress_hooks", []):
+                hook({"status": "finished"})
+        return info
+
+    def prepare_filename(self, info):
+        template = self.params.get("outtmpl", "%(title)s.%(ext)s")
+        return template.replace("%(ext)s", info["ext"]).replace("%(title)s", info["title"])
+
+
+class FakeMediaPlayer:
+    def __init__(self, counters):
+        self._counters = counters
+        self._playing = False
+        self._volume = 100
+
+    def set_media(self, media):
+        self._media = media
+
+    def play(self):
+        self._playing = True
+        return 0
+
+    def pause(self):
+        self._playing = False
+
+    def stop(self):
+        self._playing = False
+
+    def is_playing(self):
+        return self._playing
+
+    def audio_set_volume(self, value):
+        self._volume = value
+        return 0
+
+    def get_time(self):
+        return 0
+
+    def event_manager(self):
+        return FakeEventManager()
+
+    def release(self):
+        self._counters["players"] -= 1
+
+
+class FakeEventManager:
+    def event_attach(self, event_type, callback):
+        return 0
+
+
+class FakeMedia:
+    def __init__(self, path):
+        self.path = path
+
+    def release(self):
+        pass
+
+
+class FakeInstance:
+    def __init__(self, counters):
+        self._counters = counters
+
+    def media_player_new(self):
+        self._counters["players"] += 1
+        return FakeMediaPlayer(self._counters)
+
+    def media_new(self, path):
+        return FakeMedia(path)
+
+    def release(self):
+        self._counters["instances"] -= 1
+
+
+class FakeVlc:
+    """Náhrada modulu vlc; počítá vytvořené a neuvolněné instance a přehrávače."""
+
+    class EventType:
+        MediaPlayerPlaying = MediaPlayerPaused = MediaPlayerStopped = None
+        MediaPlayerEndReached = MediaPlayerEncounteredError = None
+
+    def __init__(self):
+        self.counters = {"instances": 0, "players": 0}
+
+    def Instance(self, *args):
+        self.counters["instances"] += 1
+        return FakeInstance(self.counters)
+
+
+class DummyOutputVlc:
+    """Skutečné libvlc, jen se zvukovým výstupem 'dummy' (nic nehraje do reproduktorů)."""
+
+    def __init__(self, vlc_module):
+        self._vlc = vlc_module
+
+    def __getattr__(self, name):
+        return getattr(self._vlc, name)
+
+    def Instance(self, *args):
+        return self._vlc.Instance("--aout=dummy", "--no-video", "--quiet")
+
+
+# -----------------------------
+# Samotný test
+# -----------------------------
+def soak(cycles: int, sample_every: int, vlc_mode: str, unique_tracks: int, seed: int,
+         warmup: float = 0.1) -> list:
+    """Spustí cykly a vrátí vzorky [(cyklus, rss_kb, fd, vlákna)]."""
+    workdir = tempfile.mkdtemp(prefix="ump_soak_")
+    os.environ["IG_COOLDOWN_DB"] = os.path.join(workdir, "cooldown.db")
+    import UniversalMusicPlayer as ump
+
+    ump.QUEUE_FILE = os.path.join(workdir, "queue.json")
+    ump.DOWNLOAD_DIR = os.path.join(workdir, "downloaded_music")
+    ump.LIBRARY_FILE = os.path.join(workdir, "library.json")
+    ump.FINGERPRINT_FILE = os.path.join(workdir, "fingerprints.db")
+    ump.REQUEST_HISTORY_FILE = os.path.join(workdir, "history.log")
+    ump.YTDLP_WORKERS = 0  # yt-dlp přímo v procesu, aby platila náhrada níže
+    ump.YtdlpWorkers.yt_dlp.YoutubeDL = FakeYoutubeDL
+    ump.YtdlpWorkers.PERSISTENT_INSTANCES = False  # náhrada neumí měnit volby za běhu
+    ump.ServiceGuard.SERVICE_LIMITS = {}  # falešné stahování nemá smysl brzdit limiterem
+    ump.ServiceGuard.DEFAULT_LIMIT = (1e6, 1e6)
+    fake_vlc = None
+    if vlc_mode == "real":
+        ump.vlc = DummyOutputVlc(ump.vlc)
+    else:
+        fake_vlc = ump.vlc = FakeVlc()
+    os.makedirs(ump.DOWNLOAD_DIR, exist_ok=True)
+    ump.should_play = True
+
+    rnd = random.Random(seed)
+    # Operace a jejich váhy; "end" = skladba dohrála (to, co dělá player_loop)
+    ops = [
+        ("enqueue", 4, lambda i: ump.add_link_to_queue(f"https://youtu.be/soak{rnd.randrange(unique_tracks):07d}")),
+        ("play", 2, lambda i: ump.play_song()),
+        ("skip", 3, lambda i: ump.skip_song()),
+        ("previous", 1, lambda i: ump.play_previous_song()),
+        ("end", 2, lambda i: ump.update_queue()),
+    ]
+    names = [op[0] for op in ops]
+    weights = [op[1] for op in ops]
+    actions = {op[0]: op[2] for op in ops}
+    counts = dict.fromkeys(names, 0)
+    errors = 0
+
+    samples = []
+    start = time.time()
+    devnull = open(os.devnull, "w")
+    real_stdout = sys.stdout
+    try:
+        for i in range(1, cycles + 1):
+            name = rnd.choices(names, weights)[0]
+            sys.stdout = devnull  # přehrávač je ukecaný, výpis by test zpomaloval
+            try:
+                actions[name](i)
+                counts[name] += 1
+            except Exception:
+                errors += 1
+            finally:
+                sys.stdout = real_stdout
+            if i % sample_every == 0:
+                samples.append((i, rss_kb(), open_fds(), threading.active_count()))
+                if i % (sample_every * 10) == 0:
+                    print(f"  cyklus {i}: RSS {samples[-1][1]} KB, FD {samples[-1][2]}, "
+                          f"vlákna {samples[-1][3]}, {i / (time.time() - start):.0f} cyklů/s")
+    finally:
+        sys.stdout = real_stdout
+        devnull.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"  operace: {counts}, chyb: {errors}")
+    if fake_vlc is not None:
+        print(f"  neuvolněné VLC objekty: instance {fake_vlc.counters['instances']}, "
+              f"přehrávače {fake_vlc.counters['players']}")
+    # Začátek (plnění cache, první importy) do sklonu nepočítáme
+    return samples[int(len(samples) * warmup):]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test UniversalMusicPlayer na únik paměti, FD a vláken")
+    parser.add_argument("--cycles", type=int, default=10000)
+    parser.add_argument("--sample-every", type=int, default=100)
+    parser.add_argument("--vlc", choices=("fake", "real"), default="fake",
+                        help="fake = bez libvlc, real = libvlc s --aout=dummy")
+    parser.add_argument("--unique-tracks", type=int, default=50,
+                        help="kolik různých skladeb se střídá (opakování testuje cache a duplicity)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-rss-kb", type=float, default=256.0, help="max. nárůst RSS v KB na 1000 cyklů")
+    parser.add_argument("--max-fds", type=float, default=0.5, help="max. nárůst otevřených FD na 1000 cyklů")
+    parser.add_argument("--max-threads", type=float, default=0.5, help="max. nárůst vláken na 1000 cyklů")
+    args = parser.parse_args()
+
+    print(f"🧪 Soak test: {args.cycles} cyklů, VLC {args.vlc}")
+    samples = soak(args.cycles, args.sample_every, args.vlc, args.unique_tracks, args.seed)
+    limits = [("RSS (KB)", 1, args.max_rss_kb), ("FD", 2, args.max_fds), ("vlákna", 3, args.max_threads)]
+
+    failed = False
+    print("\n📈 Nárůst na 1000 cyklů:")
+    for label, index, limit in limits:
+        slope = slope_per_1k(samples, index)
+        ok = slope <= limit
+        failed = failed or not ok
+        print(f"  {'✅' if ok else '❌'} {label}: {slope:+.2f} (limit {limit:g})")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
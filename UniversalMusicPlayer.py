@@ -1,7 +1,9 @@
+import argparse
+import itertools
 import json
 import os
 import re
-import yt_dlp
+import sys
 import vlc
 import time
 from pathlib import Path
@@ -9,14 +11,93 @@ from urllib.parse import urlparse
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 import threading
+import mutagen
+from rapidfuzz import fuzz, process as fuzz_process, utils as fuzz_utils
+from ytmusicapi import YTMusic
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import AudioFingerprint
+import YtdlpWorkers
+import RequestHistory
+import ServiceGuard
+import Scheduler
+import PlaybackNode
+import QueueStore
+import LanAudio
+import Profiler
 import InstagramBot
 from dotenv import load_dotenv
 
 # Configuration
 QUEUE_FILE = "queue.json"
 DOWNLOAD_DIR = "downloaded_music"
+LIBRARY_FILE = "library.json"  # index stažených souborů (tagy, délka, zdrojový klíč)
+SEARCH_CACHE_FILE = "search_cache.json"  # výsledky vyhledávání podle textu
+FINGERPRINT_FILE = "fingerprints.db"  # akustické otisky pro hledání duplicit mezi zdroji
+REQUEST_HISTORY_FILE = "history.log"  # append-only historie žádostí a přehrání
+AUDIO_EXTENSIONS = {'.m4a', '.webm', '.opus', '.ogg', '.mp3', '.aac', '.flac', '.wav', '.mp4'}
 MAX_HISTORY = 3
 
+# Stahování: opakované pokusy s exponenciálním odstupem
+DOWNLOAD_RETRIES = 4  # kolikrát maximálně zkusit stáhnout jednu skladbu
+DOWNLOAD_BACKOFF_BASE = 2.0  # pauza před prvním opakováním (s), dál se zdvojnásobuje
+DOWNLOAD_BACKOFF_MAX = 30.0  # strop pauzy mezi pokusy (s)
+
+# Co dělat se skladbou, která už čeká ve frontě (nebo právě hraje):
+# "allow" = přidat znovu, "merge" = nepřidávat a jen oznámit, "reject" = odmítnout
+DUPLICATE_POLICY = "merge"
+
+# yt-dlp běží v pracovních procesech (0 = přímo v tomto procesu, bez izolace a limitů)
+YTDLP_WORKERS = 3
+YTDLP_INFO_TIMEOUT_SEC = 60  # tvrdý limit na zjištění metadat / hledání
+YTDLP_DOWNLOAD_TIMEOUT_SEC = 300  # tvrdý limit na jeden pokus o stažení
+
+# Hlídání přehrávání (watchdog)
+PLAY_START_TIMEOUT_SEC = 3.0  # jak dlouho celkem (všechny pokusy) čekat, než se přehrávání rozběhne
+PLAY_START_RETRIES = 2  # na kolik pokusů se ten čas rozdělí, než to vzdáme
+STALL_THRESHOLD_SEC = 2.0  # když se čas přehrávání tak dlouho nehýbe, je to zaseknutí
+# Celkový čas na zotavení jedné skladby (všechny pokusy dohromady); pak se přeskočí,
+# takže ticho po zaseknutí trvá nanejvýš STALL_THRESHOLD_SEC + RECOVERY_TIMEOUT_SEC
+RECOVERY_TIMEOUT_SEC = 2.0
+# Watchdog nekontroluje v pevném intervalu: konec skladby a chybu hlásí VLC událostí hned,
+# čas přehrávání stačí zkontrolovat jednou za STALL_THRESHOLD_SEC (nejdřív po WATCHDOG_MIN_WAIT_SEC)
+WATCHDOG_MIN_WAIT_SEC = 0.2
+PLAYER_IDLE_CHECK_SEC = 60  # pojistka: i bez probuzení se nečinný přehrávač jednou za čas podívá na frontu
+# Postup při chybě/zaseknutí téže skladby: "retry" = znovu od poslední pozice,
+# "redownload" = znovu stáhnout a pokračovat, "skip" = přeskočit (rozbitý soubor se stáhne na pozadí)
+STALL_RECOVERY_POLICY = ("retry", "skip")
+
+# Kontrola souborů fronty po startu
+QUEUE_CHECK_WORKERS = 4  # kolik souborů se ověřuje souběžně
+MIN_AUDIO_BYTES = 16 * 1024  # menší soubor je useknutý nebo prázdný
+
+# Omezení, kolik práce se smí nahromadit (kontroluje se při přijetí odkazu)
+MAX_PENDING_DOWNLOADS = 4  # kolik odkazů se smí najednou vyhledávat/stahovat
+MAX_QUEUED_PLAY_MINUTES = 90  # max. součet délek skladeb čekajících ve frontě
+MAX_TRACKS_PER_USER = 3  # max. čekajících skladeb od jednoho uživatele (admin a konzole neomezeně)
+DEFAULT_TRACK_SECONDS = 210  # odhad délky, když ji ještě neznáme
+
+# Akustické otisky: stejná písnička z jiného zdroje se pozná podle zvuku
+FINGERPRINT_ENABLED = True
+FINGERPRINT_WAIT_SEC = 10  # jak dlouho po stažení čekat na otisk, než skladbu zařadíme i bez něj
+FINGERPRINT_QUEUE_CHECK = True  # uplatnit DUPLICATE_POLICY i na akustické duplicity ve frontě
+
+# Vyhledávání textem ("search interpret - skladba")
+SEARCH_CACHE_TTL_HOURS = 7 * 24  # jak dlouho věřit uloženým výsledkům
+SEARCH_RESULTS = 5  # kolik výsledků si z YouTube Music pamatovat
+LIBRARY_MATCH_SCORE = 85  # min. shoda (0–100) s názvem v knihovně, aby se nehledalo online
+
+# Oblíbené skladby se drží stažené (a chybějící se stahují předem, když se nic neděje)
+CACHE_DISK_BUDGET_MB = 2000  # kolik místa smí zabrat oblíbené skladby mimo frontu
+CACHE_WARM_INTERVAL_SEC = 15 * 60  # jak často přepočítat oblíbenost a dostahovat
+CACHE_WARM_PER_RUN = 5  # max. počet skladeb stažených předem v jednom průchodu
+CACHE_WARM_TOP = 200  # kolik nejoblíbenějších skladeb vůbec zvažovat
+POPULARITY_HALF_LIFE_DAYS = 14  # za jak dlouho žádost ztratí polovinu váhy
+HIT_RATE_DAYS = 7  # období pro hlášení úspěšnosti cache
+
+# Režim uzlu (--node): stahování dělají workery (--worker), tohle jsou jejich limity
+NODE_WORKER_STALE_SEC = 60  # worker, který se tak dlouho neozval, se nepočítá
+NODE_JOB_TIMEOUT_SEC = 20 * 60  # jak dlouho čekat na workera, než žádost vzdáme
+
 # Spotify API credentials - replace with your own
 load_dotenv()
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
@@ -27,90 +108,225 @@ player_instance = None
 current_player = None
 is_paused = True  # Start in paused state
 should_play = False  # Flag to indicate if we should play after adding song
+_playback_generation = 0  # zvýší se při každé změně skladby (přeskočení, návrat, nové spuštění)
+_player_wakeup = threading.Event()  # vzbudí smyčku přehrávače (fronta, ovládání, událost VLC)
+_play_started = threading.Event()  # VLC ohlásilo rozběhnutí nebo chybu média
+
+# Rozpracovaná stahování (číslo stahování -> stav), zobrazuje je výpis fronty;
+# dvě stahování se stejným názvem mají každé svůj záznam
+_downloads = {}
+_download_ids = itertools.count(1)
+_downloads_lock = threading.Lock()
+
+# Knihovna stažených souborů: cesta -> záznam, a klíč skladby -> cesta
+_library = {}
+_library_by_key = {}
+_library_lock = threading.Lock()
+
+# Vyhledávání: uložené výsledky (dotaz -> {"cas", "vysledky"}) a klient YouTube Music
+_search_cache = None
+_search_lock = threading.Lock()
+_ytmusic = None
+
+# Index akustických otisků (načítá se líně) a vlákno, které otisky počítá
+_fingerprint_index = None
+_fingerprint_lock = threading.Lock()
+_fingerprint_executor = None
+
+# Klient Spotify API (vzniká líně, sdílí spojení mezi žádostmi)
+_spotify = None
+
+# Pool pracovních procesů yt-dlp (vzniká líně)
+_ytdlp_pool = None
+_ytdlp_pool_lock = threading.Lock()
+
+# Historie žádostí (otevírá se líně) a soubory oblíbených skladeb, které se nemažou
+_request_history = None
+_pinned_paths = set()
+
+# Úlohy pro stahovací workery (jen v režimu uzlu)
+_job_board = None
+
+# Zámek pro složené úpravy fronty (fronta se mění z konzole, IG vlákna i přehrávače)
+_queue_lock = threading.RLock()
+_queue_store = None  # fronta v paměti nad queue.json + žurnálem (vzniká líně)
+
+
+# Rozpracované žádosti (přijaté, ale ještě nezařazené do fronty)
+_admission_lock = threading.Lock()
+_pending_total = 0  # jen žádosti, které opravdu stahují (knihovna a připojení k běžícímu stahování ne)
+_pending_by_user = {}  # uživatel -> všechny jeho rozpracované žádosti (limit skladeb na uživatele)
+_reserved_paths = {}  # soubor z knihovny -> kolik přijatých žádostí ho ještě nezařadilo (nemazat)
+
+
+class QueueRejected(Exception):
+    """Skladba nebyla přidána do fronty; text výjimky je určen pro uživatele."""
 
 
 def sanitize_filename(filename):
     return re.sub(r'[<>:"/\\|?*]', '', filename)
 
 
-def get_next_id():
-    if not os.path.exists(QUEUE_FILE) or os.path.getsize(QUEUE_FILE) == 0:
-        return 0
+def _get_queue_store():
+    global _queue_store
+    with _queue_lock:
+        if _queue_store is None or _queue_store.path != QUEUE_FILE:
+            _queue_store = QueueStore.QueueStore(QUEUE_FILE, MAX_HISTORY, DEFAULT_TRACK_SECONDS, key_of=_entry_key)
+        return _queue_store
 
-    try:
-        with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
-            queue = json.load(f)
-            return max(item['id'] for item in queue) + 1 if queue else 0
-    except (json.JSONDecodeError, KeyError):
-        return 0
+
+def get_next_id():
+    return _get_queue_store().next_id()
 
 
-def add_to_queue(url, filepath, filetype):
-    new_id = get_next_id()
+def add_to_queue(url, filepath, filetype, key=None, user_id=None, duration=None, position=None):
+    """Zařadí skladbu na konec fronty, nebo na pozici position (1 = hned po aktuální). Vrací id."""
     new_item = {
-        "id": new_id,
         "odkaz": url,
         "cesta_k_souboru": filepath,
-        "format": filetype
+        "format": filetype,
+        "klic": key or canonical_track_key(url),
+        "pridal": str(user_id) if user_id is not None else None,
+        "delka": duration,
     }
+    with _queue_lock:
+        entry_id = _get_queue_store().insert(new_item, position)
+    _wake_player()
+    return entry_id
 
-    queue = []
-    if os.path.exists(QUEUE_FILE) and os.path.getsize(QUEUE_FILE) > 0:
-        try:
-            with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
-                queue = json.load(f)
-        except json.JSONDecodeError:
-            queue = []
-
-    queue.append(new_item)
-
-    with open(QUEUE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(queue, f, indent=2, ensure_ascii=False)
-
-    return new_id
 
+def _get_ytdlp_pool():
+    global _ytdlp_pool
+    with _ytdlp_pool_lock:
+        if _ytdlp_pool is None:
+            _ytdlp_pool = YtdlpWorkers.WorkerPool(YTDLP_WORKERS)
+        return _ytdlp_pool
 
 
+def _ytdlp(kind, url, opts, on_progress=None):
+    """
+    Spustí úlohu yt-dlp ("info" nebo "download") v pracovním procesu s časovým limitem.
+    Vrací podmnožinu metadat; při chybě vyhodí YtdlpWorkers.ExtractionError.
+    """
+    timeout = YTDLP_DOWNLOAD_TIMEOUT_SEC if kind == "download" else YTDLP_INFO_TIMEOUT_SEC
+    # Limiter a jistič služby: při omezování YouTube nové žádosti hned selžou (ServiceUnavailable)
+    service = "soundcloud" if "soundcloud.com" in url.lower() else "youtube"
+    return ServiceGuard.call(service, lambda: _get_ytdlp_pool().run(kind, url, opts, timeout, on_progress),
+                             _is_transient_download_error)
 
 
 def extract_info(url):
-    with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-        try:
-            info = ydl.extract_info(url, download=False)
-            if 'title' in info:
-                return sanitize_filename(info['title'])
-            return f"song_{get_next_id()}"
-        except:
-            return f"song_{get_next_id()}"
+    try:
+        info = _ytdlp("info", url, {'quiet': True})
+        if info and 'title' in info:
+            return sanitize_filename(info['title'])
+        return f"song_{get_next_id()}"
+    except ServiceGuard.ServiceUnavailable:
+        raise
+    except:
+        return f"song_{get_next_id()}"
+
+
+def _is_spotify_outage(error):
+    """429 a chyby serveru/sítě jsou problém služby; 404 nebo špatné ID jen této žádosti."""
+    status = getattr(error, 'http_status', None)
+    return isinstance(error, OSError) or (status is not None and (status == 429 or status >= 500))
+
+
+def _spotify_track(track_id):
+    """Metadata skladby ze Spotify přes limiter a jistič služby "spotify"."""
+    global _spotify
+    if _spotify is None:
+        # Bez vestavěného opakování: spotipy by po 429 čekalo na Retry-After a blokovalo vlákno,
+        # opakování a pauzy řídí jistič
+        _spotify = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
+            client_id=SPOTIFY_CLIENT_ID,
+            client_secret=SPOTIFY_CLIENT_SECRET,
+            requests_timeout=10,
+        ), requests_timeout=10, retries=0, status_retries=0)
+    return ServiceGuard.call("spotify", lambda: _spotify.track(track_id), _is_spotify_outage)
 
 
 def convert_spotify_to_yt(spotify_url):
     try:
-        # Initialize Spotify client
-        sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
-            client_id=SPOTIFY_CLIENT_ID,
-            client_secret=SPOTIFY_CLIENT_SECRET
-        ))
-
         # Get track info from Spotify
         track_id = spotify_url.split('/')[-1].split('?')[0]
-        track = sp.track(track_id)
+        track = _spotify_track(track_id)
         track_name = track['name']
         artist_name = track['artists'][0]['name']
 
         # Search on YouTube
         search_query = f"{artist_name} - {track_name}"
-        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-            info = ydl.extract_info(f"ytsearch:{search_query}", download=False)
-            if info and 'entries' in info and info['entries']:
-                return info['entries'][0]['webpage_url']
+        info = _ytdlp("info", f"ytsearch:{search_query}", {'quiet': True})
+        if info and 'entries' in info and info['entries']:
+            return info['entries'][0]['webpage_url']
 
         return None
+    except ServiceGuard.ServiceUnavailable:
+        raise
     except Exception as e:
         print(f"❌ Chyba při konverzi Spotify na YouTube: {str(e)}")
         return None
 
 
+def _start_download_progress(url, filename):
+    """Založí záznam o stahování a vrátí jeho číslo pro další volání."""
+    with _downloads_lock:
+        download_id = next(_download_ids)
+        _downloads[download_id] = {
+            "nazev": filename,
+            "odkaz": url,
+            "stav": "stahuje",
+            "pokus": 1,
+            "stazeno": 0,
+            "celkem": None,
+            "eta": None,
+        }
+        return download_id
+
+
+def _set_download_state(download_id, **fields):
+    with _downloads_lock:
+        state = _downloads.get(download_id)
+        if state is not None:
+            state.update(fields)
+
+
+def _update_download_progress(download_id, d):
+    """Progress hook pro yt-dlp: přepisuje stav rozpracovaného stahování."""
+    with _downloads_lock:
+        state = _downloads.get(download_id)
+        if state is None:
+            return
+        if d.get('status') == 'downloading':
+            state["stav"] = "stahuje"
+            state["stazeno"] = d.get('downloaded_bytes') or 0
+            state["celkem"] = d.get('total_bytes') or d.get('total_bytes_estimate')
+            state["eta"] = d.get('eta')
+        elif d.get('status') == 'finished':
+            state["stav"] = "zpracovává"
+            state["eta"] = 0
+
+
+def _finish_download_progress(download_id):
+    with _downloads_lock:
+        _downloads.pop(download_id, None)
+
+
+def get_download_progress():
+    """Vrátí kopii stavu všech právě běžících stahování."""
+    with _downloads_lock:
+        return [dict(state) for state in _downloads.values()]
+
+
+def _is_transient_download_error(error):
+    """
+    Rozliší výpadek sítě nebo vypršený limit (má smysl zkusit znovu) od trvalé chyby
+    typu nepodporovaný odkaz nebo smazané video – to už rozhodl pracovní proces.
+    """
+    return getattr(error, 'transient', True)
+
+
 def download_audio(url, filename):
     os.makedirs(DOWNLOAD_DIR, exist_ok=True)
     parsed = urlparse(url)
@@ -126,26 +342,44 @@ def download_audio(url, filename):
         'outtmpl': os.path.join(DOWNLOAD_DIR, f'{filename}.%(ext)s'),
         'quiet': True,
         'no_warnings': True,
+        # Nedokončená data zůstávají v .part souboru a další pokus na ně naváže
+        'continuedl': True,
+        'nopart': False,
+        'retries': 3,
+        'fragment_retries': 3,
     }
 
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=True)
-        ext = info['ext']
-        filepath = ydl.prepare_filename(info)
-        return filepath, ext
+    download_id = _start_download_progress(url, filename)
+    try:
+        for attempt in range(1, DOWNLOAD_RETRIES + 1):
+            _set_download_state(download_id, pokus=attempt, stav="stahuje")
+            try:
+                info = _ytdlp("download", url, ydl_opts,
+                              on_progress=lambda d: _update_download_progress(download_id, d))
+                ext = info['ext']
+                filepath = info['filepath']
+                library_add(filepath, [canonical_track_key(info.get('webpage_url') or url)],
+                            title=info.get('track') or info.get('title'),
+                            artist=info.get('artist') or info.get('uploader'),
+                            duration=info.get('duration'))
+                return filepath, ext
+            except (YtdlpWorkers.ExtractionError, OSError) as e:
+                if attempt == DOWNLOAD_RETRIES or not _is_transient_download_error(e):
+                    raise
+                delay = min(DOWNLOAD_BACKOFF_MAX, DOWNLOAD_BACKOFF_BASE * 2 ** (attempt - 1))
+                print(f"⚠️ Stahování přerušeno (pokus {attempt}/{DOWNLOAD_RETRIES}), "
+                      f"navážu za {delay:.0f} s: {str(e)}")
+                _set_download_state(download_id, stav="čeká na opakování", eta=None)
+                time.sleep(delay)
+    finally:
+        _finish_download_progress(download_id)
 
 
 def download_from_spotify(spotify_url, filename):
     try:
-        # Initialize Spotify client
-        sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
-            client_id=SPOTIFY_CLIENT_ID,
-            client_secret=SPOTIFY_CLIENT_SECRET
-        ))
-
         # Get track info
         track_id = spotify_url.split('/')[-1].split('?')[0]
-        track = sp.track(track_id)
+        track = _spotify_track(track_id)
         track_name = track['name']
         artist_name = track['artists'][0]['name']
 
@@ -153,69 +387,1058 @@ def download_from_spotify(spotify_url, filename):
 
         # Try to find on YouTube as fallback
         search_query = f"{artist_name} - {track_name}"
-        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-            info = ydl.extract_info(f"ytsearch:{search_query}", download=False)
-            if info and 'entries' in info and info['entries']:
-                yt_url = info['entries'][0]['webpage_url']
-                print("🔍 Nalezeno na YouTube, stahuji odtud...")
-                return download_audio(yt_url, filename)
+        info = _ytdlp("info", f"ytsearch:{search_query}", {'quiet': True})
+        if info and 'entries' in info and info['entries']:
+            yt_url = info['entries'][0]['webpage_url']
+            print("🔍 Nalezeno na YouTube, stahuji odtud...")
+            return download_audio(yt_url, filename)
 
         print("❌ Nelze stáhnout tuto skladbu - není dostupné na YouTube")
         return None, None
 
+    except ServiceGuard.ServiceUnavailable:
+        raise
     except Exception as e:
         print(f"❌ Chyba při stahování ze Spotify: {str(e)}")
         return None, None
 
 
-def get_current_song():
-    if not os.path.exists(QUEUE_FILE) or os.path.getsize(QUEUE_FILE) == 0:
-        return None
+# -----------------------------
+# Knihovna stažených skladeb (library.json)
+# -----------------------------
+def _read_audio_tags(path):
+    """
+    Přečte z audio souboru titul, interpreta, délku a zdrojový odkaz (tagy purl/website/comment).
+    Formáty, které mutagen nezná (např. webm), vrátí jen název podle souboru.
+    """
+    record = {"titul": Path(path).stem, "interpret": None, "delka": None, "klice": []}
+    try:
+        audio = mutagen.File(path, easy=True)
+    except Exception:
+        audio = None
+    if audio is None:
+        return record
+    if getattr(audio, 'info', None) is not None and getattr(audio.info, 'length', None):
+        record["delka"] = round(audio.info.length, 1)
+    tags = audio.tags or {}
+    try:
+        record["titul"] = (tags.get('title') or [record["titul"]])[0]
+        record["interpret"] = (tags.get('artist') or [None])[0]
+        for name in ('purl', 'website', 'comment', 'description'):
+            for value in tags.get(name) or []:
+                key = canonical_track_key(str(value))
+                if key:
+                    record["klice"].append(key)
+                    break
+    except Exception:
+        pass
+    return record
+
 
+def _library_index_entry(path, record):
+    _library[path] = record
+    for key in record.get("klice", []):
+        _library_by_key[key] = path
+
+
+def _library_unindex_entry(path):
+    record = _library.pop(path, None)
+    for key in (record or {}).get("klice", []):
+        if _library_by_key.get(key) == path:
+            del _library_by_key[key]
+    return record
+
+
+def _save_library():
+    if LIBRARY_FILE is None:
+        return  # worker: knihovnu vede uzel, tady je jen v paměti
+    with _library_lock:
+        data = json.dumps(_library, ensure_ascii=False)
+    tmp = LIBRARY_FILE + ".tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp, LIBRARY_FILE)
+    except OSError as e:
+        print(f"❌ Nelze uložit knihovnu: {str(e)}")
+
+
+def load_library():
+    """Načte library.json do paměti (bez čtení audio souborů, jen pár ms i pro tisíce skladeb)."""
+    if LIBRARY_FILE is None:
+        return 0
+    try:
+        with open(LIBRARY_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        data = {}
+    with _library_lock:
+        _library.clear()
+        _library_by_key.clear()
+        for path, record in data.items():
+            _library_index_entry(path, record)
+    return len(data)
+
+
+def rescan_library():
+    """
+    Inkrementální průchod DOWNLOAD_DIR: tagy čte jen u nových nebo změněných souborů
+    (podle mtime a velikosti), smazané soubory z indexu vyřadí. Výsledek se do knihovny
+    slučuje: záznamy, které mezitím změnil library_add / library_remove, nepřepisuje.
+    """
+    start = time.time()
+    found = {}
     try:
-        with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
-            queue = json.load(f)
-            for item in queue:
-                if item['id'] == 0:
-                    return item
-    except (json.JSONDecodeError, KeyError):
+        with os.scandir(DOWNLOAD_DIR) as it:
+            for entry in it:
+                if entry.is_file() and Path(entry.name).suffix.lower() in AUDIO_EXTENSIONS:
+                    st = entry.stat()
+                    found[os.path.join(DOWNLOAD_DIR, entry.name)] = (st.st_mtime, st.st_size)
+    except FileNotFoundError:
         pass
 
+    with _library_lock:
+        known = dict(_library)  # cesta -> záznam, jak byl před čtením tagů
+    changed = [path for path, stamp in found.items()
+               if path not in known or (known[path].get("mtime"), known[path].get("size")) != stamp]
+    # soubor stažený až po projití adresáře v něm chybí, ale existuje – ten neodebírej
+    removed = [path for path in known if path not in found and not os.path.exists(path)]
+
+    records = {}
+    for path in changed:
+        record = _read_audio_tags(path)
+        record["mtime"], record["size"] = found[path]
+        # klíče zjištěné při stahování se ze souboru číst nedají, zachovej je
+        old = known.get(path)
+        if old:
+            record["klice"] = list(dict.fromkeys(record["klice"] + old.get("klice", [])))
+        records[path] = record
+
+    if changed or removed:
+        with _library_lock:
+            # Jen záznamy, které se od začátku průchodu nezměnily (novější zápis má přednost)
+            for path in removed:
+                if _library.get(path) is known[path]:
+                    _library_unindex_entry(path)
+            for path, record in records.items():
+                if _library.get(path) is known.get(path):
+                    _library_index_entry(path, record)
+        _save_library()
+    print(f"📚 Knihovna: {len(found)} skladeb ({len(changed)} načteno znovu, {len(removed)} odebráno) "
+          f"za {time.time() - start:.2f} s")
+
+
+def library_add(filepath, keys, title=None, artist=None, duration=None):
+    """Zapíše nově stažený soubor do knihovny (klíče = zdroje, ze kterých ho známe)."""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return
+    with _library_lock:
+        existing = _library.get(filepath)
+    # Tagy se čtou mimo zámek, ať na ně nečeká každé hledání v knihovně;
+    # záznam je vždy nový slovník, rescan_library tak pozná, že se mezitím změnil
+    record = dict(existing) if existing else _read_audio_tags(filepath)
+    record["mtime"], record["size"] = st.st_mtime, st.st_size
+    if title:
+        record["titul"] = title
+    if artist:
+        record["interpret"] = artist
+    if duration:
+        record["delka"] = duration
+    record["klice"] = list(dict.fromkeys(record.get("klice", []) + [k for k in keys if k]))
+    with _library_lock:
+        current = _library.get(filepath)
+        if current is not None and current is not existing:
+            # mezitím ho zapsal někdo jiný: klíče sluč
+            record["klice"] = list(dict.fromkeys(current.get("klice", []) + record["klice"]))
+        _library_index_entry(filepath, record)
+    _save_library()
+
+
+def library_lookup(key):
+    """Vrátí cestu k už staženému souboru pro daný klíč skladby, nebo None."""
+    if key is None:
+        return None
+    with _library_lock:
+        path = _library_by_key.get(key)
+    if path and os.path.exists(path):
+        return path
     return None
 
 
-def get_next_song():
-    if not os.path.exists(QUEUE_FILE) or os.path.getsize(QUEUE_FILE) == 0:
+def library_remove(filepath):
+    if _fingerprint_index is not None:
+        _fingerprint_index.remove(filepath)
+    with _library_lock:
+        if _library_unindex_entry(filepath) is None:
+            return
+    _save_library()
+
+
+def library_info(filepath):
+    """Záznam knihovny pro daný soubor (titul, interpret, délka), nebo None."""
+    with _library_lock:
+        record = _library.get(filepath)
+        return dict(record) if record else None
+
+
+# -----------------------------
+# Akustické otisky (duplicity napříč zdroji)
+# -----------------------------
+def _get_fingerprint_index():
+    global _fingerprint_index
+    with _fingerprint_lock:
+        if _fingerprint_index is None:
+            index = AudioFingerprint.FingerprintIndex(FINGERPRINT_FILE)
+            count = index.load()
+            print(f"🎼 Načteno {count} akustických otisků")
+            _fingerprint_index = index
+        return _fingerprint_index
+
+
+def _fingerprint_and_match(filepath):
+    """
+    Spočítá otisk souboru a vrátí cestu k už staženému akusticky shodnému souboru.
+    Pokud shoda není, soubor zaindexuje a vrátí None.
+    """
+    index = _get_fingerprint_index()
+    st = os.stat(filepath)
+    hashes = AudioFingerprint.fingerprint_file(filepath)
+    if hashes is None:
         return None
+    match = index.match(hashes, exclude=filepath)
+    if match and os.path.exists(match[0]):
+        return match[0]
+    index.add(filepath, hashes, st.st_mtime, st.st_size)
+    return None
 
+
+def _find_acoustic_duplicate(filepath):
+    """Pošle soubor do fronty otisků a počká nanejvýš FINGERPRINT_WAIT_SEC na výsledek."""
+    global _fingerprint_executor
+    if not FINGERPRINT_ENABLED:
+        return None
+    with _fingerprint_lock:
+        if _fingerprint_executor is None:
+            _fingerprint_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fingerprint")
+    future = _fingerprint_executor.submit(_fingerprint_and_match, filepath)
     try:
-        with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
-            queue = json.load(f)
-            for item in queue:
-                if item['id'] == 1:
-                    return item
-    except (json.JSONDecodeError, KeyError):
-        pass
+        return future.result(timeout=FINGERPRINT_WAIT_SEC)
+    except FutureTimeoutError:
+        return None  # otisk doběhne na pozadí, skladbu zařadíme hned
+    except Exception as e:
+        print(f"❌ Chyba při výpočtu otisku: {str(e)}")
+        return None
+
 
+def fingerprint_library():
+    """Na pozadí doplní otisky souborům z knihovny, které je ještě nemají, a smaže zastaralé."""
+    if not FINGERPRINT_ENABLED:
+        return
+    index = _get_fingerprint_index()
+    with _library_lock:
+        files = {path: (r.get("mtime"), r.get("size")) for path, r in _library.items()}
+    for path in index.paths():
+        if path not in files:
+            index.remove(path)
+    added = 0
+    for path, (mtime, size) in files.items():
+        if index.is_current(path, mtime, size):
+            continue
+        hashes = AudioFingerprint.fingerprint_file(path)
+        if hashes is not None:
+            index.add(path, hashes, mtime, size)
+            added += 1
+    if added:
+        print(f"🎼 Doplněno {added} akustických otisků")
+
+
+# -----------------------------
+# Vyhledávání textem (knihovna -> uložené výsledky -> YouTube Music)
+# -----------------------------
+SEARCH_NOISE_REGEX = re.compile(
+    r'\(.*?\)|\[.*?\]|\b(?:official|video|audio|lyrics?|hd|4k|remaster(?:ed)?)\b', re.IGNORECASE
+)
+
+
+def _normalize_query(query):
+    return " ".join(fuzz_utils.default_process(query).split())
+
+
+def _key_to_url(key):
+    """Opačný směr ke canonical_track_key (jen pro zdroje, které jdou stáhnout přímo)."""
+    service, _, ident = (key or "").partition(':')
+    if service == "youtube":
+        return f"https://www.youtube.com/watch?v={ident}"
+    if service == "soundcloud" and not ident.startswith("on/"):
+        return f"https://soundcloud.com/{ident}"
     return None
 
 
-def get_previous_song():
-    if not os.path.exists(QUEUE_FILE) or os.path.getsize(QUEUE_FILE) == 0:
+def search_library(query):
+    """Najde v knihovně skladbu odpovídající textu. Vrací (cesta, záznam) nebo None."""
+    with _library_lock:
+        choices = {}
+        for path, record in _library.items():
+            name = record.get("titul") or Path(path).stem
+            if record.get("interpret") and record["interpret"] not in name:
+                name = f"{record['interpret']} {name}"
+            choices[path] = SEARCH_NOISE_REGEX.sub(' ', name)
+    if not choices:
         return None
+    best = fuzz_process.extractOne(SEARCH_NOISE_REGEX.sub(' ', query), choices, scorer=fuzz.token_sort_ratio,
+                                   processor=fuzz_utils.default_process, score_cutoff=LIBRARY_MATCH_SCORE)
+    if not best or not os.path.exists(best[2]):
+        return None
+    return best[2], library_info(best[2])
+
+
+def _load_search_cache():
+    global _search_cache
+    if _search_cache is None:
+        try:
+            with open(SEARCH_CACHE_FILE, 'r', encoding='utf-8') as f:
+                _search_cache = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            _search_cache = {}
+    return _search_cache
+
 
+def _search_online(query):
+    """Seřazené výsledky z YouTube Music, při chybě z ytsearch přes yt-dlp."""
+    global _ytmusic
     try:
-        with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
-            queue = json.load(f)
-            for item in queue:
-                if item['id'] == -1:
-                    return item
-    except (json.JSONDecodeError, KeyError):
-        pass
+        if _ytmusic is None:
+            _ytmusic = YTMusic()
+        results = []
+        found = ServiceGuard.call("youtube", lambda: _ytmusic.search(query, filter="songs", limit=SEARCH_RESULTS))
+        for item in found:
+            if not item.get('videoId'):
+                continue
+            results.append({
+                "odkaz": f"https://www.youtube.com/watch?v={item['videoId']}",
+                "titul": item.get('title'),
+                "interpret": ", ".join(a['name'] for a in item.get('artists') or []),
+                "delka": item.get('duration_seconds'),
+            })
+        if results:
+            return results[:SEARCH_RESULTS]
+    except ServiceGuard.ServiceUnavailable:
+        raise
+    except Exception as e:
+        print(f"⚠️ YouTube Music hledání selhalo, zkusím ytsearch: {str(e)}")
+
+    info = _ytdlp("info", f"ytsearch{SEARCH_RESULTS}:{query}", {'quiet': True, 'extract_flat': 'in_playlist'})
+    return [{
+        "odkaz": f"https://www.youtube.com/watch?v={entry['id']}",
+        "titul": entry.get('title'),
+        "interpret": entry.get('channel') or entry.get('uploader'),
+        "delka": entry.get('duration'),
+    } for entry in (info or {}).get('entries') or [] if entry.get('id')]
+
+
+def search_tracks(query):
+    """
+    Vrátí seřazené výsledky pro dotaz. Uložené výsledky mladší než SEARCH_CACHE_TTL_HOURS
+    se vrací bez sítě; souběžné stejné dotazy sdílí jedno hledání.
+    """
+    norm = _normalize_query(query)
+    if not norm:
+        return []
+    with _search_lock:
+        cached = _load_search_cache().get(norm)
+    if cached and time.time() - cached["cas"] < SEARCH_CACHE_TTL_HOURS * 3600:
+        return cached["vysledky"]
+
+    try:
+        results = _single_flight(f"search:{norm}", lambda: _search_online(query))
+    except ServiceGuard.ServiceUnavailable:
+        if not cached:
+            raise
+        print(f"⚠️ YouTube je vypnuté jističem, použiji starší výsledky pro \"{query}\"")
+        return cached["vysledky"]
+    if results:
+        with _search_lock:
+            cache = _load_search_cache()
+            cache[norm] = {"cas": time.time(), "vysledky": results}
+            # prošlé záznamy při ukládání rovnou vyhoď
+            expired = [q for q, v in cache.items() if time.time() - v["cas"] >= SEARCH_CACHE_TTL_HOURS * 3600]
+            for q in expired:
+                del cache[q]
+            try:
+                with open(SEARCH_CACHE_FILE, 'w', encoding='utf-8') as f:
+                    json.dump(cache, f, ensure_ascii=False)
+            except OSError as e:
+                print(f"❌ Nelze uložit výsledky hledání: {str(e)}")
+    return results
+
+
+def _enqueue_local_file(filepath, user_id=None, privileged=False):
+    """Zařadí soubor z knihovny, u kterého neznáme zdrojový odkaz."""
+    existing = _check_duplicate(None, filepath)
+    if existing:
+        return existing, True
+    _admit(user_id, privileged, needs_download=False)
+    try:
+        with _queue_lock:
+            duration = (library_info(filepath) or {}).get("delka")
+            add_to_queue(None, filepath, Path(filepath).suffix.lstrip('.'), user_id=user_id, duration=duration)
+        return {"odkaz": None, "cesta_k_souboru": filepath, "format": Path(filepath).suffix.lstrip('.'),
+                "klic": None, "pridal": user_id, "delka": duration}, False
+    finally:
+        _release_admission(user_id, needs_download=False)
+
+
+def search_and_enqueue(query, user_id=None, privileged=False):
+    """
+    Příkaz "search": nejdřív knihovna, pak uložené/online výsledky; nejlepší shodu zařadí.
+    Vrací lidsky čitelný název, když nic nenajde, vyhodí QueueRejected.
+    """
+    hit = search_library(query)
+    if hit:
+        path, record = hit
+        urls = [_key_to_url(k) for k in (record or {}).get("klice", [])]
+        url = next((u for u in urls if u), None)
+        if url:
+            return add_link_to_queue(url, user_id=user_id, privileged=privileged)
+        entry, merged = _enqueue_local_file(path, user_id=user_id, privileged=privileged)
+        name = Path(entry['cesta_k_souboru']).name
+        return f"{name} (už je ve frontě)" if merged else name
+
+    try:
+        results = search_tracks(query)
+    except ServiceGuard.ServiceUnavailable as e:
+        raise QueueRejected(str(e))
+    if not results:
+        raise QueueRejected(f"Pro \"{query}\" jsem nic nenašel.")
+    return add_link_to_queue(results[0]["odkaz"], user_id=user_id, privileged=privileged)
+
+
+# -----------------------------
+# Historie žádostí a předem stažené oblíbené skladby
+# -----------------------------
+def _get_request_history():
+    global _request_history
+    if _request_history is None:
+        _request_history = RequestHistory.RequestHistory(REQUEST_HISTORY_FILE, POPULARITY_HALF_LIFE_DAYS)
+    return _request_history
+
+
+def _record_request(event, key, user_id=None):
+    try:
+        _get_request_history().record(event, key, user_id)
+    except Exception as e:
+        print(f"⚠️ Nepodařilo se zapsat do historie: {str(e)}")
+
+
+def _is_idle():
+    """Nic se nestahuje ani nečeká na přijetí – předem stahovat nebude nikoho zdržovat."""
+    with _admission_lock:
+        if _pending_total or _pending_by_user:
+            return False
+    with _downloads_lock:
+        return not _downloads
+
+
+def warm_cache():
+    """
+    Jeden průchod: z historie spočítá oblíbené skladby, ty, které se vejdou do
+    CACHE_DISK_BUDGET_MB, chrání před smazáním, chybějící dostahuje (jen v klidu)
+    a oblíbené soubory, které z rozpočtu vypadly, uvolní. Vrací počet stažených skladeb.
+    """
+    global _pinned_paths
+    history = _get_request_history()
+    ranked = history.popularity()[:CACHE_WARM_TOP]
+    budget = CACHE_DISK_BUDGET_MB * 1024 * 1024
+    used, pinned, missing = 0, set(), []
+    for key, _score in ranked:
+        path = library_lookup(key)
+        if path is None:
+            if _key_to_url(key):
+                missing.append(key)
+            continue
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        if used + size > budget:
+            break
+        used += size
+        pinned.add(path)
+    _pinned_paths = pinned
+
+    fetched = 0
+    for key in missing[:CACHE_WARM_PER_RUN]:
+        average = used // len(pinned) if pinned else 5 * 1024 * 1024
+        if used + average > budget or not _is_idle():
+            break
+        url = _key_to_url(key)
+        try:
+            _url, _key, filepath, _filetype = _single_flight(key, lambda: _download_track(url, key))
+        except ServiceGuard.ServiceUnavailable as e:
+            print(f"⚠️ Předem stahovat teď nejde: {str(e)}")
+            break
+        except Exception as e:
+            print(f"⚠️ Předem stáhnout {key} se nepovedlo: {str(e)}")
+            continue
+        if filepath:
+            pinned.add(filepath)
+            used += os.path.getsize(filepath)
+            fetched += 1
+    _pinned_paths = pinned
+
+    # Soubory z historie mimo frontu, které už se do rozpočtu nevejdou, uvolni
+    # (čerstvě stažené nech být, můžou právě čekat na zařazení do fronty). Kandidáti se
+    # jen sesbírají, mazání (s novou kontrolou fronty a rozpracovaných žádostí) běží bez zámků
+    known = history.keys()
+    fresh = time.time() - CACHE_WARM_INTERVAL_SEC
+    with _library_lock:
+        stale = [path for path, record in _library.items()
+                 if path not in pinned and record.get("mtime", 0) < fresh
+                 and known.intersection(record.get("klice", []))]
+    _delete_unused_files(stale)
+
+    hits, total = history.hit_rate(HIT_RATE_DAYS)
+    print(f"🔥 Oblíbené skladby: {len(pinned)} souborů ({used / 1024 / 1024:.0f} MB), "
+          f"předem staženo {fetched}, bez čekání {hits}/{total} žádostí za {HIT_RATE_DAYS} dní")
+    return fetched
+
+
+def get_service_status() -> str:
+    """Stav limiterů a jističů služeb, které používá přehrávač (YouTube, SoundCloud, Spotify)."""
+    return ServiceGuard.status_text(("youtube", "soundcloud", "spotify")) or "🟢 Zatím žádná volání služeb."
+
+
+def get_cache_stats() -> str:
+    """Úspěšnost cache: kolik žádostí se obsloužilo bez čekání na stažení."""
+    hits, total = _get_request_history().hit_rate(HIT_RATE_DAYS)
+    rate = f"{hits * 100 / total:.0f} %" if total else "–"
+    return (f"⚡ Bez čekání na stažení: {hits}/{total} žádostí ({rate}) za posledních {HIT_RATE_DAYS} dní, "
+            f"chráněných oblíbených souborů {len(_pinned_paths)}")
+
+
+def _cache_warm_tick():
+    try:
+        warm_cache()
+    except Exception as e:
+        print(f"❌ Chyba při předem stahování: {str(e)}")
 
+
+# -----------------------------
+# Kanonická identita skladby a sdílené stahování
+# -----------------------------
+YOUTUBE_ID_REGEX = re.compile(r'^[A-Za-z0-9_-]{11}$')
+SPOTIFY_TRACK_REGEX = re.compile(r'(?:^|/)track/([A-Za-z0-9]{22})(?:$|[/?])|^spotify:track:([A-Za-z0-9]{22})$')
+
+
+def canonical_track_key(url):
+    """
+    Převede odkaz na kanonický klíč "služba:id" bez jakéhokoli síťového dotazu.
+    youtu.be/X, youtube.com/watch?v=X&t=30 i music.youtube.com/watch?v=X dají "youtube:X".
+    Vrací None, pokud odkaz nepoznáme.
+    """
+    if not url:
+        return None
+    url = url.strip()
+    m = SPOTIFY_TRACK_REGEX.search(url)
+    if m and ("spotify" in url.lower()):
+        return f"spotify:{m.group(1) or m.group(2)}"
+
+    if not url.lower().startswith(("http://", "https://")):
+        url = "https://" + url
+    parsed = urlparse(url)
+    netloc = parsed.netloc.lower().split(':')[0]
+    for prefix in ("www.", "m.", "music."):
+        if netloc.startswith(prefix):
+            netloc = netloc[len(prefix):]
+    parts = [p for p in parsed.path.split('/') if p]
+
+    if netloc == "youtu.be" and parts:
+        video_id = parts[0]
+    elif netloc in ("youtube.com", "youtube-nocookie.com"):
+        video_id = None
+        if parts and parts[0] == "watch":
+            for pair in parsed.query.split('&'):
+                name, _, value = pair.partition('=')
+                if name == "v":
+                    video_id = value
+                    break
+        elif len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v"):
+            video_id = parts[1]
+    elif netloc == "soundcloud.com" and len(parts) >= 2:
+        return f"soundcloud:{parts[0].lower()}/{parts[1].lower()}"
+    elif netloc == "on.soundcloud.com" and parts:
+        # Zkrácený odkaz nejde bez sítě rozbalit, identitou je samotný kód
+        return f"soundcloud:on/{parts[0]}"
+    else:
+        return None
+
+    if video_id and YOUTUBE_ID_REGEX.match(video_id):
+        return f"youtube:{video_id}"
+    return None
+
+
+class _Flight:
+    """Jedno rozběhnuté zpracování, na jehož výsledek můžou čekat další žádosti."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_inflight = {}  # klíč -> _Flight
+_inflight_lock = threading.Lock()
+
+
+def _single_flight(key, fn):
+    """
+    Zavolá fn() nanejvýš jednou pro daný klíč najednou: souběžné žádosti se stejným
+    klíčem počkají na běžící zpracování a dostanou jeho výsledek (nebo výjimku).
+    """
+    if key is None:
+        return fn()
+    with _inflight_lock:
+        flight, leader = _join_flight(key)
+    if leader:
+        return _lead_flight(key, flight, fn)
+    return _follow_flight(flight)
+
+
+def _join_flight(key):
+    """Volat pod _inflight_lock: vrátí (běžící zpracování, False), nebo nově založené (…, True)."""
+    flight = _inflight.get(key)
+    if flight is not None:
+        return flight, False
+    flight = _inflight[key] = _Flight()
+    return flight, True
+
+
+def _lead_flight(key, flight, fn):
+    """Zakladatel zpracování spustí fn() a výsledek předá všem, kdo se připojili."""
+    try:
+        flight.result = fn()
+        return flight.result
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        flight.done.set()
+
+
+def _follow_flight(flight):
+    flight.done.wait()
+    if flight.error is not None:
+        raise flight.error
+    return flight.result
+
+
+def _entry_key(item):
+    return item.get('klic') or canonical_track_key(item.get('odkaz'))
+
+
+def _find_queued(key, path=None):
+    """
+    Najde skladbu se stejným klíčem (nebo stejným souborem), která právě hraje
+    nebo teprve čeká (id >= 0).
+    """
+    if key is None and path is None:
+        return None
+    return _get_queue_store().find(key, path, min_id=0)
+
+
+def _check_duplicate(key, path=None):
+    """
+    Uplatní DUPLICATE_POLICY na klíč (a volitelně na soubor). Vrací již zařazenou
+    položku (u "merge"), jinak None; u "reject" vyhodí QueueRejected.
+    """
+    if DUPLICATE_POLICY == "allow":
+        return None
+    existing = _find_queued(key, path)
+    if existing and DUPLICATE_POLICY == "reject":
+        raise QueueRejected(f"Skladba už je ve frontě: {Path(existing['cesta_k_souboru']).stem}")
+    return existing
+
+
+def _resolve_and_download(url):
+    """Spotify -> YouTube, název podle metadat a stažení. Vrací (url, klíč, cesta, formát)."""
+    if "spotify.com" in urlparse(url).netloc.lower():
+        spotify_key = canonical_track_key(url)
+        yt_url = convert_spotify_to_yt(url)
+        if yt_url:
+            url = yt_url
+            key = canonical_track_key(url)
+            # Stejná skladba už mohla přijít jako přímý YouTube odkaz
+            existing = _check_duplicate(key)
+            if existing:
+                return url, key, existing['cesta_k_souboru'], existing['format']
+            result = _from_library(url, key) or _single_flight(key, lambda: _download_track(url, key))
+            if result[2]:
+                # příště Spotify odkaz najdeme v knihovně bez dotazu na Spotify/YouTube
+                library_add(result[2], [spotify_key])
+            return result
+    return _download_track(url, canonical_track_key(url))
+
+
+def _from_library(url, key):
+    """Pokud už soubor pro klíč máme stažený, vrátí (url, klíč, cesta, formát) bez sítě."""
+    path = library_lookup(key)
+    if path:
+        return url, key, path, Path(path).suffix.lstrip('.')
     return None
 
 
+def _download_track(url, key):
+    filename = extract_info(url)
+    filepath, filetype = download_audio(url, filename)
+    if filepath:
+        filepath, filetype = _reuse_acoustic_duplicate(filepath, filetype, key)
+    return url, key, filepath, filetype
+
+
+def _reuse_acoustic_duplicate(filepath, filetype, key):
+    duplicate = _find_acoustic_duplicate(filepath)
+    if duplicate and duplicate != filepath:
+        # Stejná písnička z jiného zdroje: nechej starý soubor, nový klíč mu přidej jako alias
+        print(f"🔁 Tahle skladba už je stažená jako {Path(duplicate).name}, použiji ji")
+        keys = (library_info(filepath) or {}).get("klice", []) + [key]
+        library_add(duplicate, keys)
+        library_remove(filepath)
+        _delete_unused_files([filepath])
+        filepath, filetype = duplicate, Path(duplicate).suffix.lstrip('.')
+    return filepath, filetype
+
+
+def _fetch_track(url):
+    """Vyhledání a stažení: v režimu uzlu přes workery, jinak (nebo bez workerů) tady."""
+    if _job_board is None or not _job_board.workers_alive(NODE_WORKER_STALE_SEC):
+        return _resolve_and_download(url)
+    job_id = _job_board.submit(url)
+    try:
+        result = _job_board.wait(job_id, NODE_JOB_TIMEOUT_SEC)
+    except (PlaybackNode.JobFailed, TimeoutError) as e:
+        print(f"❌ Worker skladbu nestáhl: {str(e)}")
+        return url, canonical_track_key(url), None, None
+
+    # Soubor leží ve sdílené složce (nebo ho worker nahrál), knihovnu vede uzel
+    filepath = os.path.join(DOWNLOAD_DIR, result["soubor"])
+    key = result.get("klic")
+    library_add(filepath, [key, canonical_track_key(url)], title=result.get("titul"),
+                artist=result.get("interpret"), duration=result.get("delka"))
+    filepath, filetype = _reuse_acoustic_duplicate(filepath, result.get("format"), key)
+    return result.get("odkaz") or url, key, filepath, filetype
+
+
+def _worker_resolve(url):
+    """Úloha stahovacího workeru (--worker): stáhne do DOWNLOAD_DIR a vrátí popis souboru."""
+    final_url, key, filepath, filetype = _resolve_and_download(url)
+    record = (library_info(filepath) or {}) if filepath else {}
+    return {"odkaz": final_url, "klic": key, "cesta": filepath, "format": filetype,
+            "titul": record.get("titul"), "interpret": record.get("interpret"), "delka": record.get("delka")}
+
+
+def _upcoming_load(user_id=None):
+    """Odhadovaná délka čekajících skladeb (id > 0) v sekundách a kolik z nich přidal uživatel."""
+    store = _get_queue_store()
+    mine = len(store.upcoming_of_user(str(user_id))) if user_id is not None else 0
+    return store.upcoming_seconds(), mine
+
+
+def _admit(user_id, privileged, needs_download):
+    """
+    Admission control: rezervuje místo pro novou žádost, nebo hned vyhodí QueueRejected
+    (plné stahování, příliš dlouhá fronta, vyčerpaný limit uživatele).
+    Do limitu stahování a odhadu minut se počítají jen žádosti, které opravdu stahují;
+    limit uživatele hlídá všechny jeho rozpracované žádosti.
+    Rezervaci je nutné uvolnit přes _release_admission(user_id, needs_download).
+    """
+    global _pending_total
+    seconds, queued_mine = _upcoming_load(user_id)
+    with _admission_lock:
+        if needs_download and _pending_total >= MAX_PENDING_DOWNLOADS:
+            raise QueueRejected(
+                f"Právě běží stahování: {_pending_total} (limit {MAX_PENDING_DOWNLOADS}), zkus to za chvíli."
+            )
+        seconds += _pending_total * DEFAULT_TRACK_SECONDS
+        if seconds >= MAX_QUEUED_PLAY_MINUTES * 60:
+            raise QueueRejected(
+                f"Fronta je plná (~{int(seconds // 60)} min hudby, limit {MAX_QUEUED_PLAY_MINUTES} min), "
+                "zkus to později."
+            )
+        if user_id is not None and not privileged:
+            mine = queued_mine + _pending_by_user.get(str(user_id), 0)
+            if mine >= MAX_TRACKS_PER_USER:
+                raise QueueRejected(
+                    f"Ve frontě už máš skladeb: {mine} (limit {MAX_TRACKS_PER_USER}), počkej, až se přehrají."
+                )
+        if needs_download:
+            _pending_total += 1
+        _pending_by_user[str(user_id)] = _pending_by_user.get(str(user_id), 0) + 1
+
+
+def _release_admission(user_id, needs_download):
+    global _pending_total
+    with _admission_lock:
+        if needs_download:
+            _pending_total -= 1
+        left = _pending_by_user.get(str(user_id), 1) - 1
+        if left > 0:
+            _pending_by_user[str(user_id)] = left
+        else:
+            _pending_by_user.pop(str(user_id), None)
+
+
+def _release_path(path):
+    with _admission_lock:
+        left = _reserved_paths.get(path, 1) - 1
+        if left > 0:
+            _reserved_paths[path] = left
+        else:
+            _reserved_paths.pop(path, None)
+
+
+def get_admission_headroom(user_id=None):
+    """Kolik místa zbývá: stahování, minuty ve frontě a (volitelně) skladby uživatele."""
+    seconds, queued_mine = _upcoming_load(user_id)
+    with _admission_lock:
+        pending = _pending_total
+        mine = _pending_by_user.get(str(user_id), 0)
+    headroom = {
+        "stahovani": pending,
+        "stahovani_limit": MAX_PENDING_DOWNLOADS,
+        "minuty": int((seconds + pending * DEFAULT_TRACK_SECONDS) // 60),
+        "minuty_limit": MAX_QUEUED_PLAY_MINUTES,
+    }
+    if user_id is not None:
+        headroom["uzivatel"] = mine + queued_mine
+        headroom["uzivatel_limit"] = MAX_TRACKS_PER_USER
+    return headroom
+
+
+def _enqueue_url(url, user_id=None, privileged=False, position=None, before_enqueue=None):
+    """
+    Celá cesta odkazu do fronty: kanonický klíč -> kontrola duplicit -> admission control
+    -> sdílené vyhledání a stažení -> zápis do fronty (na konec, nebo na position).
+    before_enqueue() se zavolá po stažení těsně před zápisem (pořadí u více odkazů).
+    Vrací (položka_fronty, sloučeno); sloučeno=True znamená, že skladba už ve frontě byla.
+    Při odmítnutí vyhodí QueueRejected, při neúspěšném stažení vrací (None, False).
+    """
+    request = _admit_url(url, user_id, privileged)
+    if request["existing"]:
+        return request["existing"], True
+    return _finish_url(request, position, before_enqueue)
+
+
+def _admit_url(url, user_id=None, privileged=False):
+    """
+    První část _enqueue_url (rychlá, bez sítě): klíč, duplicita ve frontě, knihovna a rezervace
+    v admission control. Vrací žádost pro _finish_url; s vyplněným "existing" je skladba
+    už ve frontě a nic se nerezervovalo. Při odmítnutí vyhodí QueueRejected.
+    """
+    key = canonical_track_key(url)
+    existing = _check_duplicate(key) if key else None
+    if existing:
+        _record_request("hit", key, user_id)
+        return {"existing": existing}
+
+    # Knihovna má přednost před jakýmkoli síťovým dotazem; nalezený soubor se hned
+    # rezervuje, aby ho úklid (_delete_unused_files) do zařazení nesmazal
+    with _admission_lock:
+        cached = _from_library(url, key)
+        if cached:
+            _reserved_paths[cached[2]] = _reserved_paths.get(cached[2], 0) + 1
+    flight = leader = None
+    try:
+        with _inflight_lock:
+            # Kontrola limitu a založení/připojení ke stahování pod jedním zámkem a se stejným
+            # klíčem, pod kterým stahování poběží: mezi nimi nesmí běžící stahování skončit
+            # (pak by tahle žádost stahovala mimo limit)
+            shared = cached is None and key is not None and key in _inflight
+            needs_download = cached is None and not shared
+            _admit(user_id, privileged, needs_download)
+            if cached is None and key is not None:
+                flight, leader = _join_flight(key)
+    except BaseException:
+        if cached:
+            _release_path(cached[2])
+        raise
+    return {"existing": None, "url": url, "key": key, "cached": cached, "user_id": user_id,
+            "needs_download": needs_download, "flight": flight, "leader": leader}
+
+
+def _finish_url(request, position=None, before_enqueue=None):
+    """Druhá část _enqueue_url: stažení a zápis do fronty; vždy uvolní rezervaci z _admit_url."""
+    user_id, cached = request["user_id"], request["cached"]
+    try:
+        if cached:
+            final_url, final_key, filepath, filetype = cached
+        else:
+            fetch = lambda: _fetch_track(request["url"])
+            try:
+                if request["flight"] is None:
+                    final_url, final_key, filepath, filetype = fetch()  # odkaz bez klíče
+                elif request["leader"]:
+                    final_url, final_key, filepath, filetype = _lead_flight(request["key"], request["flight"], fetch)
+                else:
+                    final_url, final_key, filepath, filetype = _follow_flight(request["flight"])
+            except ServiceGuard.ServiceUnavailable as e:
+                raise QueueRejected(str(e))
+        if not filepath or not filetype:
+            return None, False
+
+        duration = (library_info(filepath) or {}).get("delka")
+        if before_enqueue:
+            before_enqueue()
+        with _queue_lock:
+            # Souběžná žádost o stejnou skladbu ji mezitím mohla zařadit;
+            # shoda souboru zachytí i akustickou duplicitu z jiného zdroje
+            existing = _check_duplicate(final_key, filepath if FINGERPRINT_QUEUE_CHECK else None)
+            _record_request("hit" if cached or existing else "miss", final_key, user_id)
+            if existing:
+                return existing, True
+            add_to_queue(final_url, filepath, filetype, key=final_key, user_id=user_id, duration=duration,
+                         position=position)
+            return {"odkaz": final_url, "cesta_k_souboru": filepath, "format": filetype,
+                    "klic": final_key, "pridal": user_id, "delka": duration}, False
+    finally:
+        _release_admission(user_id, request["needs_download"])
+        if cached:
+            _release_path(cached[2])
+
+
+def add_link_to_queue(url, user_id=None, privileged=False):
+    """
+    Přidá odkaz do fronty a vrátí lidsky čitelný název (používá i IG bot).
+    user_id slouží pro limity na uživatele; privileged (admin) je nemá.
+    """
+    entry, merged = _enqueue_url(url, user_id=user_id, privileged=privileged)
+    if entry is None:
+        raise RuntimeError("Nepodařilo se stáhnout skladbu")
+    name = Path(entry['cesta_k_souboru']).name
+    return f"{name} (už je ve frontě)" if merged else name
+
+
+def add_links_to_queue(urls, user_id=None, privileged=False):
+    """
+    Víc odkazů z jedné zprávy: limity (stahování, fronta, skladby uživatele) se uplatní
+    postupně v pořadí zprávy, přijaté odkazy se pak stahují souběžně a do fronty se zařadí
+    opět v pořadí zprávy (každý čeká, až se zařadí nebo selže ten předchozí).
+    Vrací [(odkaz, název nebo None, chyba pro uživatele nebo None)] v pořadí odkazů.
+    """
+    results = [None] * len(urls)
+    admitted = []
+    for index, url in enumerate(urls):
+        try:
+            request = _admit_url(url, user_id, privileged)
+        except QueueRejected as e:
+            results[index] = (url, None, str(e))
+            continue
+        except Exception as e:
+            print(f"❌ Chyba při přijetí odkazu {url}: {str(e)}")
+            results[index] = (url, None, "nepodařilo se zpracovat")
+            continue
+        if request["existing"]:
+            results[index] = (url, f"{Path(request['existing']['cesta_k_souboru']).name} (už je ve frontě)", None)
+        else:
+            admitted.append((index, request))
+
+    turns = [threading.Event() for _ in admitted]
+
+    def finish_one(turn, index, request):
+        url = request["url"]
+        try:
+            entry, merged = _finish_url(request, before_enqueue=turns[turn - 1].wait if turn else None)
+            if entry is None:
+                results[index] = (url, None, "nepodařilo se stáhnout")
+            else:
+                name = Path(entry['cesta_k_souboru']).name
+                results[index] = (url, f"{name} (už je ve frontě)" if merged else name, None)
+        except QueueRejected as e:
+            results[index] = (url, None, str(e))
+        except Exception as e:
+            print(f"❌ Chyba při přidávání odkazu {url}: {str(e)}")
+            results[index] = (url, None, "nepodařilo se zpracovat")
+        finally:
+            turns[turn].set()
+
+    if admitted:
+        with ThreadPoolExecutor(max_workers=len(admitted)) as executor:
+            for turn, (index, request) in enumerate(admitted):
+                executor.submit(finish_one, turn, index, request)
+    return results
+
+
+def _queued_at(position):
+    """Čekající položka na pozici (1 = hraje další), jinak QueueRejected."""
+    item = _get_queue_store().get(position) if position > 0 else None
+    if item is None:
+        raise QueueRejected(f"Na pozici {position} ve frontě nic není.")
+    return item
+
+
+def remove_from_queue(position, user_id=None, privileged=False):
+    """
+    Odebere čekající skladbu na pozici (číslování jako ve výpisu fronty).
+    Bez privileged smí uživatel odebrat jen skladbu, kterou sám přidal. Vrací její název.
+    Soubor zůstává v knihovně (případné další žádosti ho najdou bez stahování).
+    """
+    with _queue_lock:
+        item = _queued_at(position)
+        if not privileged and item.get('pridal') != (str(user_id) if user_id is not None else None):
+            raise QueueRejected("Odebrat můžeš jen skladbu, kterou jsi přidal(a).")
+        _get_queue_store().remove(position)
+    return _display_name(item)
+
+
+def move_in_queue(from_position, to_position):
+    """Přesune čekající skladbu z jedné pozice na jinou. Vrací její název."""
+    with _queue_lock:
+        item = _queued_at(from_position)
+        _queued_at(to_position)
+        _get_queue_store().move(from_position, to_position)
+    return _display_name(item)
+
+
+def play_next(url, user_id=None, privileged=False):
+    """Jako add_link_to_queue, jen skladbu zařadí hned za aktuální (už zařazenou tam přesune)."""
+    entry, merged = _enqueue_url(url, user_id=user_id, privileged=privileged, position=1)
+    if entry is None:
+        raise RuntimeError("Nepodařilo se stáhnout skladbu")
+    if merged and entry.get('uid') is not None:
+        with _queue_lock:
+            store = _get_queue_store()
+            entry_id = store.id_of(entry['uid'])
+            if entry_id is not None and entry_id > 1:
+                store.move(entry_id, 1)
+    return _display_name(entry)
+
+
+def undo_last_request(user_id=None):
+    """Odebere poslední skladbu uživatele, která ještě nehraje. Vrací její název."""
+    with _queue_lock:
+        store = _get_queue_store()
+        position = store.last_of_user(str(user_id) if user_id is not None else None)
+        if position is None:
+            raise QueueRejected("Ve frontě nečeká žádná tvoje skladba.")
+        item = store.remove(position)
+    return _display_name(item)
+
+
+def get_current_song():
+    return _get_queue_store().get(0)
+
+
+def get_next_song():
+    return _get_queue_store().get(1)
+
+
+def get_previous_song():
+    return _get_queue_store().get(-1)
+
+
 def pause_song():
     global current_player, is_paused
     if current_player and current_player.is_playing():
@@ -228,59 +1451,31 @@ def pause_song():
         print("❌ Nic se momentálně nehraje")
 
 
-def skip_song():
-    global current_player, should_play, is_paused
+def skip_song(user_id=None):
+    """Přeskočí aktuální skladbu; přeskok se do historie zapíše za toho, kdo přeskočil."""
+    global current_player, should_play, is_paused, _playback_generation
     # když skipuju, určitě nechci zůstat ve 'paused' režimu
     is_paused = False
+    _playback_generation += 1  # watchdog v player_loop nesmí stop() brát jako konec skladby
 
     if current_player:
         current_player.stop()
+    _wake_player()
 
-    if not os.path.exists(QUEUE_FILE) or os.path.getsize(QUEUE_FILE) == 0:
-        print("❌ Fronta je prázdná")
-        return
-
-    try:
-        with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
-            queue = json.load(f)
-    except json.JSONDecodeError:
-        print("❌ Chyba při čtení fronty")
-        return
-
-    if len(queue) == 0:
-        print("❌ Žádná skladba k přeskočení")
-        return
-
-    # Najdi aktuální skladbu (id=0)
-    current_song = next((item for item in queue if item['id'] == 0), None)
-    if not current_song:
-        print("❌ Nenalezena aktuální skladba")
-        return
-
-    # Postav novou frontu: current -> -1, >0 posuň o -1, historie posuň dolů
-    new_queue = []
-    history_items = [item for item in queue if item['id'] < 0]
-    for item in sorted(history_items, key=lambda x: x['id']):
-        item['id'] -= 1
-        if item['id'] >= -MAX_HISTORY:
-            new_queue.append(item)
-        else:
-            if item['cesta_k_souboru'] and os.path.exists(item['cesta_k_souboru']):
-                try:
-                    os.remove(item['cesta_k_souboru'])
-                    print(f"🗑️ Smazáno: {Path(item['cesta_k_souboru']).name}")
-                except:
-                    pass
-
-    current_song['id'] = -1
-    new_queue.append(current_song)
+    with _queue_lock:
+        store = _get_queue_store()
+        if len(store) == 0:
+            print("❌ Fronta je prázdná")
+            return
 
-    for item in [item for item in queue if item['id'] > 0]:
-        item['id'] -= 1
-        new_queue.append(item)
+        # Aktuální skladba jde do historie, nejstarší položky z historie vypadnou
+        current_song, dropped = store.advance()
+        if not current_song:
+            print("❌ Nenalezena aktuální skladba")
+            return
+        _record_request("skip", _entry_key(current_song), str(user_id) if user_id is not None else None)
 
-    with open(QUEUE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(new_queue, f, indent=2, ensure_ascii=False)
+    _delete_unused_files([item['cesta_k_souboru'] for item in dropped if item['cesta_k_souboru']])
 
     print("⏭️ Přeskočeno na další skladbu")
     if should_play:
@@ -292,37 +1487,35 @@ def skip_song():
 
 
 def update_queue():
-    if not os.path.exists(QUEUE_FILE) or os.path.getsize(QUEUE_FILE) == 0:
-        return
+    with _queue_lock:
+        store = _get_queue_store()
+        _finished, dropped = store.advance()
+        if not dropped:
+            return
 
-    try:
-        with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
-            queue = json.load(f)
-    except json.JSONDecodeError:
-        return
+    _delete_unused_files([item['cesta_k_souboru'] for item in dropped if item['cesta_k_souboru']])
 
-    new_queue = []
-    files_to_delete = []
 
-    # Move current song to history (id=-1)
-    for item in queue:
-        if item['id'] == 0:  # Current song
-            item['id'] = -1
-        elif item['id'] > 0:  # Upcoming songs
-            item['id'] -= 1
-        elif item['id'] < 0:  # History items
-            item['id'] -= 1
-            if item['id'] < -MAX_HISTORY:
-                if item['cesta_k_souboru'] and os.path.exists(item['cesta_k_souboru']):
-                    files_to_delete.append(item['cesta_k_souboru'])
+def _delete_unused_files(paths):
+    """
+    Smaže soubory vypadlé z historie, pokud na ně neukazuje jiná položka fronty
+    ani přijatá a ještě nezařazená žádost.
+    """
+    for filepath in paths:
+        # Kontrola a vyřazení z knihovny naráz: žádost, která přijde potom, soubor v knihovně
+        # už nenajde (_admit_url ho hledá i rezervuje pod _admission_lock)
+        with _queue_lock, _admission_lock:
+            if _get_queue_store().has_path(filepath) or filepath in _reserved_paths:
                 continue
-
-        new_queue.append(item)
-
-    with open(QUEUE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(new_queue, f, indent=2, ensure_ascii=False)
-
-    for filepath in files_to_delete:
+            if filepath in _pinned_paths:
+                print(f"📌 Ponechávám oblíbenou skladbu: {Path(filepath).name}")
+                continue
+            with _library_lock:
+                indexed = _library_unindex_entry(filepath) is not None
+        if indexed:
+            if _fingerprint_index is not None:
+                _fingerprint_index.remove(filepath)
+            _save_library()
         try:
             os.remove(filepath)
             print(f"🗑️ Smazáno: {Path(filepath).name}")
@@ -331,50 +1524,30 @@ def update_queue():
 
 
 def play_previous_song():
-    global current_player, should_play
+    global current_player, should_play, _playback_generation
+    _playback_generation += 1
     if current_player:
         current_player.stop()
+    _wake_player()
 
-    previous = get_previous_song()
+    with _queue_lock:
+        previous = _get_queue_store().rewind()
     if not previous:
         print("❌ Žádná předchozí skladba v historii")
         return
 
-    if not os.path.exists(QUEUE_FILE) or os.path.getsize(QUEUE_FILE) == 0:
-        return
+    print("⏮️ Vráceno k předchozí skladbě")
+    if should_play:
+        play_song(previous['cesta_k_souboru'])
 
-    try:
-        with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
-            queue = json.load(f)
-
-        # Update IDs to move previous song to current position
-        new_queue = []
-        for item in queue:
-            if item['id'] == -1:  # The previous song we want to play
-                item['id'] = 0    # Make it current
-            elif item['id'] == 0:  # Current song
-                item['id'] = 1    # Move to next position
-            elif item['id'] > 0:  # Other upcoming songs
-                item['id'] += 1
-            elif item['id'] < -1:  # Older history items
-                item['id'] += 1
-                if item['id'] < -MAX_HISTORY:
-                    continue  # Remove from queue
-
-            new_queue.append(item)
-
-        with open(QUEUE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(new_queue, f, indent=2, ensure_ascii=False)
-
-        print("⏮️ Vráceno k předchozí skladbě")
-        if should_play:
-            play_song(previous['cesta_k_souboru'])
-    except (json.JSONDecodeError, KeyError):
-        print("❌ Chyba při zpracování fronty skladeb")
-
-
-def play_song(filepath=None):
-    global player_instance, current_player, is_paused, should_play
+
+def play_song(filepath=None, start_ms=0, deadline=None):
+    """
+    Spustí skladbu (volitelně od pozice start_ms), bez argumentu obnoví pauzu.
+    deadline (time.monotonic) omezí všechny pokusy o rozběhnutí dohromady.
+    Vrací True, pokud se přehrávání rozběhlo.
+    """
+    global player_instance, current_player, is_paused, should_play, _playback_generation
 
     if filepath is None and current_player:
         # Resume playback if paused
@@ -382,10 +1555,7 @@ def play_song(filepath=None):
             current_player.play()
             is_paused = False
             print("▶️ Pokračování v přehrávání")
-        return
-
-    if current_player:
-        current_player.stop()
+        return True
 
     if filepath is None:
         current = get_current_song()
@@ -393,38 +1563,83 @@ def play_song(filepath=None):
             filepath = current['cesta_k_souboru']
         else:
             print("❌ Žádná skladba k přehrání")
-            return
+            return False
+
+    # Generace se zvyšuje před stop(): watchdog pak stop bez změny generace bere jako zastavení zvenku
+    _playback_generation += 1
+    if current_player:
+        current_player.stop()
 
     try:
-        player_instance = vlc.Instance()
-        current_player = player_instance.media_player_new()
-        media = player_instance.media_new(filepath)
-        current_player.set_media(media)
-        current_player.play()
+        # Jedna VLC instance a jeden přehrávač na celý běh, mění se jen média
+        # (nová instance pro každou skladbu se nikdy neuvolnila a držela paměť)
+        if player_instance is None:
+            player_instance = vlc.Instance()
+        if current_player is None:
+            current_player = _new_media_player()
         is_paused = False
         should_play = True
 
-        # Místo jednorázového čekání jemně čekej až 3 s na rozběhnutí přehrávání
-        start = time.time()
+        # Místo jednorázového čekání jemně čekej až PLAY_START_TIMEOUT_SEC na rozběhnutí;
+        # když se pokus nerozběhne, nastav médium znovu (VLC občas zamrzne v Opening)
+        if deadline is None:
+            deadline = time.monotonic() + PLAY_START_TIMEOUT_SEC
         started = False
-        while time.time() - start < 3.0:
-            if current_player.is_playing():
-                started = True
+        for attempt in range(PLAY_START_RETRIES):
+            media = player_instance.media_new(filepath)
+            current_player.set_media(media)
+            media.release()  # přehrávač si drží vlastní referenci
+            _play_started.clear()
+            current_player.play()
+            # Žádné dotazování po 100 ms: vlákno spí, dokud VLC neohlásí rozběhnutí/chybu, nebo do termínu
+            attempt_deadline = min(deadline, time.monotonic() + PLAY_START_TIMEOUT_SEC / PLAY_START_RETRIES)
+            while not current_player.is_playing():
+                remaining = attempt_deadline - time.monotonic()
+                if remaining <= 0 or current_player.get_state() == vlc.State.Error:
+                    break
+                _play_started.wait(remaining)
+                _play_started.clear()
+            started = current_player.is_playing()
+            if started or time.monotonic() >= deadline:
                 break
-            time.sleep(0.1)
+            current_player.stop()
 
+        if started and start_ms > 0:
+            current_player.set_time(int(start_ms))
         if not started:
             print("❌ Nepodařilo se spustit přehrávání (timeout)")
             # DŮLEŽITÉ: neshazuj should_play; smyčka pak může zkusit další skladbu
+        _wake_player()
+        return started
     except Exception as e:
         print(f"❌ Chyba při přehrávání: {str(e)}")
         # DŮLEŽITÉ: neshazuj should_play; ponecháme logiku na smyčce přehrávače
+        return False
+
+def _queue_edit_command(command):
+    """Konzolové příkazy remove N, move A B, playnext odkaz a undo; vrací text odpovědi."""
+    parts = command.split()
+    name = parts[0].lower()
+    if name == 'remove' and len(parts) == 2 and parts[1].isdigit():
+        return f"🗑️ Odebráno z fronty: {remove_from_queue(int(parts[1]), privileged=True)}"
+    if name == 'move' and len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+        return f"↕️ Přesunuto na pozici {parts[2]}: {move_in_queue(int(parts[1]), int(parts[2]))}"
+    if name == 'playnext' and len(parts) == 2:
+        return f"⏭️ Hraje jako další: {play_next(parts[1], privileged=True)}"
+    if name == 'undo' and len(parts) == 1:
+        return f"↩️ Odebráno z fronty: {undo_last_request()}"
+    return "❌ Použití: remove N, move A B, playnext odkaz, undo"
+
 
 def add_song_process():
     global should_play
     print("\n🎵 Hudební stahovač v2.4")
     print("Podporované služby: YouTube, Spotify, SoundCloud")
-    print("Příkazy: next (přeskočit), previous (zpět), pause (pozastavit), play (pokračovat)")
+    print("Příkazy: next (přeskočit), previous (zpět), pause (pozastavit), play (pokračovat), queue (fronta)")
+    print("         search text (vyhledat a přidat), profile N (profilovat N sekund), cache (úspěšnost cache)")
+    print("         remove N (odebrat z fronty), move A B (přesunout), playnext odkaz (zařadit jako další), undo")
+    print("         when (kdy začne tvoje další skladba), services (stav YouTube/Spotify/Instagram)")
+    print("         timers (časovače a probuzení za minutu)")
     print("Pro ukončení napište 'q'\n")
 
     while True:
@@ -445,6 +1660,45 @@ def add_song_process():
                 should_play = True
                 play_song()
                 continue
+            elif user_input.lower() == 'queue':
+                print(get_queue_overview())
+                continue
+            elif user_input.lower() == 'when':
+                print(when_is_my_song())
+                continue
+            elif user_input.lower() == 'timers':
+                print(Scheduler.status_text())
+                continue
+            elif user_input.lower() == 'services':
+                print(ServiceGuard.status_text() or "🟢 Zatím žádná volání služeb.")
+                continue
+            elif user_input.lower() == 'cache':
+                print(get_cache_stats())
+                continue
+            elif user_input.lower().startswith('search '):
+                query = user_input[len('search '):].strip()
+                try:
+                    print(f"✅ Přidáno do fronty: {search_and_enqueue(query)}")
+                except QueueRejected as e:
+                    print(f"❌ {str(e)}")
+                except Exception as e:
+                    print(f"❌ Chyba při hledání: {str(e)}")
+                continue
+            elif re.match(r'^(remove|move|undo|playnext)\b', user_input.lower()):
+                try:
+                    print(_queue_edit_command(user_input))
+                except QueueRejected as e:
+                    print(f"❌ {str(e)}")
+                except Exception as e:
+                    print(f"❌ Chyba při úpravě fronty: {str(e)}")
+                continue
+            elif re.match(r'^profile\s+\d+$', user_input.lower()):
+                seconds = min(int(user_input.split()[1]), Profiler.MAX_PROFILE_SEC)
+                if Profiler.profile_async(seconds, lambda text: print("\n" + text)):
+                    print(f"🔬 Profiluji {seconds} s, výsledek se vypíše po dokončení.")
+                else:
+                    print("❌ Profilování už běží.")
+                continue
 
             # If not a command, treat as URL
             url = user_input
@@ -456,12 +1710,6 @@ def add_song_process():
             netloc = parsed.netloc.lower()
             if "spotify.com" in netloc:
                 print("🔍 Spotify odkaz - hledám na YouTube...")
-                yt_url = convert_spotify_to_yt(url)
-                if yt_url:
-                    url = yt_url
-                    print("✅ Nalezeno na YouTube")
-                else:
-                    print("⚠️ Nenalezeno na YouTube - pokusím se stáhnout přímo ze Spotify")
             elif "soundcloud.com" in netloc:
                 print("🔍 SoundCloud odkaz - stahuji...")
             elif "youtube.com" in netloc or "youtu.be" in netloc:
@@ -470,17 +1718,20 @@ def add_song_process():
                 print("❌ Nepodporovaná služba!")
                 continue
 
-            filename = extract_info(url)
             try:
-                filepath, filetype = download_audio(url, filename)
-                if filepath and filetype:
-                    add_to_queue(url, filepath, filetype)
+                entry, merged = _enqueue_url(url)
+                if entry and merged:
+                    print(f"ℹ️ Skladba už je ve frontě: {Path(entry['cesta_k_souboru']).name}")
+                elif entry:
+                    filepath, filetype = entry['cesta_k_souboru'], entry['format']
                     print(f"✅ Úspěšně staženo: {Path(filepath).name}")
                     print(f"📁 Formát: {filetype.upper()}, Velikost: {os.path.getsize(filepath) / 1024:.1f} KB")
                     print("ℹ️ Napište 'play' pro spuštění přehrávání (pokud ještě nehraje)")
                     # DŮLEŽITÉ: odstraněno `should_play = False` – neblokuj autoplay
                 else:
                     print("❌ Nepodařilo se stáhnout skladbu")
+            except QueueRejected as e:
+                print(f"❌ {str(e)}")
             except Exception as e:
                 print(f"❌ Chyba při stahování: {str(e)}")
 
@@ -492,11 +1743,15 @@ def add_song_process():
 def player_loop():
     global should_play, is_paused, current_player
     print("\n🎵 Přehrávač spuštěn - čekám na skladby.")
+    # kolikrát už jsme zachraňovali tuto skladbu a dokdy to smíme zkoušet
+    recovery_path, recovery_step, recovery_deadline = None, 0, 0.0
     while True:
         try:
+            # Nejdřív shodit, pak číst stav: probuzení mezi tím se neztratí
+            _player_wakeup.clear()
             current = get_current_song()
             if not current or not current['cesta_k_souboru']:
-                time.sleep(2)
+                _player_idle()
                 continue
 
             song_path = current['cesta_k_souboru']
@@ -505,47 +1760,299 @@ def player_loop():
             if should_play:
                 # 🔧 OPRAVA: nespouštěj znovu, pokud už hraje (nebo se právě resumlo)
                 already_playing = current_player is not None and current_player.is_playing()
+                start_failed = False
                 if not already_playing and not is_paused:
                     print(f"\n🎵 Nyní hraje: {song_name} [{current['format'].upper()}]")
+                    generation = _playback_generation
                     try:
-                        play_song(song_path)
+                        started = play_song(song_path)
                     except Exception as e:
                         print(f"❌ Chyba při spuštění přehrávání: {str(e)}")
                         should_play = False
                         continue
+                    # Nerozběhlo se a nikdo mezitím nepřepnul: rovnou zotavovat, nečekat na zaseknutí
+                    start_failed = not started and _playback_generation == generation + 1
 
-                # Čekej, dokud skladba neskončí (pauza = jen čekej, neposouvej frontu)
-                while True:
-                    if current_player is None:
-                        break
-                    if is_paused:
-                        time.sleep(0.2)
-                        continue
-                    if current_player.is_playing():
-                        time.sleep(0.2)
+                # Čekej, dokud skladba neskončí (pauza = jen čekej, neposouvej frontu);
+                # watchdog přitom rozliší konec skladby od chyby a zaseknutí
+                if start_failed:
+                    outcome, position_ms = "nostart", 0
+                else:
+                    outcome, position_ms = _watch_playback(_playback_generation, current)
+                if outcome == "changed":
+                    continue  # skladbu přepnulo jiné vlákno (next/previous)
+                if outcome == "stopped":
+                    # Zastavil ho někdo mimo přehrávač: schválné, chová se jako pauza (play pokračuje)
+                    is_paused = True
+                    print("⏹️ Přehrávání zastaveno zvenku, pokračuj příkazem play")
+                    continue
+                if outcome != "ended":
+                    if recovery_path != song_path:
+                        recovery_path, recovery_step = song_path, 0
+                        recovery_deadline = time.monotonic() + RECOVERY_TIMEOUT_SEC
+                    recovery_step += 1
+                    if _recover_playback(current, outcome, position_ms, recovery_step, recovery_deadline):
                         continue
-                    # nehraje a není pauza -> skladba dohrála
-                    break
+                    # zotavení nepomohlo -> přeskoč na další skladbu jako po dohrání
+                else:
+                    _record_request("done", _entry_key(current), current.get('pridal'))
 
                 if not is_paused:
                     update_queue()
                     next_song = get_current_song()
                     if next_song and next_song['cesta_k_souboru']:
+                        # další skladbu spustí další průchod smyčkou (i s hlídáním rozběhnutí)
                         print("\n🔜 Automaticky spouštím další skladbu.")
-                        # spuštění další skladby, ale jen když se opravdu nehraje nic
-                        already_playing = current_player is not None and current_player.is_playing()
-                        if not already_playing:
-                            play_song(next_song['cesta_k_souboru'])
                     else:
                         print("\n⏹️ Konec fronty - žádné další skladby k přehrání")
                         should_play = False
             else:
-                time.sleep(2)
+                _player_idle()
 
         except Exception as e:
             print(f"❌ Chyba v player_loop: {str(e)}")
             time.sleep(2)
 
+
+def _wake_player():
+    """Probudí smyčku přehrávače (nová skladba ve frontě, ovládání, událost VLC)."""
+    _player_wakeup.set()
+
+
+def _player_idle():
+    """Nic nehraje: spi, dokud se ve frontě nebo v ovládání něco nezmění."""
+    if _player_wakeup.wait(PLAYER_IDLE_CHECK_SEC):
+        Scheduler.record("přehrávač")
+    else:
+        Scheduler.record("přehrávač (pojistka)")
+
+
+def _on_player_event(event):
+    # Volá VLC ze svého vlákna: jen probudit čekající, žádná volání zpět do VLC
+    _play_started.set()
+    _player_wakeup.set()
+
+
+def _new_media_player():
+    """Přehrávač VLC, jehož události (rozběhnutí, konec, chyba, stop, pauza) budí čekající vlákna."""
+    player = player_instance.media_player_new()
+    events = player.event_manager()
+    for name in ("MediaPlayerPlaying", "MediaPlayerPaused", "MediaPlayerStopped",
+                 "MediaPlayerEndReached", "MediaPlayerEncounteredError"):
+        events.event_attach(getattr(vlc.EventType, name), _on_player_event)
+    return player
+
+
+def _watch_playback(generation, item):
+    """
+    Hlídá právě hrající skladbu, dokud se něco nestane. Vrací (výsledek, pozice_ms):
+    - "ended"     skladba opravdu dohrála,
+    - "changed"   jiné vlákno mezitím přepnulo skladbu,
+    - "stopped"   přehrávač zastavil někdo zvenku (stop bez změny generace = schválně),
+    - "error"     VLC hlásí chybu (nečitelný soubor, dekodér),
+    - "truncated" skladba "dohrála" výrazně dřív, než má (useknutý soubor),
+    - "stalled"   čas přehrávání se nehýbe déle než STALL_THRESHOLD_SEC.
+    """
+    last_ms = -1
+    last_check = last_progress = time.monotonic()
+    while True:
+        _player_wakeup.clear()
+        player = current_player
+        if player is None or _playback_generation != generation:
+            return "changed", max(0, last_ms)
+        if is_paused:
+            # Pauza: čas stojí schválně, na obnovení počkej bez kontrol (obnovení budí VLC událost)
+            _player_wakeup.wait(PLAYER_IDLE_CHECK_SEC)
+            Scheduler.record("watchdog")
+            last_check = last_progress = time.monotonic()
+            continue
+
+        state = player.get_state()
+        if _playback_generation != generation:
+            return "changed", max(0, last_ms)  # stop() mohlo přijít od přepnutí skladby
+        if state == vlc.State.Stopped:
+            return "stopped", max(0, last_ms)
+        if state == vlc.State.Error:
+            return "error", max(0, last_ms)
+        if state == vlc.State.Ended:
+            expected_ms = max((item.get('delka') or 0) * 1000, player.get_length() or 0)
+            if expected_ms and last_ms < expected_ms * 0.9 - 5000:
+                return "truncated", max(0, last_ms)
+            return "ended", max(0, last_ms)
+
+        now_ms = player.get_time()
+        now = time.monotonic()
+        if now_ms != last_ms and now_ms >= 0:
+            # Čas se posunul: odhadni, kdy se naposledy hýbal (kontroluje se jen jednou za
+            # STALL_THRESHOLD_SEC, zaseknutí mezi kontrolami by se jinak poznalo až o kolo později)
+            if last_ms >= 0 and now_ms > last_ms:
+                last_progress = min(now, last_check + (now_ms - last_ms) / 1000)
+            else:
+                last_progress = now
+            last_ms = now_ms
+        elif time.monotonic() - last_progress > STALL_THRESHOLD_SEC:
+            if _playback_generation != generation:
+                return "changed", max(0, last_ms)
+            return "stalled", max(0, last_ms)
+        last_check = now
+        # Spi do termínu, kdy by šlo o zaseknutí; konec, chybu a přepnutí ohlásí událost dřív
+        _player_wakeup.wait(max(WATCHDOG_MIN_WAIT_SEC, last_progress + STALL_THRESHOLD_SEC - time.monotonic()))
+        Scheduler.record("watchdog")
+
+
+def _redownload_entry(item):
+    """Stáhne poškozený soubor položky znovu z uloženého odkazu a vymění ho. Vrací novou cestu."""
+    url, old_path = item.get('odkaz'), item.get('cesta_k_souboru')
+    if not url or not old_path:
+        return None
+    # Watchdog i startovní kontrola můžou opravovat tentýž soubor – stahuje se jen jednou
+    return _single_flight(f"repair:{old_path}", lambda: _redownload_file(url, old_path))
+
+
+def _redownload_file(url, old_path):
+    """
+    Stáhne skladbu znovu pod dočasným názvem a až po úspěchu ji vymění za starý soubor.
+    Když stažení selže, položka dál ukazuje na původní soubor (a hrající VLC o něj nepřijde).
+    """
+    stem = Path(old_path).stem
+    try:
+        temp_path, filetype = download_audio(url, f"{stem}.oprava")
+    except Exception as e:
+        print(f"❌ Nepodařilo se znovu stáhnout {Path(old_path).name}: {str(e)}")
+        return None
+    if not temp_path:
+        return None
+
+    record = library_info(temp_path) or {}
+    target = os.path.join(os.path.dirname(old_path), f"{stem}.{filetype}")
+    try:
+        # Na Linuxu hrající VLC dohraje z původního souboru (drží si otevřený starý inode)
+        os.replace(temp_path, target)
+    except OSError:
+        target = temp_path  # cíl je zamčený (Windows, právě hraje): oprava zůstane pod dočasným názvem
+    if target != temp_path:
+        library_remove(temp_path)
+        library_add(target, record.get("klice", []), title=record.get("titul"),
+                    artist=record.get("interpret"), duration=record.get("delka"))
+    if target != old_path:
+        _replace_entry_file(old_path, target, filetype)
+        library_remove(old_path)
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+    return target
+
+
+def _check_audio_file(path):
+    """Ověří soubor skladby. Vrací důvod, proč je rozbitý, nebo None, když je v pořádku."""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return "chybí"
+    if size < MIN_AUDIO_BYTES:
+        return f"podezřele malý ({size} B)"
+    if os.path.exists(path + ".part"):
+        return "nedokončené stahování"
+    try:
+        audio = mutagen.File(path)
+    except Exception:
+        return "nečitelný kontejner"
+    if audio is None:
+        # mutagen nezná WebM (typický výstup bestaudio); stačí platná EBML hlavička
+        try:
+            with open(path, 'rb') as f:
+                if f.read(4) == b"\x1a\x45\xdf\xa3":
+                    return None
+        except OSError:
+            return "nečitelný soubor"
+        return "neznámý formát"
+    if not getattr(getattr(audio, 'info', None), 'length', 0):
+        return "nulová délka"
+    return None
+
+
+def verify_queue_files():
+    """
+    Startovní kontrola: souběžně ověří soubory aktuální a čekajících skladeb a rozbité
+    položky postupně (v pořadí fronty) stáhne znovu z jejich odkazu.
+    Běží na pozadí – přehrávání mezitím normálně startuje.
+    """
+    with _queue_lock:
+        store = _get_queue_store()
+        queue = [item for item in [store.get(0)] + store.upcoming(len(store)) if item]
+    paths = list(dict.fromkeys(item['cesta_k_souboru'] for item in queue if item.get('cesta_k_souboru')))
+    if not paths:
+        return
+
+    with ThreadPoolExecutor(max_workers=QUEUE_CHECK_WORKERS) as executor:
+        problems = dict(zip(paths, executor.map(_check_audio_file, paths)))
+
+    broken = {path: reason for path, reason in problems.items() if reason}
+    print(f"🩺 Kontrola fronty: {len(paths)} souborů, rozbitých {len(broken)}")
+    repaired = set()
+    for item in queue:
+        path = item.get('cesta_k_souboru')
+        if path not in broken or path in repaired:
+            continue
+        repaired.add(path)
+        name = Path(path).stem
+        if not item.get('odkaz'):
+            print(f"⚠️ {name}: {broken[path]}, bez odkazu nejde opravit")
+            continue
+        print(f"🔧 Opravuji {name} ({broken[path]})")
+        if _redownload_entry(item):
+            print(f"✅ Opraveno: {name}")
+
+
+def _replace_entry_file(old_path, new_path, filetype):
+    """Přepíše cestu k souboru u všech položek fronty, které ukazují na old_path."""
+    with _queue_lock:
+        store = _get_queue_store()
+        for uid in store.uids_with_path(old_path):
+            store.update(uid, cesta_k_souboru=new_path, format=filetype)
+
+
+def _recover_playback(item, outcome, position_ms, step, deadline):
+    """
+    Zotavení podle STALL_RECOVERY_POLICY (step = kolikátý pokus pro tutéž skladbu).
+    Po termínu deadline (time.monotonic) se už jen přeskakuje.
+    Vrací True, pokud skladba zase hraje; False = pokračuj další skladbou.
+    """
+    global _playback_generation
+    song_path = item['cesta_k_souboru']
+    reasons = {"error": "chyba přehrávání", "stalled": "přehrávání se zaseklo",
+               "truncated": "soubor je useknutý", "nostart": "přehrávání se nerozběhlo"}
+    # Useknutý soubor znovu nepřehraje, nerozběhnuté přehrávání už zkoušel play_song
+    policy = [a for a in STALL_RECOVERY_POLICY
+              if not (outcome in ("truncated", "nostart") and a == "retry")] or ["skip"]
+    action = policy[min(step, len(policy)) - 1]
+    if time.monotonic() >= deadline:
+        action = "skip"
+    print(f"⚠️ {reasons.get(outcome, outcome)}: {Path(song_path).stem} "
+          f"(na {position_ms / 1000:.0f} s) -> {action}")
+
+    if action == "retry":
+        return play_song(song_path, start_ms=position_ms, deadline=deadline)
+    if action == "redownload":
+        # Na stažení se čeká jen do termínu; když nestihne, dostahuje se na pozadí a přeskočí se
+        result = {}
+        worker = threading.Thread(target=lambda: result.update(path=_redownload_entry(item)), daemon=True)
+        worker.start()
+        worker.join(max(0.0, deadline - time.monotonic()))
+        if result.get('path'):
+            return play_song(result['path'], start_ms=position_ms, deadline=deadline)
+    elif outcome != "stalled" and item.get('odkaz'):
+        # Přeskakujeme hned, aby nehrálo ticho; rozbitý soubor se opraví na pozadí
+        threading.Thread(target=_redownload_entry, args=(dict(item),), daemon=True).start()
+    # Zaseklý přehrávač se tváří, že hraje – zastav ho, ať se další skladba opravdu spustí
+    # (se změnou generace, aby to watchdog nebral jako zastavení zvenku)
+    _playback_generation += 1
+    if current_player:
+        current_player.stop()
+    return False
+
+
 def set_volume(value: int) -> bool:
     """
     Nastaví hlasitost (0–100) přes VLC.
@@ -560,7 +2067,7 @@ def set_volume(value: int) -> bool:
                 # vytvoř základ bez spouštění přehrávání
                 import vlc as _vlc
                 globals()['player_instance'] = _vlc.Instance()
-                globals()['current_player'] = player_instance.media_player_new()
+                globals()['current_player'] = _new_media_player()
         if current_player is not None:
             current_player.audio_set_volume(v)
             print(f"🔊 Volume set to {v}")
@@ -571,69 +2078,222 @@ def set_volume(value: int) -> bool:
 
 
 def _read_queue():
-    """Interní: načte queue.json jako list (nevyhazuje výjimky)."""
-    if not os.path.exists(QUEUE_FILE) or os.path.getsize(QUEUE_FILE) == 0:
-        return []
-    try:
-        with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return []
+    """Interní: celá fronta jako list položek (kopie, nevyhazuje výjimky)."""
+    return _get_queue_store().snapshot()
+
+
+def get_lan_tracks(upcoming_only=False):
+    """Cesty souborů ve frontě pro LAN server (aktuální + další, bez upcoming_only i historie)."""
+    items = [i for i in _read_queue() if i.get('cesta_k_souboru')]
+    if upcoming_only:
+        items = sorted((i for i in items if i.get('id', -1) >= 0), key=lambda i: i['id'])
+    return [i['cesta_k_souboru'] for i in items]
 
 
+def get_now_playing():
+    """
+    Stav přehrávání pro klienty v síti: soubor, pozice v ms a čas měření,
+    aby si klient odečetl zpoždění dotazu a naskočil ve stejném místě.
+    """
+    current = get_current_song()
+    player = current_player
+    position_ms = player.get_time() if player else -1
+    return {
+        "soubor": current['cesta_k_souboru'] if current else None,
+        "titul": _display_name(current) if current else None,
+        "delka": current.get('delka') if current else None,
+        "pozice_ms": max(0, position_ms),
+        "hraje": bool(current) and not is_paused and position_ms >= 0,
+        "cas": time.time(),
+    }
 
 
-def get_queue_overview(limit: int = 10) -> str:
+def get_queue_overview(limit: int = 10, user_id=None) -> str:
     """
     Vrátí hezky formátovaný text fronty pro chat:
     - řádek s '▶️ Now playing'
     - pár následujících skladeb
     - poslední 1 v historii (pokud existuje)
+    - průběh rozpracovaných stahování
+    - volnou kapacitu fronty (a limit uživatele, pokud je user_id zadané)
     """
-    from pathlib import Path as _Path
-    q = _read_queue()
-    if not q:
+    store = _get_queue_store()
+    downloads = get_download_progress()
+    if len(store) == 0 and not downloads:
         return "📭 Fronta je prázdná."
 
-    # Najdi current (id == 0), next (>0 seřadit), previous (id == -1)
-    current = next((i for i in q if i.get('id') == 0), None)
-    nexts = sorted([i for i in q if i.get('id', 999) > 0], key=lambda x: x['id'])
-    prev = next((i for i in q if i.get('id') == -1), None)
+    # Jen položky, které se vypisují (current, pár dalších, previous), ne celá fronta
+    current = store.get(0)
+    nexts = store.upcoming(max(0, limit - 2))  # nech trochu místa
+    prev = store.get(-1)
 
     lines = []
     if prev:
-        lines.append(f"⏮️ Předtím: {_Path(prev.get('cesta_k_souboru','')).stem}")
+        lines.append(f"⏮️ Předtím: {_display_name(prev)}")
 
     if current:
-        lines.append(f"▶️ Teď hraje: {_Path(current.get('cesta_k_souboru','')).stem}")
+        lines.append(f"▶️ Teď hraje: {_display_name(current)}")
     else:
         lines.append("▶️ Teď nehraje nic.")
 
     if nexts:
         lines.append("🔜 Další:")
-        for i, item in enumerate(nexts[:max(0, limit - 2)]):  # nech trochu místa
-            lines.append(f"  {i+1}. {_Path(item.get('cesta_k_souboru','')).stem}")
+        now, wait = time.time(), _current_remaining_sec()
+        for item in nexts:
+            lines.append(f"  {item['id']}. {_display_name(item)} ({_format_eta(now, wait)})")
+            wait += item.get('delka') or DEFAULT_TRACK_SECONDS
     else:
         lines.append("🔜 Další: (nic ve frontě)")
 
+    if downloads:
+        lines.append("⬇️ Stahuje se:")
+        for state in downloads:
+            lines.append(f"  • {_format_download_progress(state)}")
+
+    h = get_admission_headroom(user_id)
+    capacity = (f"📊 Kapacita: stahování {h['stahovani']}/{h['stahovani_limit']}, "
+                f"fronta {h['minuty']}/{h['minuty_limit']} min")
+    if "uzivatel" in h:
+        capacity += f", tvoje skladby {h['uzivatel']}/{h['uzivatel_limit']}"
+    lines.append(capacity)
+
     return "\n".join(lines)
 
 
+def _current_remaining_sec():
+    """Kolik sekund ještě zbývá aktuální skladbě (délka z fronty, jinak od VLC)."""
+    current = get_current_song()
+    if not current:
+        return 0.0
+    player = current_player
+    length_sec = current.get('delka') or 0
+    position_sec = 0.0
+    if player is not None:
+        if not length_sec and (player.get_length() or 0) > 0:
+            length_sec = player.get_length() / 1000
+        if (player.get_time() or 0) > 0:
+            position_sec = player.get_time() / 1000
+    return max(0.0, (length_sec or DEFAULT_TRACK_SECONDS) - position_sec)
+
+
+def _format_eta(now, wait_sec) -> str:
+    """'~21:34, za 12 min' – kdy skladba začne hrát."""
+    clock = time.strftime("%H:%M", time.localtime(now + wait_sec))
+    return f"~{clock}, za {int(wait_sec // 60)} min" if wait_sec >= 60 else f"~{clock}, za chvíli"
+
+
+def when_is_my_song(user_id=None) -> str:
+    """Kdy začne hrát nejbližší čekající skladba uživatele (součty délek z indexu fronty)."""
+    store = _get_queue_store()
+    positions = store.upcoming_of_user(str(user_id) if user_id is not None else None)
+    if not positions:
+        return "📭 Ve frontě nečeká žádná tvoje skladba."
+    position = positions[0]
+    item = store.get(position)
+    if item is None:
+        return "📭 Ve frontě nečeká žádná tvoje skladba."
+    wait = _current_remaining_sec() + store.seconds_until(position)
+    text = f"⏰ {_display_name(item)} je {position}. na řadě ({_format_eta(time.time(), wait)})"
+    if len(positions) > 1:
+        text += f", další tvoje skladby na pozicích {', '.join(str(p) for p in positions[1:])}"
+    return text + "."
+
+
+def _display_name(item) -> str:
+    """Název položky fronty: 'Interpret - Titul' z knihovny, jinak jméno souboru."""
+    path = item.get('cesta_k_souboru') or ''
+    record = library_info(path)
+    if record and record.get("titul"):
+        if record.get("interpret") and record["interpret"] not in record["titul"]:
+            return f"{record['interpret']} - {record['titul']}"
+        return record["titul"]
+    return Path(path).stem
+
+
+def _format_download_progress(state) -> str:
+    """Jeden řádek průběhu stahování, např. 'Song — 45 % (3.2/7.1 MB), zbývá ~12 s'."""
+    done_mb = state["stazeno"] / (1024 * 1024)
+    text = f"{state['nazev']} — "
+    if state["celkem"]:
+        percent = min(100, int(state["stazeno"] * 100 / state["celkem"]))
+        text += f"{percent} % ({done_mb:.1f}/{state['celkem'] / (1024 * 1024):.1f} MB)"
+    else:
+        text += f"{done_mb:.1f} MB"
+    if state["stav"] != "stahuje":
+        text += f", {state['stav']}"
+    elif state["eta"] is not None:
+        text += f", zbývá ~{int(state['eta'])} s"
+    if state["pokus"] > 1:
+        text += f" [pokus {state['pokus']}/{DOWNLOAD_RETRIES}]"
+    return text
+
+
 
 
 if __name__ == "__main__":
-    ig_thread = threading.Thread(target=InstagramBot.run, daemon=True)
-    ig_thread.start()
+    parser = argparse.ArgumentParser(description="UniversalMusicPlayer")
+    parser.add_argument("--node", action="store_true",
+                        help="přehrávací uzel: fronta + VLC + HTTP API; IG bot a stahování běží zvlášť")
+    parser.add_argument("--host", default="127.0.0.1", help="adresa HTTP API uzlu (0.0.0.0 = celá síť, jen s NODE_TOKEN)")
+    parser.add_argument("--port", type=int, default=PlaybackNode.DEFAULT_PORT)
+    parser.add_argument("--worker", metavar="URL", help="stahovací worker připojený k uzlu na URL")
+    parser.add_argument("--lan", action="store_true",
+                        help="sdílet skladby z fronty po síti (HTTP s Range, viz LanAudio.py)")
+    parser.add_argument("--lan-port", type=int, default=LanAudio.DEFAULT_PORT)
+    parser.add_argument("--upload", action="store_true",
+                        help="worker pošle hotové soubory uzlu (když nesdílí složku se skladbami)")
+    args = parser.parse_args()
+    if args.node and not PlaybackNode.TOKEN and not PlaybackNode.is_loopback(args.host):
+        parser.error(f"--host {args.host} zpřístupní uzel celé síti; nastav NODE_TOKEN, jinak použij 127.0.0.1")
+
+    if args.worker:
+        # Worker jen stahuje; frontu, knihovnu i duplicity řeší uzel
+        LIBRARY_FILE = None
+        FINGERPRINT_ENABLED = False
+        DUPLICATE_POLICY = "allow"
+        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+        _get_ytdlp_pool().start()
+        PlaybackNode.run_worker(args.worker, _worker_resolve, upload=args.upload)
+        sys.exit(0)
+
+    # IG bot si importuje tento soubor jako samostatný modul; přesměrujeme ho na běžící
+    # __main__, aby sdílel stejný přehrávač a stav stahování jako konzole.
+    InstagramBot.ump = sys.modules[__name__]
     os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-    # Initialize empty queue file if it doesn't exist
-    if not os.path.exists(QUEUE_FILE):
-        with open(QUEUE_FILE, 'w', encoding='utf-8') as f:
-            json.dump([], f)
+    # Knihovna je použitelná hned po načtení indexu, průchod složkou doběhne na pozadí
+    load_library()
+
+    def _library_startup():
+        rescan_library()
+        fingerprint_library()
+
+    threading.Thread(target=_library_startup, daemon=True).start()
+    threading.Thread(target=verify_queue_files, daemon=True).start()
+    # Start nech doběhnout (kontrola fronty, knihovna), pak předem stahuj v intervalu
+    Scheduler.every("předem stahování", CACHE_WARM_INTERVAL_SEC, _cache_warm_tick, first_delay=60)
+    # Pracovní procesy yt-dlp se rozjedou hned, první odkaz pak nečeká na jejich start
+    threading.Thread(target=lambda: _get_ytdlp_pool().start(), daemon=True).start()
+
+    if args.node:
+        _job_board = PlaybackNode.JobBoard()
+        PlaybackNode.serve(sys.modules[__name__], _job_board, DOWNLOAD_DIR, QueueRejected, args.host, args.port)
+        print(f"🛰️ Přehrávací uzel naslouchá na http://{args.host}:{args.port} "
+              f"(IG bot: python InstagramBot.py --node URL, worker: --worker URL)")
+    else:
+        ig_thread = threading.Thread(target=InstagramBot.run, daemon=True)
+        ig_thread.start()
+
+    if args.lan:
+        LanAudio.serve(DOWNLOAD_DIR, get_lan_tracks, get_now_playing, port=args.lan_port)
+        print(f"📡 Skladby z fronty jsou v síti na portu {args.lan_port} (/now, /queue, /audio/...)")
+
+    # Načti frontu (starý queue.json se převede, žurnál se přehraje)
+    _get_queue_store()
 
     import threading
 
     player_thread = threading.Thread(target=player_loop, daemon=True)
     player_thread.start()
 
-    add_song_process()
\ No newline at end of file
+    add_song_process()
@@ -0,0 +1,402 @@
+# YtdlpWorkers.py
+# -*- coding: utf-8 -*-
+"""
+yt-dlp v oddělených pracovních procesech.
+
+Extrakce a postprocessing v yt-dlp jsou čistý Python náročný na CPU; ve stejném procesu
+by soupeřily o GIL s přehrávačem a IG botem a zaseknutý extraktor by navždy blokoval
+vlákno. Proto běží v malém poolu procesů:
+- každá úloha má tvrdý časový limit; když ho překročí, proces se zabije a nahradí novým,
+- výsledek se vrací rourou (multiprocessing.Pipe) jako malý slovník vybraných polí
+  metadat, ne celé info z yt-dlp,
+- průběh stahování se posílá zpět průběžně (nejvýš jednou za PROGRESS_INTERVAL_SEC).
+
+Volající vlákno si na dobu úlohy půjčí jeden volný proces a čeká na jeho odpověď
+(conn.poll uvolňuje GIL), takže pool nepotřebuje žádné vlastní řídicí vlákno.
+
+Každý proces drží dlouhožijící instance YoutubeDL (profil "info" jen pro metadata
+a "download" pro stahování). Mezi úlohami tak zůstávají otevřená HTTP spojení (bez
+nového TLS handshake) i mezipaměti extraktorů, např. stažený a rozparsovaný player JS
+YouTube. Volby konkrétní úlohy (šablona názvu, extract_flat, ...) se nastaví jen na
+dobu úlohy. Přínos jde změřit: python YtdlpWorkers.py bench URL [URL ...]
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import queue
+import statistics
+import sys
+import threading
+import time
+
+import yt_dlp
+
+# Pole metadat, která se vrací volajícímu (u vyhledávání i pro každou položku entries)
+INFO_FIELDS = ("id", "title", "track", "artist", "uploader", "channel", "duration", "ext",
+               "webpage_url", "url")
+PROGRESS_FIELDS = ("status", "downloaded_bytes", "total_bytes", "total_bytes_estimate", "eta")
+PROGRESS_INTERVAL_SEC = 0.5
+
+# Dlouhožijící instance YoutubeDL (False = nová instance na každou úlohu jako dřív)
+PERSISTENT_INSTANCES = True
+INSTANCE_MAX_JOBS = 200  # po tolika úlohách se instance zahodí (paměť, zastaralé cookies)
+# Společné volby profilů; volby z úlohy se přes ně nastaví jen dočasně
+PROFILES = {
+    "info": {'quiet': True, 'no_warnings': True},
+    "download": {'quiet': True, 'no_warnings': True, 'noprogress': True,
+                 # DASH/HLS audio se stahuje po fragmentech, ty jdou stahovat souběžně
+                 'concurrent_fragment_downloads': 4},
+}
+
+_local = threading.local()  # instance jsou per vlákno (v pracovním procesu je vlákno jedno)
+_MISSING = object()
+
+
+class ExtractionError(Exception):
+    """Úloha yt-dlp selhala; transient říká, jestli má smysl ji zkusit znovu."""
+
+    def __init__(self, message, transient=True):
+        super().__init__(message)
+        self.transient = transient
+
+
+class ExtractionTimeout(ExtractionError):
+    """Úloha nedoběhla v časovém limitu a pracovní proces byl zabit."""
+
+    def __init__(self, message):
+        super().__init__(message, transient=True)
+
+
+def _subset(info):
+    if not info:
+        return None
+    result = {field: info[field] for field in INFO_FIELDS if info.get(field) is not None}
+    if info.get('entries') is not None:
+        result['entries'] = [_subset(entry) for entry in info['entries'] if entry]
+    return result
+
+
+def _is_transient(error) -> bool:
+    """
+    Rozliší výpadek sítě (má smysl zkusit znovu) od trvalé chyby
+    typu nepodporovaný odkaz nebo smazané video.
+    """
+    if not isinstance(error, (yt_dlp.utils.DownloadError, OSError)):
+        return False
+    cause = error
+    if isinstance(error, yt_dlp.utils.DownloadError) and error.exc_info:
+        cause = error.exc_info[1]
+    if isinstance(cause, yt_dlp.utils.UnsupportedError):
+        return False
+    if isinstance(cause, yt_dlp.utils.ExtractorError) and cause.expected:
+        return False
+    return True
+
+
+def _forward_progress(d):
+    callback = getattr(_local, "on_progress", None)
+    if callback is not None:
+        callback(d)
+
+
+def _instance(profile):
+    """Vrátí (a případně vytvoří) dlouhožijící instanci YoutubeDL pro profil."""
+    instances = getattr(_local, "instances", None)
+    if instances is None:
+        instances = _local.instances = {}
+    entry = instances.get(profile)
+    if entry is None or entry[1] >= INSTANCE_MAX_JOBS:
+        if entry is not None:
+            entry[0].close()
+        ydl = yt_dlp.YoutubeDL(dict(PROFILES[profile]))
+        ydl.add_progress_hook(_forward_progress)
+        entry = instances[profile] = [ydl, 0]
+    entry[1] += 1
+    return entry[0]
+
+
+def _drop_instance(profile):
+    entry = getattr(_local, "instances", {}).pop(profile, None)
+    if entry is not None:
+        try:
+            entry[0].close()
+        except Exception:
+            pass
+
+
+def _run_persistent(kind, url, opts, on_progress):
+    profile = "download" if kind == "download" else "info"
+    ydl = _instance(profile)
+    saved = {}
+    for name, value in opts.items():
+        if name == 'outtmpl':
+            saved[name] = dict(ydl.params['outtmpl'])
+            ydl.params['outtmpl']['default'] = value
+        else:
+            saved[name] = ydl.params.get(name, _MISSING)
+            ydl.params[name] = value
+    _local.on_progress = on_progress
+    try:
+        info = ydl.extract_info(url, download=(kind == "download"))
+        result = _subset(info)
+        if kind == "download" and info:
+            result['filepath'] = ydl.prepare_filename(info)
+        return result
+    except Exception:
+        _drop_instance(profile)  # po chybě nevěř stavu instance
+        raise
+    finally:
+        _local.on_progress = None
+        for name, value in saved.items():
+            if value is _MISSING:
+                ydl.params.pop(name, None)
+            else:
+                ydl.params[name] = value
+
+
+def _run_fresh(kind, url, opts, on_progress):
+    opts = {**PROFILES["download" if kind == "download" else "info"], **opts}
+    if on_progress is not None:
+        opts['progress_hooks'] = [on_progress]
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(url, download=(kind == "download"))
+        result = _subset(info)
+        if kind == "download" and info:
+            result['filepath'] = ydl.prepare_filename(info)
+    return result
+
+
+def run_job(kind, url, opts, on_progress=None, persistent=None):
+    """
+    Vykoná jednu úlohu v aktuálním procesu. kind = "info" (jen metadata) nebo
+    "download" (stáhne a do výsledku doplní 'filepath'). Vrací podmnožinu metadat.
+    """
+    if persistent is None:
+        persistent = PERSISTENT_INSTANCES
+    try:
+        return (_run_persistent if persistent else _run_fresh)(kind, url, opts, on_progress)
+    except Exception as e:
+        raise ExtractionError(str(e), _is_transient(e)) from e
+
+
+def _worker_main(conn):
+    """Smyčka pracovního procesu: (id, druh, url, volby) -> ("done"|"error"|"progress", id, ...)."""
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        job_id, kind, url, opts = job
+        last_sent = 0.0
+
+        def progress(d):
+            nonlocal last_sent
+            now = time.monotonic()
+            if d.get('status') == 'downloading' and now - last_sent < PROGRESS_INTERVAL_SEC:
+                return
+            last_sent = now
+            conn.send(("progress", job_id, {field: d.get(field) for field in PROGRESS_FIELDS}))
+
+        try:
+            conn.send(("done", job_id, run_job(kind, url, opts, progress)))
+        except ExtractionError as e:
+            conn.send(("error", job_id, str(e), e.transient))
+        except Exception as e:
+            conn.send(("error", job_id, str(e), False))
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), name="ytdlp-worker", daemon=True)
+        _start_without_main(self.process)
+        child_conn.close()
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(5)
+        except Exception:
+            pass
+        self.conn.close()
+
+
+_start_lock = threading.Lock()
+
+
+def _start_without_main(process):
+    """
+    Spustí pracovní proces bez hlavního modulu: multiprocessing by jinak v každém procesu
+    znovu načetl __main__ (u přehrávače i IG bota se sqlite a klientem Instagramu),
+    pracovní proces ale potřebuje jen tento modul a yt-dlp.
+    """
+    main = sys.modules.get("__main__")
+    if __name__ == "__main__" or main is None or not hasattr(main, "__file__"):
+        process.start()  # python YtdlpWorkers.py bench: hlavní modul je tento soubor
+        return
+    with _start_lock:
+        path, spec = main.__file__, getattr(main, "__spec__", None)
+        del main.__file__
+        main.__spec__ = None
+        try:
+            process.start()
+        finally:
+            main.__file__, main.__spec__ = path, spec
+
+
+def _context():
+    # forkserver: pracovní procesy se forkují z čistého serveru, který načte jen tento modul
+    # a yt-dlp, ne z hlavního procesu s vlákny VLC a IG bota. Windows umí jen spawn.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload([__name__, "yt_dlp"])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+class WorkerPool:
+    """
+    Pool pracovních procesů pro yt-dlp. Procesy vznikají líně (nebo přes start()),
+    size = 0 znamená běh přímo ve volajícím vlákně bez izolace a bez limitu.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._ctx = _context() if size > 0 else None
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._alive = 0
+        self._job_ids = itertools.count(1)
+
+    def start(self):
+        """Předem nastartuje všechny procesy, aby první úloha nečekala na jejich rozjezd."""
+        while True:
+            with self._lock:
+                if self._alive >= self.size:
+                    return
+                self._alive += 1
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        try:
+            return _Worker(self._ctx)
+        except Exception:
+            with self._lock:
+                self._alive -= 1
+            raise
+
+    def _acquire(self, timeout):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            spawn = self._alive < self.size
+            if spawn:
+                self._alive += 1
+        if spawn:
+            return self._spawn()
+        try:
+            # Čekání na volný proces se počítá do limitu úlohy (všechny procesy můžou viset)
+            return self._idle.get(timeout=max(0.0, timeout))
+        except queue.Empty:
+            raise ExtractionError("všechny pracovní procesy yt-dlp jsou obsazené", transient=True)
+
+    def _replace(self, worker):
+        worker.kill()
+        try:
+            self._idle.put(_Worker(self._ctx))
+        except Exception:
+            with self._lock:
+                self._alive -= 1
+
+    def run(self, kind, url, opts, timeout, on_progress=None):
+        """Spustí úlohu (viz run_job) a počká na výsledek nejvýš timeout sekund."""
+        if self.size <= 0:
+            return run_job(kind, url, opts, on_progress)
+
+        deadline = time.monotonic() + timeout
+        worker = self._acquire(timeout)
+        job_id = next(self._job_ids)
+        try:
+            worker.conn.send((job_id, kind, url, opts))
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not worker.conn.poll(remaining):
+                    self._replace(worker)
+                    worker = None
+                    raise ExtractionTimeout(f"yt-dlp nedoběhl do {timeout:.0f} s")
+                message = worker.conn.recv()
+                if message[1] != job_id:
+                    continue
+                if message[0] == "progress":
+                    if on_progress is not None:
+                        try:
+                            on_progress(message[2])
+                        except Exception:
+                            pass
+                    continue
+                if message[0] == "done":
+                    return message[2]
+                raise ExtractionError(message[2], message[3])
+        except (EOFError, OSError) as e:
+            if worker is not None:
+                self._replace(worker)
+                worker = None
+            raise ExtractionError(f"pracovní proces yt-dlp spadl: {e}", transient=True)
+        finally:
+            if worker is not None:
+                self._idle.put(worker)
+
+    def shutdown(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            worker.kill()
+
+
+# -----------------------------
+# Měření: nová instance na úlohu vs. dlouhožijící instance
+# -----------------------------
+def bench(urls, repeat: int = 3, kind: str = "info"):
+    """Změří latenci úloh v obou režimech. Vrací {režim: [sekundy]}."""
+    timings = {}
+    for label, persistent in (("nová instance", False), ("dlouhožijící", True)):
+        _local.instances = {}
+        samples = []
+        for _ in range(repeat):
+            for url in urls:
+                start = time.perf_counter()
+                try:
+                    run_job(kind, url, {'quiet': True}, persistent=persistent)
+                except ExtractionError as e:
+                    print(f"⚠️ {url}: {e}")
+                    continue
+                samples.append(time.perf_counter() - start)
+        timings[label] = samples
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latence yt-dlp: nová instance na úlohu vs. dlouhožijící")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_bench = sub.add_parser("bench", help="změřit latenci zjištění metadat")
+    p_bench.add_argument("urls", nargs="+")
+    p_bench.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    timings = bench(args.urls, args.repeat)
+    for label, samples in timings.items():
+        if samples:
+            # první dotaz instance platí rozjezd (spojení, player JS), proto i medián
+            print(f"{label:>14}: {len(samples)} dotazů, průměr {statistics.mean(samples) * 1000:.0f} ms, "
+                  f"medián {statistics.median(samples) * 1000:.0f} ms, první {samples[0] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()